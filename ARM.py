@@ -12,29 +12,34 @@ import os
 import struct
 import math
 
-import bpy
-from bpy.props import BoolProperty, EnumProperty, FloatProperty, StringProperty
-from bpy_extras.io_utils import ExportHelper, ImportHelper
+try:
+    import bpy
+    from bpy.props import BoolProperty, EnumProperty, FloatProperty, StringProperty
+    from bpy_extras.io_utils import ExportHelper, ImportHelper
+except ImportError:
+    # parsing doesn't need Blender
+    bpy = None
 
 from enum import Enum
-from . import VertexSection, FaceSection, Kildean
+from . import VS, VertexSection, FaceSection, Kildean
 
 
-class Import(bpy.types.Operator, ImportHelper):
-    """Load a ARM file"""
+if bpy is not None:
+    class Import(bpy.types.Operator, ImportHelper):
+        """Load a ARM file"""
 
-    bl_idname = "import_mesh.arm"
-    bl_label = "Import ARM"
-    filename_ext = ".ARM"
+        bl_idname = "import_mesh.arm"
+        bl_label = "Import ARM"
+        filename_ext = ".ARM"
 
-    filepath: bpy.props.StringProperty(default="", subtype="FILE_PATH")
-    filter_glob: bpy.props.StringProperty(default="*.ARM", options={"HIDDEN"})
+        filepath: bpy.props.StringProperty(default="", subtype="FILE_PATH")
+        filter_glob: bpy.props.StringProperty(default="*.ARM", options={"HIDDEN"})
 
-    def execute(self, context):
-        keywords = self.as_keywords(ignore=("axis_forward","axis_up","filter_glob",))
-        BlenderImport(self, context, **keywords)
+        def execute(self, context):
+            keywords = self.as_keywords(ignore=("axis_forward","axis_up","filter_glob",))
+            BlenderImport(self, context, **keywords)
 
-        return {"FINISHED"}
+            return {"FINISHED"}
 
 
 def BlenderImport(operator, context, filepath):
@@ -46,6 +51,18 @@ def BlenderImport(operator, context, filepath):
     arm.buildGeometry()
 
 
+def probe(filepath):
+    # rooms table only, geometry is not decoded
+    infos = {"format": "ARM", "name": VS.displayName(filepath), "filesize": os.stat(filepath).st_size}
+    file = open(filepath, "rb")
+    infos["numRooms"] = struct.unpack("I", file.read(4))[0]
+    infos["rooms"] = []
+    for i in range (0, infos["numRooms"]):
+        u1, length, zoneId, roomId = struct.unpack("2I2H", file.read(12))
+        infos["rooms"].append({"zoneId": zoneId, "roomId": roomId, "length": length})
+    file.close()
+    return infos
+
 class ARM:
     def __init__(self):
         self.numRooms = 0
@@ -57,7 +74,7 @@ class ARM:
         self.filesize = os.stat(filepath).st_size
         # Open a ARM file and parse it
         file = open(filepath, "rb")
-        self.name = bpy.path.display_name(filepath)
+        self.name = VS.displayName(filepath)
         self.parse(file)
         file.close()
     def parse(self, file):
@@ -0,0 +1,325 @@
+bl_info = {
+    "name": "Vagrant Story file formats Add-on",
+    "description": "Import-Export Vagrant Story file formats (WEP, SHP, SEQ, ZUD, MPD, ZND, P, FBT, FBC).",
+    "author": "Sigfrid Korobetski (LunaticChimera)",
+    "version": (2, 12),
+    "blender": (3, 2, 0),
+    "location": "File > Import-Export",
+    "category": "Import-Export",
+}
+
+# parallel conversion of a whole extracted Vagrant Story directory, no Blender needed
+# each file is parsed in a worker process and written as an .npz next to a manifest.json
+# failed files are retried, a failing file never stops the others, unchanged files are skipped on the next run
+#
+# usage, from the directory containing the add-on folder :
+#   python -m vagrant_story.Batch VS/ converted/ --jobs 8 --retries 2  (vagrant_story being the add-on folder)
+#   python -m vagrant_story.Batch VS/ gltf/ --to glb  (WEP, SHP + SEQ, MPD and ARM as glTF, see GLTF)
+#   python -m vagrant_story.Batch VS/ converted/ --to arrays  (assets Blender imports without game files, see Intermediate)
+# or in a script :
+#   manifest = Batch.convertDirectory("VS/", "converted/")
+
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from . import VS, WEP, SHP, SEQ, ZUD, MPD, ZND, ARM, EFFECT, Cache, GLTF, Intermediate
+
+
+MANIFEST_NAME = "manifest.json"
+FORMATS = {
+    ".WEP": "WEP",
+    ".SHP": "SHP",
+    ".SEQ": "SEQ",
+    ".ZUD": "ZUD",
+    ".MPD": "MPD",
+    ".ZND": "ZND",
+    ".ARM": "ARM",
+    ".P": "P",
+}
+# output file suffix of each target
+OUTPUTS = {
+    "npz": ".npz",
+    "glb": ".glb",
+    "arrays": ".arrays.npz",
+}
+# a chunk gathers small files until it weights this many bytes, bigger files are alone in their chunk
+CHUNK_SIZE = 256 * 1024
+
+
+def parse(filepath, format):
+    # modules are looked up here, so workers only need this function
+    if format == "WEP":
+        obj = WEP.WEP()
+    elif format == "SHP":
+        obj = SHP.SHP()
+    elif format == "SEQ":
+        obj = SEQ.SEQ()
+    elif format == "ZUD":
+        obj = ZUD.ZUD()
+    elif format == "MPD":
+        obj = MPD.MPD()
+    elif format == "ZND":
+        obj = ZND.ZND()
+    elif format == "ARM":
+        obj = ARM.ARM()
+    elif format == "P":
+        obj = EFFECT.Effect()
+    obj.loadFromFile(filepath)
+    return obj
+
+def save(obj, format, filepath, outpath):
+    # parsed object as an npz : a JSON header, the pickled object and its arrays
+    state, buffers = Cache.dumps(obj)
+    header = {"format": format, "name": VS.displayName(filepath), "version": Cache.VERSION}
+    arrays = {
+        "header": np.frombuffer(json.dumps(header).encode("utf-8"), dtype=np.uint8),
+        "state": np.frombuffer(state, dtype=np.uint8),
+    }
+    for i in range(0, len(buffers)):
+        arrays["buffer_"+repr(i)] = np.frombuffer(buffers[i], dtype=np.uint8)
+    os.makedirs(os.path.dirname(outpath), exist_ok=True)
+    temp = outpath+"."+repr(os.getpid())+".tmp"
+    file = open(temp, "wb")
+    np.savez(file, **arrays)
+    file.close()
+    os.replace(temp, outpath)
+
+def convertFile(filepath, format, outpath):
+    start = time.perf_counter()
+    try:
+        if outpath.endswith(OUTPUTS["glb"]):
+            os.makedirs(os.path.dirname(outpath), exist_ok=True)
+            GLTF.exportFile(filepath, outpath)
+        elif outpath.endswith(OUTPUTS["arrays"]):
+            os.makedirs(os.path.dirname(outpath), exist_ok=True)
+            Intermediate.convertFile(filepath, outpath)
+        else:
+            save(parse(filepath, format), format, filepath, outpath)
+    except Exception:
+        # per file isolation, the error is reported in the manifest
+        return {"status": "failed", "error": traceback.format_exc(), "seconds": time.perf_counter() - start}
+    return {"status": "ok", "error": None, "seconds": time.perf_counter() - start}
+
+# directory where workers mark the chunks they are converting, see convertChunk
+runningDirectory = None
+
+def convertChunk(tasks, key = None):
+    # runs in a worker process, tasks are (path, filepath, format, outpath)
+    # a marker tells the main process this chunk was running if the worker dies
+    marker = None
+    if runningDirectory is not None and key is not None:
+        marker = os.path.join(runningDirectory, key)
+        open(marker, "w").close()
+    results = [(task[0], convertFile(task[1], task[2], task[3])) for task in tasks]
+    if marker is not None:
+        os.remove(marker)
+    return results
+
+def initWorker(cacheDirectory, running = None):
+    global runningDirectory
+    runningDirectory = running
+    # a worker parses each file once, the session cache would only cost memory
+    Cache.settings.sessionSize = 0
+    if cacheDirectory is not None:
+        Cache.settings.enabled = True
+        Cache.settings.directory = cacheDirectory
+
+
+def collect(root, formats = None):
+    # (relative path, file path, format, size, mtime) of each convertible file
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            format = FORMATS.get(os.path.splitext(filename)[1].upper())
+            if format is None or (formats is not None and format not in formats):
+                continue
+            filepath = os.path.join(dirpath, filename)
+            stat = os.stat(filepath)
+            path = os.path.relpath(filepath, root).replace(os.sep, "/")
+            files.append((path, filepath, format, stat.st_size, stat.st_mtime))
+    return files
+
+def cost(size, format):
+    # rooms build the most objects per byte, effects also read their FBC and FBT
+    if format == "MPD" or format == "P":
+        return size * 2
+    return size
+
+def chunks(tasks, chunkSize = CHUNK_SIZE):
+    # biggest first, so big MPD and ZND start early and small WEP fill the gaps at the end
+    tasks = sorted(tasks, key=lambda task: task[1], reverse=True)
+    result = []
+    chunk = []
+    weight = 0
+    for task, taskCost in tasks:
+        if weight > 0 and weight + taskCost > chunkSize:
+            result.append(chunk)
+            chunk = []
+            weight = 0
+        chunk.append(task)
+        weight += taskCost
+    if len(chunk) > 0:
+        result.append(chunk)
+    return result
+
+def loadManifest(outdir):
+    path = os.path.join(outdir, MANIFEST_NAME)
+    if not os.path.isfile(path):
+        return {"files": {}}
+    file = open(path, "r")
+    manifest = json.load(file)
+    file.close()
+    return manifest
+
+def saveManifest(outdir, manifest):
+    path = os.path.join(outdir, MANIFEST_NAME)
+    file = open(path+".tmp", "w")
+    json.dump(manifest, file, indent=1, sort_keys=True)
+    file.close()
+    os.replace(path+".tmp", path)
+
+def record(entries, results, chunk, failed):
+    # results of one chunk in the manifest, failed tasks are added to failed
+    tasksByPath = {task[0]: task for task in chunk}
+    for path, result in results:
+        entry = entries[path]
+        entry.update(result)
+        entry["attempts"] += 1
+        if result["status"] != "ok":
+            failed.append(tasksByPath[path])
+
+def convertDirectory(root, outdir, jobs = None, retries = 1, formats = None, force = False, cacheDirectory = None, log = print, to = "npz"):
+    root = os.path.abspath(root)
+    outdir = os.path.abspath(outdir)
+    os.makedirs(outdir, exist_ok=True)
+    jobs = jobs or os.cpu_count() or 1
+    start = time.perf_counter()
+    if to == "glb":
+        glbFormats = [FORMATS[ext] for ext in GLTF.EXTENSIONS]
+        formats = [format for format in (formats or glbFormats) if format in glbFormats]
+    elif to == "arrays":
+        arraysFormats = [FORMATS[ext] for ext in Intermediate.EXTENSIONS]
+        formats = [format for format in (formats or arraysFormats) if format in arraysFormats]
+
+    manifest = loadManifest(outdir)
+    manifest["source"] = root
+    entries = manifest["files"]
+    for path in list(entries):
+        if not os.path.isfile(os.path.join(root, path)):
+            del entries[path]
+    pending = []
+    skipped = 0
+    for path, filepath, format, size, mtime in collect(root, formats):
+        entry = entries.get(path)
+        if force == False and entry is not None and entry["status"] == "ok" and entry["size"] == size and entry["mtime"] == mtime and entry["output"] == path+OUTPUTS[to]:
+            skipped += 1
+            continue
+        entries[path] = {"format": format, "size": size, "mtime": mtime, "output": path+OUTPUTS[to], "status": "pending", "attempts": 0, "seconds": 0, "error": None}
+        pending.append((path, filepath, format, os.path.join(outdir, path+OUTPUTS[to])))
+
+    total = len(pending)
+    done = 0
+    for attempt in range(0, retries + 1):
+        if len(pending) == 0:
+            break
+        if attempt > 0:
+            log("retrying "+repr(len(pending))+" files")
+        tasks = [(task, cost(entries[task[0]]["size"], task[2])) for task in pending]
+        # retries run one file per chunk, a crashing file can't take others down with it
+        chunkSize = CHUNK_SIZE if attempt == 0 else 0
+        failed = []
+        queue = chunks(tasks, chunkSize)
+        while len(queue) > 0:
+            running = tempfile.mkdtemp(prefix="vs_batch_")
+            executor = ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn"), initializer=initWorker, initargs=(cacheDirectory, running))
+            futures = {}
+            for i in range(0, len(queue)):
+                futures[executor.submit(convertChunk, queue[i], repr(i))] = (queue[i], repr(i))
+            broken = []
+            for future in as_completed(futures):
+                chunk, key = futures[future]
+                try:
+                    results = future.result()
+                except BrokenProcessPool:
+                    # a worker died (out of memory, crash in a parser), every unfinished chunk gets this error
+                    broken.append((chunk, key))
+                    continue
+                record(entries, results, chunk, failed)
+                for path, result in results:
+                    if result["status"] == "ok":
+                        done += 1
+                        log("["+repr(done)+"/"+repr(total)+"] "+path+" {:.2f}s".format(result["seconds"]))
+            executor.shutdown()
+            # only chunks that were running when the pool broke are charged an attempt, the others never ran and go again
+            charged = [chunk for chunk, key in broken if os.path.isfile(os.path.join(running, key))]
+            queue = [chunk for chunk, key in broken if not os.path.isfile(os.path.join(running, key))]
+            if len(charged) == 0:
+                # nothing was marked running (a worker died while starting), we charge them all so we can't loop forever
+                charged = queue
+                queue = []
+            for chunk in charged:
+                record(entries, [(task[0], {"status": "failed", "error": "worker process died", "seconds": 0}) for task in chunk], chunk, failed)
+            for filename in os.listdir(running):
+                os.remove(os.path.join(running, filename))
+            os.rmdir(running)
+            saveManifest(outdir, manifest)
+        pending = failed
+
+    for task in pending:
+        log("failed "+task[0]+" :\n"+entries[task[0]]["error"])
+
+    # summary per format
+    elapsed = time.perf_counter() - start
+    summary = {}
+    for path in entries:
+        entry = entries[path]
+        counts = summary.setdefault(entry["format"], {"ok": 0, "failed": 0, "seconds": 0.0})
+        if entry["status"] == "ok":
+            counts["ok"] += 1
+        else:
+            counts["failed"] += 1
+        counts["seconds"] += entry["seconds"]
+    manifest["summary"] = summary
+    manifest["elapsed"] = elapsed
+    saveManifest(outdir, manifest)
+
+    for format in sorted(summary):
+        counts = summary[format]
+        log("{:4} {:5} ok {:4} failed {:8.2f}s".format(format, counts["ok"], counts["failed"], counts["seconds"]))
+    log(repr(total - len(pending))+" converted, "+repr(len(pending))+" failed, "+repr(skipped)+" unchanged in {:.2f}s with ".format(elapsed)+repr(jobs)+" processes")
+    return manifest
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Convert an extracted Vagrant Story directory in parallel")
+    parser.add_argument("source", help="extracted game directory")
+    parser.add_argument("output", help="output directory, a manifest.json is written there")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes, all cores by default")
+    parser.add_argument("--retries", type=int, default=1, help="retries of failed files")
+    parser.add_argument("--formats", default=None, help="comma separated formats, like WEP,SHP,MPD")
+    parser.add_argument("--force", action="store_true", help="convert unchanged files again")
+    parser.add_argument("--cache", default=None, help="disk cache directory shared by workers (arrays target)")
+    parser.add_argument("--to", choices=sorted(OUTPUTS), default="npz", help="parsed objects, glTF binaries or converted assets")
+    args = parser.parse_args(argv)
+
+    formats = None
+    if args.formats is not None:
+        formats = [format.strip().upper() for format in args.formats.split(",")]
+    manifest = convertDirectory(args.source, args.output, args.jobs, args.retries, formats, args.force, args.cache, to=args.to)
+    failures = sum([counts["failed"] for counts in manifest["summary"].values()])
+    return 1 if failures > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+bl_info = {
+    "name": "Vagrant Story file formats Add-on",
+    "description": "Import-Export Vagrant Story file formats (WEP, SHP, SEQ, ZUD, MPD, ZND, P, FBT, FBC).",
+    "author": "Sigfrid Korobetski (LunaticChimera)",
+    "version": (2, 12),
+    "blender": (3, 2, 0),
+    "location": "File > Import-Export",
+    "category": "Import-Export",
+}
+
+# caches of parsed files
+# session cache : loadFromFile restores a parsed object instead of parsing the file again,
+# pickled objects in memory keyed by (path, mtime, size), shared by every importer of this process,
+# restored objects are always new copies, importers can modify them
+# they are unpickled with an allow list : classes of this add-on, NumPy arrays and a few builtins, nothing else can be called
+# disk cache : converted assets in the Intermediate format (contiguous arrays and a JSON header, nothing pickled),
+# keyed by the content of their files, importers build Blender datas from the mapped arrays without parsing (see Intermediate.cached)
+# file contents are only hashed again when their size or mtime change
+# in both caches the least recently used entries are removed above a size limit
+# disk entries are only read from a directory of the current user that nobody else can write in
+#
+# the add-on preferences configure it, without Blender :
+#   Cache.settings.enabled = True
+#   Cache.settings.directory = "~/.cache/vagrant_story/parse"
+
+import io
+import os
+import json
+import pickle
+import collections
+import hashlib
+import sys
+
+from . import VS
+
+
+# bump it each time a parser changes what it produces, older entries are then ignored
+VERSION = 3
+HASHES_NAME = "hashes.json"
+
+def userDirectory(name):
+    # per user cache directory, never the shared temporary directory
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "vagrant_story", name)
+
+def makeDirectory(directory):
+    # creates directory for the current user only, returns False when it can't be trusted
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if os.name == "nt":
+        return True
+    stat = os.stat(directory)
+    # an other user could have created it or could write entries in it
+    return stat.st_uid == os.getuid() and stat.st_mode & 0o022 == 0
+
+class Settings:
+    def __init__(self):
+        self.enabled = False
+        self.directory = userDirectory("parse")
+        self.maxSize = 512 * 1024 * 1024  # bytes
+        self.sessionSize = 256 * 1024 * 1024  # bytes, 0 disables the session cache
+
+settings = Settings()
+
+# (class name, path, mtime, size, name) : (pickled state, out of band buffers)
+session = collections.OrderedDict()
+sessionBytes = 0
+
+
+class Unpickler(pickle.Unpickler):
+    # only what parsed objects are made of, a crafted entry can't call anything else
+    BUILTINS = ["set", "frozenset", "bytearray", "complex", "slice", "range"]
+    NUMPY = [("numpy", "dtype"), ("numpy", "ndarray"), ("numpy._core.numeric", "_frombuffer"), ("numpy.core.numeric", "_frombuffer"),
+        ("numpy._core.multiarray", "_reconstruct"), ("numpy.core.multiarray", "_reconstruct"),
+        ("numpy._core.multiarray", "scalar"), ("numpy.core.multiarray", "scalar"), ("collections", "OrderedDict")]
+
+    def find_class(self, module, name):
+        if module == "builtins" and name in self.BUILTINS:
+            return super().find_class(module, name)
+        if (module, name) in self.NUMPY or (module.startswith("numpy.dtypes") and name.endswith("DType")):
+            return super().find_class(module, name)
+        # the package name can be dotted (bl_ext.user_default.vagrant_story for Blender 4.2 extensions)
+        if (module == __package__ or module.startswith(__package__+".")) and module in sys.modules:
+            # classes defined by the add-on modules, not what they import
+            cls = getattr(sys.modules[module], name, None)
+            if isinstance(cls, type) and cls.__module__ == module:
+                return cls
+        raise pickle.UnpicklingError("forbidden global "+module+"."+name)
+
+def dumps(obj):
+    buffers = []
+    state = pickle.dumps(obj.__dict__, protocol=5, buffer_callback=buffers.append)
+    # we copy buffers, they still belong to the parsed object
+    return state, [bytes(buffer.raw()) for buffer in buffers]
+
+def loads(obj, state, buffers):
+    obj.__dict__.update(Unpickler(io.BytesIO(state), buffers=buffers).load())
+
+def sessionKey(obj, filepath, offset = 0):
+    # offset is for objects embedded in a file, like SEQ in ZUD
+    stat = os.stat(filepath)
+    return (type(obj).__name__, os.path.abspath(filepath), stat.st_mtime, stat.st_size, obj.name, offset)
+
+def remember(key, state, buffers):
+    global sessionBytes
+    if settings.sessionSize <= 0:
+        return
+    if key in session:
+        forget(key)
+    session[key] = (state, buffers)
+    sessionBytes += len(state) + sum([len(buffer) for buffer in buffers])
+    while sessionBytes > settings.sessionSize and len(session) > 0:
+        forget(next(iter(session)))
+
+def forget(key):
+    global sessionBytes
+    state, buffers = session.pop(key)
+    sessionBytes -= len(state) + sum([len(buffer) for buffer in buffers])
+
+def clearSession():
+    global sessionBytes
+    session.clear()
+    sessionBytes = 0
+
+
+def known(obj, filepath, offset = 0):
+    return sessionKey(obj, filepath, offset) in session
+
+def restore(obj, filepath, offset = 0):
+    # fills obj with a parse of filepath from the session cache, returns False when it isn't there
+    key = sessionKey(obj, filepath, offset)
+    if key not in session:
+        return False
+    session.move_to_end(key)
+    state, buffers = session[key]
+    loads(obj, state, buffers)
+    return True
+
+def store(obj, filepath, offset = 0):
+    if settings.sessionSize <= 0:
+        return
+    state, buffers = dumps(obj)
+    remember(sessionKey(obj, filepath, offset), state, buffers)
+
+
+# content hash of each source file by path, computed again only when its size or mtime change
+# kept in the cache directory so a new session doesn't read every file again
+hashes = {}
+hashesDirectory = None
+
+def loadHashes():
+    global hashes, hashesDirectory
+    if hashesDirectory == settings.directory:
+        return
+    hashes = {}
+    hashesDirectory = settings.directory
+    path = os.path.join(settings.directory, HASHES_NAME)
+    if os.path.isfile(path):
+        try:
+            file = open(path, "r")
+            hashes = json.load(file)
+            file.close()
+        except (OSError, ValueError):
+            hashes = {}
+
+def saveHashes():
+    path = os.path.join(settings.directory, HASHES_NAME)
+    temp = path+"."+repr(os.getpid())+".tmp"
+    file = open(temp, "w")
+    json.dump(hashes, file)
+    file.close()
+    os.replace(temp, path)
+
+def fileHash(filepath):
+    loadHashes()
+    filepath = os.path.abspath(filepath)
+    stat = os.stat(filepath)
+    known = hashes.get(filepath)
+    if known is not None and known[0] == stat.st_size and known[1] == stat.st_mtime:
+        return known[2]
+    sha1 = hashlib.sha1()
+    file = open(filepath, "rb")
+    sha1.update(file.read())
+    file.close()
+    hashes[filepath] = [stat.st_size, stat.st_mtime, sha1.hexdigest()]
+    saveHashes()
+    return sha1.hexdigest()
+
+def assetPath(kind, filepaths, version = 0):
+    # entry of an asset converted from filepaths (a MPD and its ZND...), None when the disk cache can't be used
+    # the key is the content of the files, their names (embedded datas are named after them) and the versions
+    if settings.enabled == False or not makeDirectory(settings.directory):
+        return None
+    sha1 = hashlib.sha1()
+    for filepath in filepaths:
+        sha1.update(fileHash(filepath).encode())
+        sha1.update(VS.displayName(filepath).encode("utf-8"))
+    return os.path.join(settings.directory, sha1.hexdigest()+"_"+kind+"_"+repr(VERSION)+"_"+repr(version)+".npz")
+
+def entries():
+    # (mtime, size, path) of each cache entry
+    if not os.path.isdir(settings.directory):
+        return []
+    items = []
+    for filename in os.listdir(settings.directory):
+        if filename.endswith(".npz"):
+            path = os.path.join(settings.directory, filename)
+            stat = os.stat(path)
+            items.append((stat.st_mtime, stat.st_size, path))
+    return items
+
+def size():
+    return sum([item[1] for item in entries()])
+
+def evict():
+    items = sorted(entries())
+    total = sum([item[1] for item in items])
+    while total > settings.maxSize and len(items) > 0:
+        mtime, length, path = items.pop(0)
+        try:
+            os.remove(path)
+        except OSError:
+            # still mapped by an imported asset (Windows), it goes next time
+            continue
+        total -= length
+
+def clear():
+    for mtime, length, path in entries():
+        try:
+            os.remove(path)
+        except OSError:
+            continue
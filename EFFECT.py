@@ -10,144 +10,463 @@ bl_info = {
 
 import os
 import struct
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
-import bpy
 import math
+import numpy as np
 
-from bpy.props import BoolProperty, EnumProperty, FloatProperty, StringProperty
-from bpy_extras.io_utils import ExportHelper, ImportHelper
+try:
+    import bpy
+    from bpy.props import BoolProperty, EnumProperty, FloatProperty, StringProperty
+    from bpy_extras.io_utils import ExportHelper, ImportHelper
+except ImportError:
+    # parsing doesn't need Blender
+    bpy = None
 
-from . import color
+from . import VS, Index, Textures
 
 
-class Import(bpy.types.Operator, ImportHelper):
-    """Load a EFFECT.P file"""
+if bpy is not None:
+    class Import(bpy.types.Operator, ImportHelper):
+        """Load a EFFECT.P file"""
 
-    bl_idname = "import_effect.mpd"
-    bl_label = "Import EFFECT"
-    filename_ext = ".P"
+        bl_idname = "import_effect.mpd"
+        bl_label = "Import EFFECT"
+        filename_ext = ".P"
 
-    filepath: bpy.props.StringProperty(default="", subtype="FILE_PATH")
-    filter_glob: bpy.props.StringProperty(default="*.P", options={"HIDDEN"})
+        filepath: bpy.props.StringProperty(default="", subtype="FILE_PATH")
+        filter_glob: bpy.props.StringProperty(default="*.P", options={"HIDDEN"})
+        bool_shader_flipbook: bpy.props.BoolProperty(
+            name="Shader Flipbook",
+            description="Keep a static quad and pick sprites in the material with a keyed \"frame\" property, instead of keying vertices and UVs",
+            default=False
+        )
+        bool_shape_keys: bpy.props.BoolProperty(
+            name="Quad Shape Keys",
+            description="Store each distinct sprite quad once as a shape key and key a single shape key evaluation time, instead of keying vertices",
+            default=False
+        )
+
+        def execute(self, context):
+            keywords = self.as_keywords(ignore=("axis_forward","axis_up","filter_glob",))
+            BlenderImport(self, context, **keywords)
+
+            return {"FINISHED"}
+
+    class ImportDirectory(bpy.types.Operator, ImportHelper):
+        """Load every EFFECT.P file of a directory"""
+
+        bl_idname = "import_effect.directory"
+        bl_label = "Import EFFECT Directory"
+        filename_ext = ".P"
+
+        directory: bpy.props.StringProperty(default="", subtype="DIR_PATH")
+        filter_glob: bpy.props.StringProperty(default="*.P", options={"HIDDEN"})
+        bool_shader_flipbook: bpy.props.BoolProperty(
+            name="Shader Flipbook",
+            description="Keep static quads and pick sprites in the materials with a keyed \"frame\" property, instead of keying vertices and UVs",
+            default=False
+        )
+        bool_shape_keys: bpy.props.BoolProperty(
+            name="Quad Shape Keys",
+            description="Store each distinct sprite quad once as a shape key and key a single shape key evaluation time, instead of keying vertices",
+            default=False
+        )
 
-    def execute(self, context):
-        keywords = self.as_keywords(ignore=("axis_forward","axis_up","filter_glob",))
-        BlenderImport(self, context, **keywords)
+        def execute(self, context):
+            keywords = self.as_keywords(ignore=("axis_forward","axis_up","filter_glob","filepath",))
+            BlenderImportDirectory(self, context, **keywords)
 
-        return {"FINISHED"}
+            return {"FINISHED"}
 
 
-def BlenderImport(operator, context, filepath):
+def BlenderImport(operator, context, filepath, bool_shader_flipbook = False, bool_shape_keys = False):
     effect = Effect()
 
     #print("filepath : "+filepath)
     #print("bpy.path.abspath : "+bpy.path.abspath(filepath))
     #print("bpy.path.basename : "+bpy.path.basename(filepath))
 
-    if (bpy.path.basename(filepath) == "E000.P"):
-        # Special case, all other fx starts at 1, E000_0.FBC must be black and white
-        fbcPath = filepath.replace(bpy.path.basename(filepath), "E000_0.FBC")
-        fbc = FBC()
-        fbc.loadFromFile(fbcPath)
-        #print(fbc)
-
-        fbtPath = filepath.replace(bpy.path.basename(filepath), "E000_0.FBT")
-        fbt = FBT()
-        fbt.loadFromFile(fbtPath, fbc.palettes)
-
-        effect.FBC = fbc
-        effect.FBTs.append(fbt)
-    else:
-        fbcPath = filepath.replace(".P", "_1.FBC")
-        if(os.path.isfile(fbcPath)):
-            fbc = FBC()
-            fbc.loadFromFile(fbcPath)
-            #print(fbc)
-            effect.FBC = fbc
-            # one effect can have up to 7 FBT and somtimes there is no FBC and FBT, maybe empty fx...
-            for i in range(1,9):
-                fbtPath = filepath.replace(".P", "_"+repr(i)+".FBT")
-                if(os.path.isfile(fbtPath)):
-                    fbt = FBT()
-                    fbt.loadFromFile(fbtPath, fbc.palettes)
-                    effect.FBTs.append(fbt)
-                else:
-                    break
-
-    p = P()
-    # we read datas from a file
-    p.width = len(effect.FBTs)*128
-    if effect.FBC != None:
-        p.numPalettes = effect.FBC.numPalettes
-    p.loadFromFile(filepath)
-    #print(p)
-    effect.P = p
+    effect.loadFromFile(filepath)
 
+    image = None
+    if effect.FBC != None:
+        pixmap = effect.spriteSheet()
+        image = Textures.newImage(bpy.path.basename(filepath)+"_Sprite_Sheet", pixmap.shape[1], pixmap.shape[0], pixmap)
+
+    buildEffect(bpy.path.basename(filepath), effect, image, bool_shader_flipbook, bool_shape_keys)
+
+def BlenderImportDirectory(operator, context, directory, bool_shader_flipbook = False, bool_shape_keys = False):
+    # we index the directory only once, effects siblings are then found in this list
+    filenames = set(os.listdir(directory))
+    filepaths = [os.path.join(directory, name) for name in sorted(filenames) if name.endswith(".P")]
+    if len(filepaths) == 0:
+        return
+
+    # effects are decoded in worker processes, spawn : we don't want to fork the whole Blender process
+    executor = ProcessPoolExecutor(max_workers=min(len(filepaths), os.cpu_count() or 1), mp_context=multiprocessing.get_context("spawn"))
+    futures = [executor.submit(decodeEffect, filepath, filenames) for filepath in filepaths]
+    # a malformed file is skipped, other effects are still built
+    decoded = []
+    skipped = []
+    for filepath, future in zip(filepaths, futures):
+        try:
+            decoded.append((filepath, future.result()))
+        except Exception as error:
+            skipped.append(os.path.basename(filepath)+" ("+repr(error)+")")
+    executor.shutdown()
+    if len(skipped) > 0:
+        operator.report({"WARNING"}, repr(len(skipped))+" effects skipped : "+", ".join(skipped))
+    filepaths = [item[0] for item in decoded]
+    effects = [item[1] for item in decoded]
+
+    # sprite sheets are packed into a few atlases, identical FBT pages are stored once per atlas
+    pageHeight = max([len(fbt.texture) for effect in effects for fbt in effect.FBTs], default=0)
+    atlases = []
+    placements = []
+    for effect in effects:
+        placement = None
+        if effect.FBC != None and len(effect.FBTs) > 0:
+            positions = None
+            if len(atlases) > 0:
+                positions = atlases[-1].place(effect)
+            if positions is None:
+                atlases.append(Atlas(max(ATLAS_SIZE, pageHeight)))
+                positions = atlases[-1].place(effect)
+            placement = (len(atlases) - 1, positions)
+        placements.append(placement)
+
+    images = []
+    for i in range(0, len(atlases)):
+        images.append(atlases[i].build(os.path.basename(os.path.normpath(directory))+"_Atlas_"+repr(i)))
+
+    for i in range(0, len(effects)):
+        image = None
+        if placements[i] is not None:
+            image = images[placements[i][0]]
+            remapUVs(effects[i], placements[i][1], image.size[0], image.size[1])
+        plane = buildEffect(os.path.basename(filepaths[i]), effects[i], image, bool_shader_flipbook, bool_shape_keys)
+        # we lay planes out on a grid so effects don't overlap
+        plane.location = ((i % 10) * 3, -(i // 10) * 3, 0)
+
+def decodeEffect(filepath, filenames = None):
+    # runs in a worker process, it only needs the parsers
+    effect = Effect()
+    effect.loadFromFile(filepath, filenames)
+    return effect
 
+def buildEffect(name, effect, image, bool_shader_flipbook = False, bool_shape_keys = False):
+    p = effect.P
 
     bpy.ops.mesh.primitive_plane_add()
     plane = bpy.context.active_object
-    plane.name = bpy.path.basename(filepath)
+    plane.name = name
 
-    mat = bpy.data.materials.new(name=str(bpy.path.basename(filepath) + "_Mat"))
+    mat = bpy.data.materials.new(name=str(name + "_Mat"))
     mat.use_nodes = True
     mat.blend_method = "CLIP"  # to handle alpha cutout
     bsdf = mat.node_tree.nodes["Principled BSDF"]
     bsdf.inputs["Specular"].default_value = 0
     bsdf.inputs["Metallic"].default_value = 0
 
-    if effect.FBC != None:
-        pixmap = []
-        h = effect.FBTs[0].height * effect.FBC.numPalettes
-        w = effect.FBTs[0].width
-
-        for i in range(0, h):
-            for t in range(0, len(effect.FBTs)):
-                for j in range(0, w):
-                    pixmap.extend(effect.FBTs[t].texture[i*w+j].toFloat())
-
+    if image is not None:
         texImage = mat.node_tree.nodes.new("ShaderNodeTexImage")
-        texImage.image = bpy.data.images.new(bpy.path.basename(filepath)+"_Sprite_Sheet", effect.FBTs[0].width * len(effect.FBTs), h)
-        texImage.image.pixels = pixmap
+        texImage.image = image
         #texImage.interpolation = "Closest"  # texture filter
         mat.node_tree.links.new(bsdf.inputs["Base Color"], texImage.outputs["Color"])
         mat.node_tree.links.new(bsdf.inputs["Alpha"], texImage.outputs["Alpha"])
         plane.active_material = mat
 
+        if bool_shader_flipbook == True:
+            buildFlipbook(plane, mat, texImage, p.frames)
+            if bool_shape_keys == True:
+                # quads fit sprites, the material still picks the sprite
+                buildShapeKeys(plane, p.frames)
+            return plane
+
         mesh = plane.data
         action = bpy.data.actions.new("MeshAnimation")
 
         mesh.animation_data_create()
         mesh.animation_data.action = action
 
-        uvlayer = mesh.uv_layers.active
-
         data_path = "vertices[%d].co"
         uv_datas_path = "uv_layers.active.data[%d].uv"
 
-        for t in range(0, len(p.frames)):
-            frame = p.frames[t]
-            xdec = frame.textureId * 128
-
+        # one key per sprite frame, we gather every value first and create each F-curve only once
+        # frames without datas aren't keyed, like in the shape keys and flipbook modes
+        quadFrames = [t for t in range(0, len(p.frames)) if len(p.frames[t].v_co) >= len(mesh.vertices)]
+        uvFrames = [t for t in range(0, len(p.frames)) if len(p.frames[t].uvs) >= len(mesh.loops)]
+        if bool_shape_keys == True:
+            if len(p.frames) > 0:
+                buildShapeKeys(plane, p.frames)
+        elif len(quadFrames) > 0:
+            times = np.array(quadFrames, dtype=np.float32)
+            v_co = np.array([p.frames[t].v_co[0:len(mesh.vertices)] for t in quadFrames], dtype=np.float32) / 100
             for v in mesh.vertices:
-                fcurves = [action.fcurves.find(data_path % v.index, index= i) for i in range(3)]
-                if fcurves == [None, None, None]:
-                    fcurves = [action.fcurves.new(data_path % v.index, index =  i) for i in range(3)]
-                co_rest = v.co
-                sprite_co = (frame.v_co[v.index][0]/100, frame.v_co[v.index][1]/100, 0.0)
-                insert_keyframe(fcurves, t, sprite_co)
-
-            for face in mesh.polygons:
-                for vert_idx, loop_idx in zip(face.vertices, face.loop_indices):
-                    #uvlayer.data[loop_idx].uv = (xdec + frame.uvs[loop_idx][0], frame.uvs[loop_idx][1])
-                    uv_curve = [action.fcurves.find(uv_datas_path % loop_idx, index= i) for i in range(2)]
-                    if uv_curve == [None, None]:
-                        uv_curve = [action.fcurves.new(uv_datas_path % loop_idx, index= i) for i in range(2)]
-                    insert_keyframe(uv_curve, t, (xdec + frame.uvs[loop_idx][0], frame.uvs[loop_idx][1]))
-
-def insert_keyframe(fcurves, frame, values):
-    for fcu, val in zip(fcurves, values):
-        fcu.keyframe_points.insert(frame, val, options={'FAST'})
+                fillFCurve(action, data_path % v.index, 0, times, v_co[:, v.index, 0])
+                fillFCurve(action, data_path % v.index, 1, times, v_co[:, v.index, 1])
+                fillFCurve(action, data_path % v.index, 2, times, np.zeros(len(times), dtype=np.float32))
+
+        if len(uvFrames) > 0:
+            times = np.array(uvFrames, dtype=np.float32)
+            uvs = np.array([p.frames[t].uvs[0:len(mesh.loops)] for t in uvFrames], dtype=np.float32)
+            uvs[:, :, 0] += np.array([p.frames[t].textureId * 128 for t in uvFrames], dtype=np.float32)[:, None]
+            for loop in mesh.loops:
+                fillFCurve(action, uv_datas_path % loop.index, 0, times, uvs[:, loop.index, 0])
+                fillFCurve(action, uv_datas_path % loop.index, 1, times, uvs[:, loop.index, 1])
+
+    return plane
+
+def fillFCurve(action, data_path, index, times, values):
+    fcu = action.fcurves.new(data_path, index=index)
+    fcu.keyframe_points.add(len(times))
+    co = np.empty(len(times) * 2, dtype=np.float32)
+    co[0::2] = times
+    co[1::2] = values
+    fcu.keyframe_points.foreach_set("co", co)
+    # sprites jump from one frame to another, 0 is the CONSTANT interpolation
+    fcu.keyframe_points.foreach_set("interpolation", np.zeros(len(times), dtype=np.int32))
+    fcu.update()
+    return fcu
+
+def buildShapeKeys(plane, frames):
+    # absolute shape keys, one block per distinct quad, only the shape keys evaluation time is keyed
+    # a block is exactly evaluated when eval_time is its frame value, so the mesh is never keyed
+    mesh = plane.data
+    basis = plane.shape_key_add(name="Basis")
+    basis.interpolation = "KEY_LINEAR"
+    mesh.shape_keys.use_relative = False
+    blocks = {}
+    evalTimes = np.zeros(len(frames), dtype=np.float32)
+    for t in range(0, len(frames)):
+        quad = tuple(frames[t].v_co[0:len(mesh.vertices)])
+        if len(quad) < len(mesh.vertices):
+            continue # frame without datas, we keep the basis
+        if quad not in blocks:
+            block = plane.shape_key_add(name="Quad_"+repr(len(blocks)), from_mix=False)
+            block.interpolation = "KEY_LINEAR"
+            co = np.zeros((len(mesh.vertices), 3), dtype=np.float32)
+            co[:, 0:2] = np.array(quad, dtype=np.float32) / 100
+            block.data.foreach_set("co", co.ravel())
+            blocks[quad] = block.frame
+        evalTimes[t] = blocks[quad]
+
+    action = bpy.data.actions.new(plane.name+"_Quads")
+    mesh.shape_keys.animation_data_create()
+    mesh.shape_keys.animation_data.action = action
+    if len(frames) > 0:
+        fillFCurve(action, "eval_time", 0, np.arange(0, len(frames), dtype=np.float32), evalTimes)
+
+def buildFlipbook(plane, mat, texImage, frames):
+    # static quad covering every sprite, a lookup table (one pixel column per frame) gives the material
+    # the sprite rectangle in object space (row 0) and the sprite sheet rectangle (row 1) of the current frame
+    #  row 0 : x, y, 1 / width, 1 / height
+    #  row 1 : u, v, u width, v height
+    lut = np.zeros((2, max(len(frames), 1), 4), dtype=np.float32)
+    lut[0, :] = (-1e6, -1e6, 1, 1) # empty frames are never inside the quad
+    corners = []
+    for t in range(0, len(frames)):
+        frame = frames[t]
+        if len(frame.v_co) < 4:
+            continue
+        # first and third UV are opposite corners, they goes with the first and the fourth vertex
+        x1, y1 = frame.v_co[0][0] / 100, frame.v_co[0][1] / 100
+        x2, y2 = frame.v_co[3][0] / 100, frame.v_co[3][1] / 100
+        corners.extend([(x1, y1), (x2, y2)])
+        if x1 != x2 and y1 != y2:
+            lut[0, t] = (x1, y1, 1 / (x2 - x1), 1 / (y2 - y1))
+        u1, v1 = frame.uvs[0]
+        u2, v2 = frame.uvs[2]
+        lut[1, t] = (u1, v1, u2 - u1, v2 - v1)
+
+    mesh = plane.data
+    if len(corners) > 0:
+        corners = np.array(corners, dtype=np.float32)
+        xmin, ymin = corners.min(axis=0)
+        xmax, ymax = corners.max(axis=0)
+        # primitive plane vertices : (-1, -1), (1, -1), (-1, 1), (1, 1)
+        mesh.vertices.foreach_set("co", np.array([xmin, ymin, 0, xmax, ymin, 0, xmin, ymax, 0, xmax, ymax, 0], dtype=np.float32))
+        mesh.update()
+
+    lutImage = bpy.data.images.new(plane.name+"_Flipbook", lut.shape[1], 2, alpha=True, float_buffer=True)
+    lutImage.colorspace_settings.name = "Non-Color"
+    lutImage.alpha_mode = "CHANNEL_PACKED"
+    lutImage.pixels.foreach_set(lut.ravel())
+    # values can be negative or above 1, we keep them in a float file when the .blend is saved
+    lutImage.file_format = "OPEN_EXR"
+    lutImage.pack()
+
+    nodes = mat.node_tree.nodes
+    links = mat.node_tree.links
+    bsdf = nodes["Principled BSDF"]
+
+    texCoord = nodes.new("ShaderNodeTexCoord")
+    frameAttr = nodes.new("ShaderNodeAttribute")
+    frameAttr.attribute_type = "OBJECT"
+    frameAttr.attribute_name = '["frame"]'
+
+    # we sample the center of the frame pixel column
+    column = nodes.new("ShaderNodeMath")
+    column.operation = "ADD"
+    column.inputs[1].default_value = 0.5
+    links.new(column.inputs[0], frameAttr.outputs["Fac"])
+    lutU = nodes.new("ShaderNodeMath")
+    lutU.operation = "DIVIDE"
+    lutU.inputs[1].default_value = lut.shape[1]
+    links.new(lutU.inputs[0], column.outputs["Value"])
+
+    rows = []
+    for row in range(0, 2):
+        lutCoord = nodes.new("ShaderNodeCombineXYZ")
+        lutCoord.inputs["Y"].default_value = 0.25 + row * 0.5
+        links.new(lutCoord.inputs["X"], lutU.outputs["Value"])
+        lutTex = nodes.new("ShaderNodeTexImage")
+        lutTex.image = lutImage
+        lutTex.interpolation = "Closest"
+        lutTex.extension = "EXTEND"
+        links.new(lutTex.inputs["Vector"], lutCoord.outputs["Vector"])
+        lutSep = nodes.new("ShaderNodeSeparateXYZ")
+        links.new(lutSep.inputs["Vector"], lutTex.outputs["Color"])
+        # third and fourth values make the scale vector
+        scale = nodes.new("ShaderNodeCombineXYZ")
+        links.new(scale.inputs["X"], lutSep.outputs["Z"])
+        links.new(scale.inputs["Y"], lutTex.outputs["Alpha"])
+        rows.append((lutTex, scale))
+
+    # position inside the sprite rectangle, from 0 to 1 on both axis
+    offset = nodes.new("ShaderNodeVectorMath")
+    offset.operation = "SUBTRACT"
+    links.new(offset.inputs[0], texCoord.outputs["Object"])
+    links.new(offset.inputs[1], rows[0][0].outputs["Color"])
+    local = nodes.new("ShaderNodeVectorMath")
+    local.operation = "MULTIPLY"
+    links.new(local.inputs[0], offset.outputs["Vector"])
+    links.new(local.inputs[1], rows[0][1].outputs["Vector"])
+
+    # local * (1 - local) is positive only inside the rectangle
+    inverse = nodes.new("ShaderNodeVectorMath")
+    inverse.operation = "SUBTRACT"
+    inverse.inputs[0].default_value = (1, 1, 1)
+    links.new(inverse.inputs[1], local.outputs["Vector"])
+    product = nodes.new("ShaderNodeVectorMath")
+    product.operation = "MULTIPLY"
+    links.new(product.inputs[0], local.outputs["Vector"])
+    links.new(product.inputs[1], inverse.outputs["Vector"])
+    productSep = nodes.new("ShaderNodeSeparateXYZ")
+    links.new(productSep.inputs["Vector"], product.outputs["Vector"])
+    lowest = nodes.new("ShaderNodeMath")
+    lowest.operation = "MINIMUM"
+    links.new(lowest.inputs[0], productSep.outputs["X"])
+    links.new(lowest.inputs[1], productSep.outputs["Y"])
+    inside = nodes.new("ShaderNodeMath")
+    inside.operation = "GREATER_THAN"
+    inside.inputs[1].default_value = -1e-6
+    links.new(inside.inputs[0], lowest.outputs["Value"])
+
+    # sprite sheet coordinates
+    sheetScale = nodes.new("ShaderNodeVectorMath")
+    sheetScale.operation = "MULTIPLY"
+    links.new(sheetScale.inputs[0], local.outputs["Vector"])
+    links.new(sheetScale.inputs[1], rows[1][1].outputs["Vector"])
+    sheetCoord = nodes.new("ShaderNodeVectorMath")
+    sheetCoord.operation = "ADD"
+    links.new(sheetCoord.inputs[0], sheetScale.outputs["Vector"])
+    links.new(sheetCoord.inputs[1], rows[1][0].outputs["Color"])
+    links.new(texImage.inputs["Vector"], sheetCoord.outputs["Vector"])
+
+    alpha = nodes.new("ShaderNodeMath")
+    alpha.operation = "MULTIPLY"
+    links.new(alpha.inputs[0], texImage.outputs["Alpha"])
+    links.new(alpha.inputs[1], inside.outputs["Value"])
+    links.new(bsdf.inputs["Alpha"], alpha.outputs["Value"])
+
+    # only one integer property is keyed
+    plane["frame"] = 0
+    plane.id_properties_ui("frame").update(min=0, max=max(len(frames) - 1, 0))
+    action = bpy.data.actions.new(plane.name+"_Flipbook")
+    plane.animation_data_create()
+    plane.animation_data.action = action
+    if len(frames) > 0:
+        times = np.arange(0, len(frames), dtype=np.float32)
+        fillFCurve(action, '["frame"]', 0, times, times)
+
+def fileExists(filepath, filenames = None):
+    # filenames : names of the directory when it is already listed, otherwise we ask the index or the file system
+    if filenames is None:
+        return Index.isfile(filepath)
+    return os.path.basename(filepath) in filenames
+
+def remapUVs(effect, positions, width, height):
+    # frames UVs are given in the effect sprite sheet, we move them to the FBT pages in the atlas
+    sheetWidth = 128 * len(effect.FBTs)
+    for frame in effect.P.frames:
+        if frame.textureId >= len(positions):
+            continue
+        x, y, pageHeight = positions[frame.textureId]
+        frame.uvs = [((x + u * sheetWidth - frame.textureId * 128) / width, (y + v * pageHeight) / height) for u, v in frame.uvs]
+
+# atlases are made of 128 pixels wide columns where FBT pages (all palettes of a FBT) are stacked
+ATLAS_SIZE = 2048
+
+class Atlas:
+    def __init__(self, height):
+        self.height = height
+        self.columns = [] # used height of each column
+        self.pages = {} # (x, y) of FBT pages by digest
+        self.textures = [] # (x, y, texture) to copy in the image
+
+    def place(self, effect):
+        # every FBT of an effect must be in the same atlas, returns None if they don't fit
+        columns = list(self.columns)
+        pages = {}
+        textures = []
+        positions = []
+        for fbt in effect.FBTs:
+            digest = fbt.digest()
+            h = len(fbt.texture)
+            if digest in self.pages:
+                x, y = self.pages[digest]
+            elif digest in pages:
+                x, y = pages[digest]
+            else:
+                c = 0
+                while c < len(columns) and columns[c] + h > self.height:
+                    c += 1
+                if c == len(columns):
+                    if len(columns) * 128 >= ATLAS_SIZE:
+                        return None
+                    columns.append(0)
+                x, y = c * 128, columns[c]
+                columns[c] += h
+                pages[digest] = (x, y)
+                textures.append((x, y, fbt.texture))
+            positions.append((x, y, h))
+        self.columns = columns
+        self.pages.update(pages)
+        self.textures.extend(textures)
+        return positions
+
+    def build(self, name):
+        pixmap = np.zeros((max(self.columns), len(self.columns) * 128, 4), dtype=np.float32)
+        for x, y, texture in self.textures:
+            pixmap[y:y + len(texture), x:x + texture.shape[1]] = texture
+        pixmap /= 255
+        image = Textures.newImage(name, pixmap.shape[1], pixmap.shape[0], pixmap)
+        return image
+
+def probe(filepath):
+    # P header only, sprites are not decoded
+    infos = {"format": "P", "name": VS.displayName(filepath), "filesize": os.stat(filepath).st_size}
+    file = open(filepath, "rb")
+    n1, n2 = struct.unpack("2B", file.read(2))
+    wid, hei = struct.unpack(">2H", file.read(4))
+    framePtr = struct.unpack("H", file.read(2))[0]
+    file.close()
+    infos.update({"width": wid, "height": hei, "numFrames": round((framePtr + 4 - 12) / 4)})
+    return infos
 
 class Effect:
     def __init__(self):
@@ -155,6 +474,57 @@ class Effect:
         self.FBC = None
         self.FBTs = []
 
+    def loadFromFile(self, filepath, filenames = None):
+        if (os.path.basename(filepath) == "E000.P"):
+            # Special case, all other fx starts at 1, E000_0.FBC must be black and white
+            fbcPath = filepath.replace(os.path.basename(filepath), "E000_0.FBC")
+            fbc = FBC()
+            fbc.loadFromFile(fbcPath)
+            #print(fbc)
+
+            fbtPath = filepath.replace(os.path.basename(filepath), "E000_0.FBT")
+            fbt = FBT()
+            fbt.loadFromFile(fbtPath, fbc.palettes)
+
+            self.FBC = fbc
+            self.FBTs.append(fbt)
+        else:
+            fbcPath = filepath.replace(".P", "_1.FBC")
+            if(fileExists(fbcPath, filenames)):
+                fbc = FBC()
+                fbc.loadFromFile(fbcPath)
+                #print(fbc)
+                self.FBC = fbc
+                # one effect can have up to 7 FBT and somtimes there is no FBC and FBT, maybe empty fx...
+                for i in range(1,9):
+                    fbtPath = filepath.replace(".P", "_"+repr(i)+".FBT")
+                    if(fileExists(fbtPath, filenames)):
+                        fbt = FBT()
+                        fbt.loadFromFile(fbtPath, fbc.palettes)
+                        self.FBTs.append(fbt)
+                    else:
+                        break
+
+        p = P()
+        # we read datas from a file
+        p.width = len(self.FBTs)*128
+        if self.FBC != None:
+            p.numPalettes = self.FBC.numPalettes
+        p.loadFromFile(filepath)
+        #print(p)
+        self.P = p
+
+    def spriteSheet(self):
+        h = self.FBTs[0].height * self.FBC.numPalettes
+        w = self.FBTs[0].width
+
+        # FBT side by side, palettes are already stacked vertically in each FBT texture
+        # the sheet is directly concatenated into the float buffer, it is the only copy we make
+        pixmap = np.empty((h, w * len(self.FBTs), 4), dtype=np.float32)
+        np.concatenate([fbt.texture for fbt in self.FBTs], axis=1, out=pixmap)
+        pixmap /= 255
+        return pixmap
+
 class P:
     def __init__(self):
         self.name = ""
@@ -178,7 +548,7 @@ class P:
     def loadFromFile(self, filepath):
         self.filesize = os.stat(filepath).st_size
         file = open(filepath, "rb")
-        self.name = bpy.path.display_name(filepath)
+        self.name = VS.displayName(filepath)
         self.parse(file)
         file.close()
     def parse(self, file):
@@ -210,40 +580,50 @@ class FBC:
         self.name =""
         self.filesize = 0
         self.numPalettes = 0
-        self.palettes = []
+        self.palettes = None # (numPalettes, 256, 4) RGBA uint8 array
     def __repr__(self):
         return ("FBC : "+" name : "+repr(self.name)+" filesize : "+repr(self.filesize)+" numPalettes : "+repr(self.numPalettes))
     def loadFromFile(self, filepath):
         self.filesize = os.stat(filepath).st_size
         self.numPalettes = round(self.filesize / 512)
-        self.name = bpy.path.display_name(filepath)
+        self.name = VS.displayName(filepath)
         file = open(filepath, "rb")
         self.parse(file)
 
         file.close()
     def parse(self, file):
-        self.palettes = []
-        for i in range(0, self.numPalettes):
-            colors = []
-            for j in range(0, 256):
-                colors.append(color.from16bits( struct.unpack("H", file.read(2))[0] ))
-            self.palettes.append(colors)
+        # 256 16bits colors per palette
+        colors = np.zeros(self.numPalettes * 256, dtype=np.uint16)
+        datas = np.frombuffer(file.read(self.numPalettes * 512), dtype="<u2")
+        colors[0:len(datas)] = datas
+        colors = colors.reshape(self.numPalettes, 256)
+        self.palettes = np.empty((self.numPalettes, 256, 4), dtype=np.uint8)
+        self.palettes[:, :, 0] = (colors & 0x001F) * 8
+        self.palettes[:, :, 1] = ((colors & 0x03E0) >> 5) * 8
+        self.palettes[:, :, 2] = ((colors & 0x7C00) >> 10) * 8
+        # effects are additive, dark colors are made transparent with the grey scale
+        grey = self.palettes[:, :, 0:3].sum(axis=2, dtype=np.int32)
+        self.palettes[:, :, 3] = np.where(grey < 64, np.round(grey / 3), 255)
 
 class FBT:
     def __init__(self):
         self.name = "FBT"
         self.filesize = 0
-        self.texture = None
+        self.indices = None # (height, width) uint8 array, rows are flipped for Blender
+        self.texture = None # (numPalettes * height, width, 4) RGBA uint8 array, one block per palette
         self.width = 0
         self.height = 0
     def __repr__(self):
         return ("P : "+" name : "+repr(self.name)+" filesize : "+repr(self.filesize))
     def loadFromFile(self, filepath, palettes):
-        self.name = bpy.path.display_name(filepath)
+        self.name = VS.displayName(filepath)
         self.filesize = os.stat(filepath).st_size
         file = open(filepath, "rb")
         self.parse(file, palettes)
         file.close()
+    def digest(self):
+        # identical pages are shared in atlases
+        return hashlib.sha1(self.texture.tobytes()).hexdigest()
     def parse(self, file, palettes):
         self.width = 128
         self.height = 128
@@ -253,23 +633,13 @@ class FBT:
         size = self.width * self.height
 
         #print("FBT parse : "+" height : "+repr(self.height))
-        self.texture = []
-        clutPtr = file.tell()
-        for i in range(0, len(palettes)):
-            cluts = []
-            for x in range(0, self.height):
-                cl2 = []
-                for y in range(0, self.width):
-                    c = palettes[i][struct.unpack("B", file.read(1))[0]]
-                    c.A = 255
-                    if (c.R + c.G + c.B) < 64:
-                        c.A = round((c.R + c.G + c.B) / 3) # make alpha with grey scale
-                    cl2.append(c)
-                cl2.reverse()
-                cluts.extend(cl2)
-            cluts.reverse()
-            self.texture.extend(cluts)
-            file.seek(clutPtr)
+        indices = np.zeros(size, dtype=np.uint8)
+        datas = np.frombuffer(file.read(size), dtype=np.uint8)
+        indices[0:len(datas)] = datas
+        # Blender images start from the bottom
+        self.indices = np.flip(indices.reshape(self.height, self.width), axis=0)
+        # one gather for every palette
+        self.texture = palettes[:, self.indices].reshape(-1, self.width, 4)
         #texImage = bpy.data.textures.new(self.name, 'IMAGE')
         #texImage.image = bpy.data.images.new(self.name, self.width, self.height)
         #texImage.image.pixels = cluts
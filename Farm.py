@@ -0,0 +1,281 @@
+bl_info = {
+    "name": "Vagrant Story file formats Add-on",
+    "description": "Import-Export Vagrant Story file formats (WEP, SHP, SEQ, ZUD, MPD, ZND, P, FBT, FBC).",
+    "author": "Sigfrid Korobetski (LunaticChimera)",
+    "version": (2, 12),
+    "blender": (3, 2, 0),
+    "location": "File > Import-Export",
+    "category": "Import-Export",
+}
+
+# .blend generation with several Blender instances, one Blender builds files serially so we run N of them
+# the driver (plain Python) splits files between "blender --background" workers, each worker imports its share
+# with the add-on operators and saves .blend files, then the driver gathers timing and error reports
+# no display is needed, workers can share the on-disk parse cache
+#
+# usage, from the directory containing the add-on folder :
+#   python -m vagrant_story.Farm VS/ blends/ --blender /opt/blender/blender --workers 4 --cache /tmp/vs_cache
+#   python -m vagrant_story.Farm VS/MAP blends/ --mode zone   (one .blend per zone instead of one per file)
+#   python -m vagrant_story.Farm VS/ library/ --mode library  (per zone asset libraries, see Library)
+
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+import subprocess
+import traceback
+
+try:
+    import bpy
+    import addon_utils
+except ImportError:
+    # the driver runs without Blender
+    bpy = None
+
+import numpy as np
+
+from . import VS, Cache, Library, Preview
+
+
+# import operator of each format, SEQ are imported with their SHP
+OPERATORS = {
+    ".WEP": "import_mesh.wep",
+    ".SHP": "import_mesh.shp",
+    ".ZUD": "import_mesh.zud",
+    ".MPD": "import_map_mesh.mpd",
+    ".ARM": "import_mesh.arm",
+    ".P": "import_effect.mpd",
+}
+REPORT_NAME = "farm_report.json"
+PREVIEWS_NAME = "previews"
+
+
+def collect(root):
+    # (file path, size) of each importable file
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].upper() in OPERATORS:
+                filepath = os.path.join(dirpath, filename)
+                files.append((filepath, os.path.getsize(filepath)))
+    return files
+
+def zoneName(filepath):
+    # rooms are grouped by their ZND, other files by format
+    filename = os.path.basename(filepath).upper()
+    name, ext = os.path.splitext(filename)
+    if ext == ".MPD":
+        return os.path.splitext(VS.MDPToZND(filename))[0]
+    return ext[1:]
+
+def groups(root, outdir, mode):
+    # each group is imported in one empty scene and saved as one .blend
+    result = []
+    if mode == "zone" or mode == "library":
+        zones = {}
+        for filepath, size in collect(root):
+            zone = zones.setdefault(zoneName(filepath), {"output": os.path.join(outdir, zoneName(filepath)+".blend"), "files": [], "size": 0})
+            zone["files"].append(filepath)
+            zone["size"] += size
+        result = [zones[name] for name in sorted(zones)]
+    else:
+        for filepath, size in collect(root):
+            path = os.path.relpath(filepath, root)
+            result.append({"output": os.path.join(outdir, path+".blend"), "files": [filepath], "size": size})
+    return result
+
+def split(groups, numWorkers):
+    # biggest groups first, each one goes to the least loaded worker
+    shares = [[] for i in range(0, numWorkers)]
+    loads = [0] * numWorkers
+    for group in sorted(groups, key=lambda group: group["size"], reverse=True):
+        i = loads.index(min(loads))
+        shares[i].append(group)
+        loads[i] += group["size"]
+    return [share for share in shares if len(share) > 0]
+
+def command(blender, package, jobpath):
+    # the add-on is imported from its parent directory, so it doesn't need to be installed in this Blender
+    parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    expr = "import sys; sys.path.insert(0, "+repr(parent)+"); import importlib; importlib.import_module("+repr(package+".Farm")+").work("+repr(jobpath)+")"
+    return [blender, "--background", "--factory-startup", "-noaudio", "--python-exit-code", "1", "--python-expr", expr]
+
+def run(root, outdir, blender = "blender", numWorkers = None, mode = "file", cacheDirectory = None, options = {}, timeout = None, log = print):
+    root = os.path.abspath(root)
+    outdir = os.path.abspath(outdir)
+    os.makedirs(outdir, exist_ok=True)
+    numWorkers = numWorkers or os.cpu_count() or 1
+    start = time.perf_counter()
+
+    shares = split(groups(root, outdir, mode), numWorkers)
+    previews = None
+    if mode == "library":
+        Library.writeCatalogs(outdir)
+        # previews are rendered without Blender first, workers attach them and render the missing ones
+        previews = os.path.join(outdir, PREVIEWS_NAME)
+        filepaths = [filepath for share in shares for group in share for filepath in group["files"] if os.path.splitext(filepath)[1].upper() in Preview.EXTENSIONS]
+        rendered = Preview.renderFiles(root, filepaths, previews, jobs=numWorkers)
+        log(repr(len([filepath for filepath in rendered if rendered[filepath][1] is None]))+" previews rendered")
+    jobdir = tempfile.mkdtemp(prefix="vs_farm_")
+    # workers run together, so they all share one deadline
+    deadline = None if timeout is None else time.monotonic() + timeout
+    processes = []
+    for i in range(0, len(shares)):
+        jobpath = os.path.join(jobdir, "job_"+repr(i)+".json")
+        job = {"worker": i, "mode": mode, "root": root, "previews": previews, "groups": shares[i], "cache": cacheDirectory, "options": options, "report": os.path.join(jobdir, "report_"+repr(i)+".json")}
+        file = open(jobpath, "w")
+        json.dump(job, file)
+        file.close()
+        logfile = open(os.path.join(jobdir, "worker_"+repr(i)+".log"), "w")
+        process = subprocess.Popen(command(blender, __package__, jobpath), stdout=logfile, stderr=subprocess.STDOUT)
+        processes.append((process, job, logfile))
+        log("worker "+repr(i)+" : "+repr(len(shares[i]))+" .blend, "+repr(sum([len(group["files"]) for group in shares[i]]))+" files")
+
+    report = {"source": root, "workers": [], "files": {}}
+    for process, job, logfile in processes:
+        try:
+            process.wait(None if deadline is None else max(0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        logfile.close()
+        if os.path.isfile(job["report"]):
+            file = open(job["report"], "r")
+            workerReport = json.load(file)
+            file.close()
+        else:
+            # Blender crashed or was killed before writing its report
+            workerReport = {"seconds": None, "groups": []}
+        workerReport["worker"] = job["worker"]
+        workerReport["returncode"] = process.returncode
+        workerReport["log"] = logfile.name
+        done = [group["output"] for group in workerReport["groups"]]
+        for group in job["groups"]:
+            if group["output"] not in done:
+                workerReport["groups"].append({"output": group["output"], "status": "failed", "seconds": 0,
+                    "files": [{"filepath": filepath, "status": "failed", "seconds": 0, "error": "worker exited with "+repr(process.returncode)} for filepath in group["files"]]})
+        for group in workerReport["groups"]:
+            for entry in group["files"]:
+                report["files"][os.path.relpath(entry["filepath"], root).replace(os.sep, "/")] = entry
+        report["workers"].append(workerReport)
+
+    missing = []
+    if mode == "library":
+        # imported assets that got no preview (P, ARM, preview rendering errors)
+        missing = [path for path in report["files"] if report["files"][path]["status"] == "ok" and report["files"][path].get("preview") != True]
+        report["missingPreviews"] = missing
+    report["elapsed"] = time.perf_counter() - start
+    file = open(os.path.join(outdir, REPORT_NAME), "w")
+    json.dump(report, file, indent=1, sort_keys=True)
+    file.close()
+
+    failed = [path for path in report["files"] if report["files"][path]["status"] != "ok"]
+    for path in failed:
+        log("failed "+path+" : "+report["files"][path]["error"])
+    for path in missing:
+        log("no preview "+path)
+    for workerReport in report["workers"]:
+        seconds = workerReport["seconds"]
+        log("worker "+repr(workerReport["worker"])+" "+("crashed" if seconds is None else "{:.2f}s".format(seconds))+", log : "+workerReport["log"])
+    log(repr(len(report["files"]) - len(failed))+" imported, "+repr(len(failed))+" failed in {:.2f}s with ".format(report["elapsed"])+repr(len(processes))+" Blender")
+    return report
+
+
+def work(jobpath):
+    # runs inside a background Blender
+    file = open(jobpath, "r")
+    job = json.load(file)
+    file.close()
+    start = time.perf_counter()
+
+    # registers operators and preferences like a normal add-on
+    addon_utils.enable(__package__, default_set=True)
+    if job["cache"] is not None:
+        Cache.settings.enabled = True
+        Cache.settings.directory = job["cache"]
+
+    report = {"groups": []}
+    for group in job["groups"]:
+        groupStart = time.perf_counter()
+        bpy.ops.wm.read_homefile(use_empty=True)
+        entries = []
+        collections = []
+        for filepath in group["files"]:
+            if job["mode"] == "library":
+                entries.append(importFile(filepath, job["options"], collections, loadPreview(job, filepath)))
+            else:
+                entries.append(importFile(filepath, job["options"]))
+        status = "ok"
+        if all([entry["status"] != "ok" for entry in entries]):
+            status = "failed"
+        else:
+            try:
+                if job["mode"] == "library":
+                    Library.write(group["output"], collections)
+                else:
+                    os.makedirs(os.path.dirname(group["output"]), exist_ok=True)
+                    bpy.ops.wm.save_as_mainfile(filepath=group["output"], compress=True)
+            except Exception:
+                status = "failed"
+                for entry in entries:
+                    entry.update({"status": "failed", "error": traceback.format_exc()})
+        report["groups"].append({"output": group["output"], "status": status, "files": entries, "seconds": time.perf_counter() - groupStart})
+        print("VS Farm : "+group["output"]+" "+status)
+
+    report["seconds"] = time.perf_counter() - start
+    file = open(job["report"], "w")
+    json.dump(report, file)
+    file.close()
+
+def loadPreview(job, filepath):
+    if job["previews"] is None:
+        return None
+    path = Preview.previewPath(job["root"], filepath, job["previews"])
+    if not os.path.isfile(path):
+        return None
+    return np.load(path)
+
+def importFile(filepath, options, collections = None, preview = None):
+    # with a collections list, the file is imported as an asset collection and appended to it
+    ext = os.path.splitext(filepath)[1].upper()
+    category, name = OPERATORS[ext].split(".")
+    operator = getattr(getattr(bpy.ops, category), name)
+    importer = lambda path: operator(filepath=path, **options.get(ext[1:], {}))
+    start = time.perf_counter()
+    # assets without preview are listed in the report, None outside of library mode
+    previewed = None
+    try:
+        if collections is None:
+            result = importer(filepath)
+        else:
+            collection, result, previewed = Library.importAsset(filepath, importer, preview)
+            collections.append(collection)
+    except Exception:
+        return {"filepath": filepath, "status": "failed", "seconds": time.perf_counter() - start, "error": traceback.format_exc(), "preview": previewed}
+    if "FINISHED" not in result:
+        return {"filepath": filepath, "status": "failed", "seconds": time.perf_counter() - start, "error": "operator returned "+repr(result), "preview": previewed}
+    return {"filepath": filepath, "status": "ok", "seconds": time.perf_counter() - start, "error": None, "preview": previewed}
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Build .blend files from an extracted Vagrant Story directory with several Blender instances")
+    parser.add_argument("source", help="extracted game directory")
+    parser.add_argument("output", help="output directory of .blend files")
+    parser.add_argument("--blender", default="blender", help="Blender executable")
+    parser.add_argument("--workers", type=int, default=None, help="Blender instances, all cores by default")
+    parser.add_argument("--mode", choices=["file", "zone", "library"], default="file", help="one .blend per file or per zone, or per zone asset libraries")
+    parser.add_argument("--cache", default=None, help="parse cache directory shared by workers")
+    parser.add_argument("--options", default="{}", help='operators options by format, like {"SHP": {"bool_all_seqs": true}}')
+    parser.add_argument("--timeout", type=float, default=None, help="seconds before a worker is killed")
+    args = parser.parse_args(argv)
+
+    report = run(args.source, args.output, args.blender, args.workers, args.mode, args.cache, json.loads(args.options), args.timeout)
+    failures = [path for path in report["files"] if report["files"][path]["status"] != "ok"]
+    return 1 if len(failures) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
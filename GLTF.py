@@ -0,0 +1,271 @@
+bl_info = {
+    "name": "Vagrant Story file formats Add-on",
+    "description": "Import-Export Vagrant Story file formats (WEP, SHP, SEQ, ZUD, MPD, ZND, P, FBT, FBC).",
+    "author": "Sigfrid Korobetski (LunaticChimera)",
+    "version": (2, 12),
+    "blender": (3, 2, 0),
+    "location": "File > Import-Export",
+    "category": "Import-Export",
+}
+
+# glTF 2.0 binary (.glb) export straight from parsed files, no Blender needed
+# WEP : one mesh, the 7 weapon materials are KHR_materials_variants
+# SHP : skinned mesh, with one animation per SEQ animation of the corresponding SEQ files
+# MPD : room mesh with ZND textures, translucent materials are blended
+# ARM : one mesh per minimap room, faces and edges
+# positions stay in Blender space (Z up), a root node turns them Y up, images are embedded as PNG
+#
+# usage :
+#   GLTF.exportFile("OBJ/00.SHP", "00.glb")
+# the whole game with Batch :
+#   python -m vagrant_story.Batch VS/ gltf/ --to glb
+
+import os
+import json
+import struct
+import hashlib
+
+import numpy as np
+
+from . import WEP, SHP, SEQ, MPD, ZND, ARM, Skinning, Preview, PNG
+
+
+EXTENSIONS = [".WEP", ".SHP", ".MPD", ".ARM"]
+# animations are keyed on frames like in Blender, played at the default Blender scene rate
+FPS = 24
+# -90° around X, Blender Z up to glTF Y up
+Z_UP_TO_Y_UP = [-0.7071067811865476, 0, 0, 0.7071067811865476]
+WEAPON_MATERIALS = ["Wood", "Leather", "Bronze", "Iron", "Hagane", "Silver", "Damascus"]
+
+FLOAT = 5126
+UNSIGNED_SHORT = 5123
+ARRAY_BUFFER = 34962
+NEAREST = 9728
+TRIANGLES = 4
+LINES = 1
+
+
+class GLTF:
+    def __init__(self, name):
+        self.json = {
+            "asset": {"version": "2.0", "generator": "Vagrant Story file formats Add-on"},
+            "scene": 0,
+            "scenes": [{"name": name, "nodes": [0]}],
+            "nodes": [{"name": name, "rotation": Z_UP_TO_Y_UP}],
+            "samplers": [{"magFilter": NEAREST, "minFilter": NEAREST}],
+        }
+        self.buffer = bytearray()
+        # same pixels give the same image
+        self.images = {}
+
+    def add(self, key, item):
+        items = self.json.setdefault(key, [])
+        items.append(item)
+        return len(items) - 1
+
+    def bufferView(self, datas, target = None):
+        # views are 4 bytes aligned
+        self.buffer += b"\x00" * (-len(self.buffer) % 4)
+        view = {"buffer": 0, "byteOffset": len(self.buffer), "byteLength": len(datas)}
+        if target is not None:
+            view["target"] = target
+        self.buffer += datas
+        return self.add("bufferViews", view)
+
+    def accessor(self, array, type, componentType = FLOAT, target = None, bounds = False):
+        array = np.ascontiguousarray(array, dtype=np.float32 if componentType == FLOAT else np.uint16)
+        accessor = {"bufferView": self.bufferView(array.tobytes(), target), "componentType": componentType, "count": len(array), "type": type}
+        if bounds == True:
+            # required for positions and animation times
+            columns = array.reshape(len(array), -1)
+            accessor["min"] = columns.min(axis=0).tolist()
+            accessor["max"] = columns.max(axis=0).tolist()
+        return self.add("accessors", accessor)
+
+    def node(self, node, parent = 0):
+        index = self.add("nodes", node)
+        if parent is not None:
+            self.json["nodes"][parent].setdefault("children", []).append(index)
+        return index
+
+    def texture(self, pixels):
+        # pixels are Blender pixels : (H, W, 4) floats from bottom to top
+        png = PNG.encode(np.clip(np.round(pixels[::-1] * 255), 0, 255).astype(np.uint8))
+        digest = hashlib.sha1(png).hexdigest()
+        if digest not in self.images:
+            image = self.add("images", {"bufferView": self.bufferView(png), "mimeType": "image/png"})
+            self.images[digest] = self.add("textures", {"sampler": 0, "source": image})
+        return self.images[digest]
+
+    def material(self, name, texture = None, translucent = False, color = None):
+        pbr = {"metallicFactor": 0, "roughnessFactor": 1}
+        if texture is not None:
+            pbr["baseColorTexture"] = {"index": texture}
+        if color is not None:
+            pbr["baseColorFactor"] = color
+        material = {"name": name, "pbrMetallicRoughness": pbr, "doubleSided": True}
+        if texture is not None:
+            # like imported materials : alpha cutout, or blended when translucent
+            material["alphaMode"] = "BLEND" if translucent == True else "MASK"
+        return self.add("materials", material)
+
+    def mesh(self, name, mesh, boneIndices = None, variants = None):
+        # variants are material indices, the first one is the default material
+        # one primitive per texture, vertices aren't shared between triangles so each corner keeps its UV and color
+        primitives = []
+        for m in range(0, len(mesh.textures)):
+            selected = np.nonzero(mesh.textureIndices == m)[0]
+            if len(selected) == 0:
+                continue
+            triangles = mesh.triangles[selected]
+            uvs = mesh.uvs[selected].reshape(-1, 2).copy()
+            uvs[:, 1] = 1 - uvs[:, 1]  # glTF UVs start at the top
+            attributes = {
+                "POSITION": self.accessor(mesh.positions[triangles].reshape(-1, 3), "VEC3", target=ARRAY_BUFFER, bounds=True),
+                "TEXCOORD_0": self.accessor(uvs, "VEC2", target=ARRAY_BUFFER),
+                "COLOR_0": self.accessor(mesh.colors[selected].reshape(-1, 4), "VEC4", target=ARRAY_BUFFER),
+            }
+            if boneIndices is not None:
+                # each vertex follows a single bone
+                joints = np.zeros((len(triangles) * 3, 4), dtype=np.uint16)
+                joints[:, 0] = boneIndices[triangles].reshape(-1)
+                weights = np.zeros((len(triangles) * 3, 4), dtype=np.float32)
+                weights[:, 0] = 1
+                attributes["JOINTS_0"] = self.accessor(joints, "VEC4", UNSIGNED_SHORT, ARRAY_BUFFER)
+                attributes["WEIGHTS_0"] = self.accessor(weights, "VEC4", target=ARRAY_BUFFER)
+            primitive = {"attributes": attributes, "mode": TRIANGLES}
+            if variants is None:
+                primitive["material"] = self.material(mesh.names[m], self.texture(mesh.textures[m]), mesh.translucent[m])
+            else:
+                primitive["material"] = variants[0]
+                primitive["extensions"] = {"KHR_materials_variants": {"mappings": [{"material": variants[i], "variants": [i]} for i in range(0, len(variants))]}}
+            primitives.append(primitive)
+        return self.add("meshes", {"name": name, "primitives": primitives})
+
+    def skin(self, skin, bones):
+        # joint nodes carry the bone offsets, like bones of the Blender armature
+        joints = []
+        for i in range(0, skin.numBones):
+            parent = 0 if skin.parents[i] == -1 else joints[skin.parents[i]]
+            offset = skin.offsets[i]
+            joints.append(self.node({"name": bones[i].name, "translation": offset[:3, 3].tolist(), "rotation": xyzw(Skinning.matrixToQuaternion(offset[:3, :3]))}, parent))
+        # glTF matrices are column major
+        inverses = np.transpose(skin.restInverses, (0, 2, 1)).reshape(-1, 16)
+        index = self.add("skins", {"joints": joints, "inverseBindMatrices": self.accessor(inverses, "MAT4")})
+        if len(joints) > 0:
+            self.json["skins"][index]["skeleton"] = joints[0]
+        return index, joints
+
+    def animation(self, name, skin, joints, anim):
+        channels = []
+        samplers = []
+        for i, (times, quaternions) in enumerate(skin.getTracks(anim)):
+            if i >= skin.numBones or len(times) == 0:
+                continue
+            # the animated rotation is applied after the bone offset rotation
+            rest = Skinning.matrixToQuaternion(skin.offsets[i][:3, :3])
+            rotations = Skinning.quaternionMultiply(np.broadcast_to(rest, quaternions.shape), quaternions)
+            samplers.append({
+                "input": self.accessor(np.asarray(times) / FPS, "SCALAR", bounds=True),
+                "output": self.accessor(xyzw(rotations), "VEC4"),
+                "interpolation": "LINEAR",
+            })
+            channels.append({"sampler": len(samplers) - 1, "target": {"node": joints[i], "path": "rotation"}})
+        if len(channels) > 0:
+            self.add("animations", {"name": name, "channels": channels, "samplers": samplers})
+
+    def glb(self):
+        self.buffer += b"\x00" * (-len(self.buffer) % 4)
+        self.json["buffers"] = [{"byteLength": len(self.buffer)}]
+        datas = json.dumps(self.json, separators=(",", ":")).encode("utf-8")
+        datas += b" " * (-len(datas) % 4)
+        length = 12 + 8 + len(datas) + 8 + len(self.buffer)
+        return (struct.pack("<4sII", b"glTF", 2, length)
+            + struct.pack("<I4s", len(datas), b"JSON") + datas
+            + struct.pack("<I4s", len(self.buffer), b"BIN\x00") + bytes(self.buffer))
+
+    def save(self, filepath):
+        file = open(filepath, "wb")
+        file.write(self.glb())
+        file.close()
+
+
+def xyzw(quaternions):
+    # (w, x, y, z) to glTF order
+    return np.roll(np.asarray(quaternions), -1, axis=-1).tolist()
+
+
+def fromWEP(wep):
+    gltf = GLTF(wep.name)
+    mesh = Preview.meshFromWEP(wep)
+    # every palette are material variants of the same primitive
+    variants = [gltf.material(wep.name+"_"+WEAPON_MATERIALS[i]+"_Mat", gltf.texture(Preview.textureArray(wep.tim.textures[i], wep.tim.textureWidth, wep.tim.textureHeigth)))
+        for i in range(0, len(wep.tim.textures))]
+    if len(variants) > 0:
+        gltf.json["extensionsUsed"] = ["KHR_materials_variants"]
+        gltf.json["extensions"] = {"KHR_materials_variants": {"variants": [{"name": WEAPON_MATERIALS[i]} for i in range(0, len(variants))]}}
+    else:
+        variants = None
+    gltf.node({"name": wep.name, "mesh": gltf.mesh(wep.name+"_MESH", mesh, variants=variants)})
+    return gltf
+
+def fromSHP(shp, seqs = []):
+    gltf = GLTF(shp.name)
+    skin = Skinning.Skin(shp)
+    index, joints = gltf.skin(skin, shp.bones)
+    gltf.node({"name": shp.name, "mesh": gltf.mesh(shp.name+"_MESH", Preview.meshFromSHP(shp), skin.boneIndices), "skin": index})
+    for seq in seqs:
+        for i in range(0, len(seq.animations)):
+            gltf.animation(seq.name+"_Animation_"+repr(i), skin, joints, seq.animations[i])
+    return gltf
+
+def fromMPD(mpd, znd):
+    gltf = GLTF(mpd.name)
+    gltf.node({"name": mpd.name, "mesh": gltf.mesh(mpd.name+"_MESH", Preview.meshFromMPD(mpd, znd))})
+    return gltf
+
+def fromARM(arm):
+    gltf = GLTF(arm.name)
+    material = gltf.material(arm.name+"_Mat", color=[1, 1, 1, 1])
+    for room in arm.rooms:
+        vertices = np.array(room.getVerticesForBlender(), dtype=np.float32).reshape(-1, 3)
+        primitives = []
+        triangles = Preview.triangulate(room.getFacesForBlender(), [])[0]
+        if len(triangles) > 0:
+            primitives.append({"attributes": {"POSITION": gltf.accessor(vertices[triangles].reshape(-1, 3), "VEC3", target=ARRAY_BUFFER, bounds=True)}, "mode": TRIANGLES, "material": material})
+        edges = np.array(room.getEdgesForBlender(), dtype=np.intp).reshape(-1, 2)
+        if len(edges) > 0:
+            primitives.append({"attributes": {"POSITION": gltf.accessor(vertices[edges].reshape(-1, 3), "VEC3", target=ARRAY_BUFFER, bounds=True)}, "mode": LINES, "material": material})
+        if len(primitives) > 0:
+            mesh = gltf.add("meshes", {"name": room.name+"_MESH", "primitives": primitives})
+            gltf.node({"name": room.name, "mesh": mesh})
+    return gltf
+
+def exportFile(filepath, outpath):
+    ext = os.path.splitext(filepath)[1].upper()
+    if ext == ".WEP":
+        wep = WEP.WEP()
+        wep.loadFromFile(filepath)
+        gltf = fromWEP(wep)
+    elif ext == ".SHP":
+        shp = SHP.SHP()
+        shp.loadFromFile(filepath)
+        seqs = []
+        for seqpath in SHP.findSEQs(filepath):
+            seq = SEQ.SEQ()
+            seq.loadFromFile(seqpath)
+            seqs.append(seq)
+        gltf = fromSHP(shp, seqs)
+    elif ext == ".MPD":
+        mpd = MPD.MPD()
+        mpd.loadFromFile(filepath)
+        znd = ZND.ZND()
+        znd.loadFromFile(MPD.findZND(filepath))
+        gltf = fromMPD(mpd, znd)
+    elif ext == ".ARM":
+        arm = ARM.ARM()
+        arm.loadFromFile(filepath)
+        gltf = fromARM(arm)
+    else:
+        raise ValueError("no glTF export for "+ext+" files")
+    gltf.save(outpath)
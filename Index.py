@@ -0,0 +1,255 @@
+bl_info = {
+    "name": "Vagrant Story file formats Add-on",
+    "description": "Import-Export Vagrant Story file formats (WEP, SHP, SEQ, ZUD, MPD, ZND, P, FBT, FBC).",
+    "author": "Sigfrid Korobetski (LunaticChimera)",
+    "version": (2, 12),
+    "blender": (3, 2, 0),
+    "location": "File > Import-Export",
+    "category": "Import-Export",
+}
+
+# SQLite index of an extracted Vagrant Story directory, built with header probes only, no Blender needed
+# the index file is stored at the root of the directory, importers use it to find sibling files
+#
+# usage :
+#   index = Index.AssetIndex("VS/")
+#   index.update()
+#   index.referencing("SHP", "1C.SHP")  # all ZUD using SHP 0x1C
+#   index.query("SELECT path, stats FROM files WHERE format = 'MPD'")
+
+import os
+import json
+import struct
+import sqlite3
+import hashlib
+
+try:
+    import bpy
+    from bpy.props import StringProperty
+    from bpy_extras.io_utils import ImportHelper
+except ImportError:
+    # indexing doesn't need Blender
+    bpy = None
+
+from . import VS, WEP, SHP, SEQ, ZUD, MPD, ZND, ARM, EFFECT
+
+
+if bpy is not None:
+    class BuildIndex(bpy.types.Operator, ImportHelper):
+        """Index every file of an extracted Vagrant Story directory"""
+
+        bl_idname = "import_scene.vs_index"
+        bl_label = "Index Directory"
+        filename_ext = ""
+
+        directory: bpy.props.StringProperty(default="", subtype="DIR_PATH")
+        filter_glob: bpy.props.StringProperty(default="", options={"HIDDEN"})
+
+        def execute(self, context):
+            index = AssetIndex(self.directory)
+            updated, removed = index.update()
+            self.report({"INFO"}, "Vagrant Story index : "+repr(updated)+" files updated, "+repr(removed)+" removed")
+
+            return {"FINISHED"}
+
+
+INDEX_NAME = "VS_INDEX.sqlite"
+EXTENSIONS = [".WEP", ".SHP", ".SEQ", ".ZUD", ".MPD", ".ZND", ".ARM", ".P"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, name TEXT, format TEXT, size INTEGER, mtime REAL, hash TEXT, stats TEXT);
+CREATE TABLE IF NOT EXISTS sections (path TEXT, name TEXT, offset INTEGER, length INTEGER);
+CREATE TABLE IF NOT EXISTS refs (path TEXT, kind TEXT, target TEXT);
+CREATE INDEX IF NOT EXISTS files_name ON files (name);
+CREATE INDEX IF NOT EXISTS sections_path ON sections (path);
+CREATE INDEX IF NOT EXISTS refs_path ON refs (path);
+CREATE INDEX IF NOT EXISTS refs_target ON refs (kind, target);
+"""
+
+def probe(filepath):
+    # header probe of any known format, modules are looked up when called to avoid circular imports
+    ext = os.path.splitext(filepath)[1].upper()
+    if ext == ".WEP":
+        return WEP.probe(filepath)
+    elif ext == ".SHP":
+        return SHP.probe(filepath)
+    elif ext == ".SEQ":
+        return SEQ.probe(filepath)
+    elif ext == ".ZUD":
+        return ZUD.probe(filepath)
+    elif ext == ".MPD":
+        return MPD.probe(filepath)
+    elif ext == ".ZND":
+        return ZND.probe(filepath)
+    elif ext == ".ARM":
+        return ARM.probe(filepath)
+    elif ext == ".P":
+        return EFFECT.probe(filepath)
+    return None
+
+def references(filename, infos, filenames):
+    # (kind, target file name) of the files needed by a file
+    refs = []
+    name, ext = os.path.splitext(filename)
+    if infos["format"] == "ZUD" and "idSHP" in infos:
+        refs.append(("SHP", "{:02X}.SHP".format(infos["idSHP"])))
+        if infos["idWEP"] != 0:
+            refs.append(("WEP", "{:02X}.WEP".format(infos["idWEP"])))
+        if infos["idWEP2"] != 0:
+            refs.append(("SHIELD", "{:02X}.WEP".format(infos["idWEP2"])))
+    elif infos["format"] == "MPD":
+        # http://datacrystal.romhacking.net/wiki/Vagrant_Story:rooms_list
+        refs.append(("ZND", VS.MDPToZND(filename)))
+    elif infos["format"] == "SEQ":
+        refs.append(("SHP", filename.split("_")[0]+".SHP"))
+    elif infos["format"] == "SHP":
+        for seqpath in SHP.SEQ_SUFFIXES:
+            if name+seqpath in filenames:
+                refs.append(("SEQ", name+seqpath))
+    elif infos["format"] == "P":
+        # FBC and FBT aren't indexed alone, effects keep them as references
+        for sibling in sorted(filenames):
+            if sibling.startswith(name+"_") and (sibling.endswith(".FBC") or sibling.endswith(".FBT")):
+                refs.append((sibling[-3:], sibling))
+    return refs
+
+def fileHash(filepath):
+    sha1 = hashlib.sha1()
+    file = open(filepath, "rb")
+    for chunk in iter(lambda: file.read(1 << 20), b""):
+        sha1.update(chunk)
+    file.close()
+    return sha1.hexdigest()
+
+
+class AssetIndex:
+    def __init__(self, root, dbpath = None):
+        self.root = os.path.abspath(root)
+        self.dbpath = dbpath
+        if self.dbpath is None:
+            self.dbpath = os.path.join(self.root, INDEX_NAME)
+        self.db = sqlite3.connect(self.dbpath)
+        self.db.executescript(SCHEMA)
+
+    def __repr__(self):
+        return "(--Vagrant Story Index-- | root : "+repr(self.root)+")"
+
+    def close(self):
+        self.db.close()
+
+    def relative(self, filepath):
+        return os.path.relpath(os.path.abspath(filepath), self.root).replace(os.sep, "/")
+
+    def absolute(self, path):
+        return os.path.join(self.root, path.replace("/", os.sep))
+
+    def update(self):
+        # only new or modified files (size or mtime) are probed again, removed files are forgotten
+        known = {}
+        for path, size, mtime in self.db.execute("SELECT path, size, mtime FROM files"):
+            known[path] = (size, mtime)
+        seen = set()
+        updated = 0
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames.sort()
+            filenames = set(filenames)
+            for filename in sorted(filenames):
+                if os.path.splitext(filename)[1].upper() not in EXTENSIONS:
+                    continue
+                filepath = os.path.join(dirpath, filename)
+                path = self.relative(filepath)
+                stat = os.stat(filepath)
+                seen.add(path)
+                if known.get(path) == (stat.st_size, stat.st_mtime):
+                    continue
+                self.add(path, filepath, stat, filenames)
+                updated += 1
+        removed = [path for path in known if path not in seen]
+        for path in removed:
+            self.remove(path)
+        self.db.commit()
+        # this index can now cover directories that were found under an other index
+        indexes.clear()
+        return updated, len(removed)
+
+    def add(self, path, filepath, stat, filenames):
+        try:
+            infos = probe(filepath)
+        except (struct.error, OSError, ValueError) as error:
+            # truncated or unknown datas, we keep the file but without stats
+            infos = {"format": os.path.splitext(filepath)[1].upper()[1:], "error": repr(error)}
+        self.remove(path)
+        self.db.execute("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", (
+            path, os.path.basename(filepath).upper(), infos["format"], stat.st_size, stat.st_mtime, fileHash(filepath), json.dumps(infos)
+        ))
+        lengths = infos.get("sections", {})
+        offsets = infos.get("offsets", {})
+        for name in lengths:
+            self.db.execute("INSERT INTO sections VALUES (?, ?, ?, ?)", (path, name, offsets.get(name), lengths[name]))
+        for kind, target in references(os.path.basename(filepath), infos, filenames):
+            self.db.execute("INSERT INTO refs VALUES (?, ?, ?)", (path, kind, target.upper()))
+
+    def remove(self, path):
+        self.db.execute("DELETE FROM files WHERE path = ?", (path,))
+        self.db.execute("DELETE FROM sections WHERE path = ?", (path,))
+        self.db.execute("DELETE FROM refs WHERE path = ?", (path,))
+
+    def query(self, sql, parameters = ()):
+        return self.db.execute(sql, parameters).fetchall()
+
+    def infos(self, filepath):
+        row = self.db.execute("SELECT stats FROM files WHERE path = ?", (self.relative(filepath),)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def find(self, filename):
+        # every indexed file with this name, wherever it is
+        return [self.absolute(path) for (path,) in self.db.execute("SELECT path FROM files WHERE name = ? ORDER BY path", (filename.upper(),))]
+
+    def contains(self, filepath):
+        path = self.relative(filepath)
+        if self.db.execute("SELECT 1 FROM files WHERE path = ?", (path,)).fetchone() is not None:
+            return True
+        # FBC and FBT are only known as effects references
+        directory = os.path.dirname(path)
+        for (source,) in self.db.execute("SELECT path FROM refs WHERE target = ?", (os.path.basename(path).upper(),)):
+            if os.path.dirname(source) == directory:
+                return True
+        return False
+
+    def references(self, filepath):
+        return self.db.execute("SELECT kind, target FROM refs WHERE path = ?", (self.relative(filepath),)).fetchall()
+
+    def referencing(self, kind, target):
+        # files referencing a target, like all ZUD using a SHP : referencing("SHP", "1C.SHP")
+        return [self.absolute(path) for (path,) in self.db.execute("SELECT path FROM refs WHERE kind = ? AND target = ? ORDER BY path", (kind, target.upper()))]
+
+
+# index covering each indexed directory and opened indexes by root
+# directories without an index aren't remembered, an index can be built later in the session
+indexes = {}
+roots = {}
+
+def forFile(filepath):
+    directory = os.path.dirname(os.path.abspath(filepath))
+    if directory not in indexes:
+        parent = directory
+        while True:
+            if os.path.isfile(os.path.join(parent, INDEX_NAME)):
+                if parent not in roots:
+                    roots[parent] = AssetIndex(parent)
+                indexes[directory] = roots[parent]
+                break
+            if os.path.dirname(parent) == parent:
+                return None
+            parent = os.path.dirname(parent)
+    return indexes[directory]
+
+def isfile(filepath):
+    # importers ask the index when the directory is indexed, the file system otherwise
+    # files the index doesn't know are looked up on the disk too, the index can be older than the directory
+    index = forFile(filepath)
+    if index is not None and index.contains(filepath):
+        return True
+    return os.path.isfile(filepath)
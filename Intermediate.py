@@ -0,0 +1,481 @@
+bl_info = {
+    "name": "Vagrant Story file formats Add-on",
+    "description": "Import-Export Vagrant Story file formats (WEP, SHP, SEQ, ZUD, MPD, ZND, P, FBT, FBC).",
+    "author": "Sigfrid Korobetski (LunaticChimera)",
+    "version": (2, 12),
+    "blender": (3, 2, 0),
+    "location": "File > Import-Export",
+    "category": "Import-Export",
+}
+
+# converted assets as plain arrays in an uncompressed .npz, one file per WEP, SHP, ZUD, SEQ or MPD
+# loading maps the file in memory, there is nothing to parse, and Blender datas are built with foreach_set
+# the game files aren't needed anymore once assets are converted
+# it is also the disk cache format, importers build cached assets with build (see cached)
+#
+# members :
+#   header       JSON (uint8) : kind, name, materials, bones, vertex groups, animations...
+#   positions    (V, 3) float32, Blender space
+#   loops        (L,) int32, vertex index of each face corner
+#   faceSizes    (F,) uint8, 3 or 4 corners, faces follow each other in loops
+#   uvs          (L, 2) float32, 0 to 1
+#   colors       (L, 4) uint8, only when the asset has vertex colors
+#   materials    (F,) uint16, index in header materials
+#   layer_xxx    (F,) int32, polygon int layers (WEP side and flag)
+#   vertexGroups (V,) int32, index in header vertexGroups
+#   textures     (M, H, W) uint8, palette indexes, rows from bottom to top like Blender pixels
+#   palettes     (P, C, 4) uint8, RGBA colors, a material is a texture and a palette
+#   boneParents  (B,) int32, -1 for the root bone
+#   boneHeads, boneTails (B, 3) float32, edit bones placed like SHP.buildGeometry
+#   keys         (K, 4) float32, absolute rotation keys [frame, rx, ry, rz] in radians, see SEQ.Anim.rotationKeys
+#   tracks       (N, 4) int32, [animation, bone, first key, number of keys]
+#
+# usage :
+#   Intermediate.convertFile("OBJ/00.SHP", "00.SHP.arrays.npz")
+# the whole game with Batch :
+#   python -m vagrant_story.Batch VS/ converted/ --to arrays
+
+import os
+import json
+import mmap
+import struct
+import zipfile
+
+try:
+    import bpy
+    from bpy_extras.io_utils import ImportHelper
+except ImportError:
+    # conversion doesn't need Blender
+    bpy = None
+
+import numpy as np
+
+from . import VS, WEP, SHP, SEQ, ZUD, MPD, ZND, Skinning, Textures, Cache
+
+
+EXTENSIONS = [".WEP", ".SHP", ".ZUD", ".SEQ", ".MPD"]
+VERSION = 1
+WEAPON_MATERIALS = ["Wood", "Leather", "Bronze", "Iron", "Hagane", "Silver", "Damascus"]
+
+
+if bpy is not None:
+    class Import(bpy.types.Operator, ImportHelper):
+        """Load a converted Vagrant Story asset"""
+
+        bl_idname = "import_mesh.vs_arrays"
+        bl_label = "Import converted asset"
+        filename_ext = ".npz"
+
+        filepath: bpy.props.StringProperty(default="", subtype="FILE_PATH")
+        filter_glob: bpy.props.StringProperty(default="*.npz", options={"HIDDEN"})
+        bool_all_anims: bpy.props.BoolProperty(
+            name="Build all animations",
+            description="Build an action for every animation, otherwise only the first one is built",
+            default=False,
+        )
+
+        def execute(self, context):
+            keywords = self.as_keywords(ignore=("axis_forward", "axis_up", "filter_glob"))
+            return BlenderImport(self, context, **keywords)
+
+
+def BlenderImport(operator, context, filepath, bool_all_anims = False):
+    header, arrays = load(filepath)
+    build(header, arrays, bool_all_anims)
+    return {"FINISHED"}
+
+
+def save(filepath, header, arrays):
+    # uncompressed, so load can map members in place
+    members = {"header": np.frombuffer(json.dumps(header).encode("utf-8"), dtype=np.uint8)}
+    members.update(arrays)
+    temp = filepath+"."+repr(os.getpid())+".tmp"
+    file = open(temp, "wb")
+    np.savez(file, **members)
+    file.close()
+    os.replace(temp, filepath)
+
+def load(filepath):
+    # (header, {name: array}), arrays are read only views of the mapped file
+    # np.load ignores mmap_mode for .npz, so we find each .npy member in the zip ourselves
+    file = open(filepath, "rb")
+    datas = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    archive = zipfile.ZipFile(file)
+    arrays = {}
+    for info in archive.infolist():
+        name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+        if info.compress_type != zipfile.ZIP_STORED:
+            # written by np.savez_compressed or another tool, we can only decompress it
+            member = archive.open(info)
+            arrays[name] = np.load(member)
+            member.close()
+            continue
+        # local file header : 30 bytes then the file name and the extra field
+        nameLength, extraLength = struct.unpack("<2H", datas[info.header_offset + 26:info.header_offset + 30])
+        file.seek(info.header_offset + 30 + nameLength + extraLength)
+        version = np.lib.format.read_magic(file)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(file)
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(file)
+        count = int(np.prod(shape))
+        array = np.frombuffer(datas, dtype=dtype, count=count, offset=file.tell()) if count > 0 else np.empty(0, dtype=dtype)
+        arrays[name] = array.reshape(shape[::-1]).T if fortran else array.reshape(shape)
+    archive.close()
+    file.close()
+    header = json.loads(bytes(arrays.pop("header")).decode("utf-8"))
+    return header, arrays
+
+
+def cached(kind, filepaths, convert):
+    # (header, arrays) of the asset converted from filepaths, from the disk cache when enabled
+    # convert() parses and converts on a miss, the result is then stored
+    path = Cache.assetPath(kind, filepaths, VERSION)
+    if path is not None and os.path.isfile(path):
+        try:
+            header, arrays = load(path)
+            # most recently used
+            os.utime(path)
+            return header, arrays
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            # broken entry, we convert again
+            pass
+    header, arrays = convert()
+    if path is not None:
+        save(path, header, arrays)
+        Cache.evict()
+    return header, arrays
+
+
+def asset(kind, name):
+    return {"kind": kind, "name": name, "version": VERSION, "materials": [], "vertexGroups": [], "bones": [], "animations": []}
+
+def geometry(vertices, faces, uvs, colors = None):
+    arrays = {
+        "positions": np.array(vertices, dtype=np.float32).reshape(-1, 3),
+        "loops": np.array([index for face in faces for index in face], dtype=np.int32),
+        "faceSizes": np.array([len(face) for face in faces], dtype=np.uint8),
+        "uvs": np.asarray(uvs, dtype=np.float32).reshape(-1, 2),
+    }
+    if colors is not None:
+        arrays["colors"] = np.array([col.toRGBA() for col in colors], dtype=np.uint8).reshape(-1, 4)
+    arrays["materials"] = np.zeros(len(faces), dtype=np.uint16)
+    return arrays
+
+def animations(header, seqs):
+    keys = []
+    tracks = []
+    for seq in seqs:
+        for i in range(0, len(seq.animations)):
+            anim = seq.animations[i]
+            for bone in range(0, min(anim.numBones, len(anim.rotationKeysPerBone))):
+                boneKeys = anim.rotationKeys(bone)
+                tracks.append([len(header["animations"]), bone, len(keys), len(boneKeys)])
+                keys.extend(boneKeys)
+            header["animations"].append({"name": seq.name+"_Animation_"+repr(i), "length": anim.length})
+    return {"keys": np.array(keys, dtype=np.float32).reshape(-1, 4), "tracks": np.array(tracks, dtype=np.int32).reshape(-1, 4)}
+
+
+def fromWEP(wep):
+    header = asset("WEP", wep.name)
+    width, height = wep.tim.textureWidth, wep.tim.textureHeigth
+    uvs = np.array(wep.getUVsForBlender(), dtype=np.float32).reshape(-1, 2) / [width - 1, height - 1]
+    arrays = geometry(wep.getVerticesForBlender(), wep.getFacesForBlender(), uvs)
+    arrays["layer_side"] = np.array([face.side for face in wep.faces], dtype=np.int32)
+    arrays["layer_flag"] = np.array([face.flag for face in wep.faces], dtype=np.int32)
+    arrays["textures"] = Textures.weaponIndices(wep.tim)[None]
+    arrays["palettes"] = Textures.palettes(wep.tim.palletColors)
+    for i in range(0, len(wep.tim.palletColors)):
+        header["materials"].append({"name": wep.name+"_"+WEAPON_MATERIALS[i]+"_Mat", "image": wep.name+"_"+WEAPON_MATERIALS[i]+"_Tex",
+            "texture": 0, "palette": i, "blend": "CLIP", "vertexColors": False, "backfaceCulling": False})
+    header["rotations"] = [list(rotation[:3]) for rotation in wep.rotations]
+    return header, arrays
+
+def fromSHP(shp, seqs = [], kind = "SHP"):
+    header = asset(kind, shp.name)
+    width, height = shp.tim.textureWidth, shp.tim.textureHeigth
+    if shp.name == "50":
+        # same special case as SHP.buildGeometry
+        width = height = 256
+    uvs = np.array(shp.getUVsForBlender(), dtype=np.float32).reshape(-1, 2) / [width - 1, height - 1]
+    arrays = geometry(shp.getVerticesForBlender(), shp.getFacesForBlender(), uvs, shp.getVColForBlender() if shp.hasColoredVertex == True else None)
+    if len(shp.tim.cluts) > 0:
+        arrays["textures"] = Textures.timIndices(shp.tim)[None]
+        arrays["palettes"] = Textures.palettes(shp.tim.palletColors)
+        for i in range(0, len(shp.tim.palletColors)):
+            header["materials"].append({"name": shp.name+"_Mat"+repr(i), "image": shp.name+"_Tex"+repr(i),
+                "texture": 0, "palette": i, "blend": "CLIP", "vertexColors": shp.hasColoredVertex, "backfaceCulling": False})
+
+    # bones and their vertex group
+    skin = Skinning.Skin(shp)
+    arrays["vertexGroups"] = skin.boneIndices.astype(np.int32)
+    header["vertexGroups"] = [bone.name for bone in shp.bones]
+    arrays["boneParents"] = np.array(skin.parents, dtype=np.int32)
+    arrays["boneHeads"] = skin.restMatrices[:, :3, 3].astype(np.float32)
+    heads = arrays["boneHeads"]
+    tails = np.zeros_like(heads)
+    for bone in shp.bones:
+        if bone.parent is None:
+            tails[bone.index] = (0, 0.0001, 0)
+        else:
+            tails[bone.index] = (heads[bone.index][0], 0, bone.length / VS.VERTEX_RATIO / 10)
+    arrays["boneTails"] = tails
+    header["bones"] = [{"name": bone.name, "mountId": bone.mountId, "bodyPartId": bone.bodyPartId, "mode": bone.mode, "unk": list(bone.unk)} for bone in shp.bones]
+    arrays.update(animations(header, seqs))
+    return header, arrays
+
+def fromZUD(zud):
+    # the unit body and its embedded SEQ, weapons and shields are their own WEP assets
+    seqs = [seq for seq in [zud.commonSeq, zud.battleSeq] if seq is not None]
+    header, arrays = fromSHP(zud.shp, seqs, "ZUD")
+    header["name"] = zud.name
+    return header, arrays
+
+def fromSEQ(seq):
+    header = asset("SEQ", seq.name)
+    return header, animations(header, [seq])
+
+def fromMPD(mpd, znd):
+    header = asset("MPD", mpd.name)
+    room = mpd.room
+    room.blenderize()
+    uvs = np.array(room.blender.uvs, dtype=np.float32).reshape(-1, 2) / 256
+    arrays = geometry(room.blender.vertices, room.blender.faces, uvs, room.blender.colors)
+    arrays["materials"] = np.array([room.materialRefs.index(ref) for ref in room.blender.matrefs], dtype=np.uint16)
+
+    # each texture page and each CLUT once, materials are pairs of them
+    pages = []
+    cluts = []
+    for ref in room.materialRefs:
+        sided = False
+        translucent = False
+        # like MPD.buildGeometry, the last group using the ref decides
+        for group in room.groups:
+            if ref in group.materialRefs:
+                sided = group.materialSided[group.materialRefs.index(ref)] == True
+                translucent = group.materialTrans[group.materialRefs.index(ref)] == True
+        textureId, clutId = [int(id) for id in ref.split("@")]
+        if textureId not in pages:
+            pages.append(textureId)
+        if (clutId, translucent) not in cluts:
+            cluts.append((clutId, translucent))
+        header["materials"].append({"name": ref+"_MAT", "image": ref+"_TEX", "texture": pages.index(textureId), "palette": cluts.index((clutId, translucent)),
+            "blend": "HASHED", "vertexColors": True, "backfaceCulling": sided == False, "translucent": translucent})
+    if len(pages) > 0:
+        arrays["textures"] = np.stack([Textures.pageIndices(znd.getTIM(textureId)) for textureId in pages])
+        arrays["palettes"] = np.stack([Textures.clutColors(znd, clutId, translucent) for clutId, translucent in cluts])
+    header["textureIds"] = pages
+    header["clutIds"] = [clutId for clutId, translucent in cluts]
+
+    # room groups, faces don't share their vertices
+    counts = [sum([4 if face.quad == True else 3 for face in group.faces]) for group in room.groups]
+    arrays["vertexGroups"] = np.repeat(np.arange(0, len(counts), dtype=np.int32), counts)
+    header["vertexGroups"] = [group.name for group in room.groups]
+    return header, arrays
+
+def loadSEQs(filepaths):
+    seqs = []
+    for filepath in filepaths:
+        seq = SEQ.SEQ()
+        seq.loadFromFile(filepath)
+        seqs.append(seq)
+    return seqs
+
+def convertFile(filepath, outpath):
+    # the disk cache is used when enabled, WEP and MPD entries are the ones importers use
+    ext = os.path.splitext(filepath)[1].upper()
+    if ext == ".WEP":
+        header, arrays = cached("WEP", [filepath], lambda: fromWEP(WEP.load(filepath)))
+    elif ext == ".SHP":
+        seqfilepaths = SHP.findSEQs(filepath)
+        # with its animations, so it isn't the entry SHP importers use
+        header, arrays = cached("SHP_SEQ", [filepath] + seqfilepaths, lambda: fromSHP(SHP.load(filepath), loadSEQs(seqfilepaths)))
+    elif ext == ".ZUD":
+        header, arrays = cached("ZUD", [filepath], lambda: fromZUD(ZUD.load(filepath)))
+    elif ext == ".SEQ":
+        header, arrays = cached("SEQ", [filepath], lambda: fromSEQ(loadSEQs([filepath])[0]))
+    elif ext == ".MPD":
+        zndfilepath = MPD.findZND(filepath)
+        header, arrays = cached("MPD", [filepath, zndfilepath], lambda: fromMPD(MPD.load(filepath), ZND.load(zndfilepath)))
+    else:
+        raise ValueError("no converted asset for "+ext+" files")
+    header["source"] = os.path.basename(filepath)
+    save(outpath, header, arrays)
+    return header
+
+
+# Blender side, everything below only reads arrays
+
+def buildImage(name, indices, palette):
+    height, width = indices.shape
+    return Textures.newImage(name, width, height, palette[indices].astype(np.float32) / 255, indices, palette)
+
+def buildMaterial(material, arrays, images):
+    mat = bpy.data.materials.new(name=material["name"])
+    mat.use_nodes = True
+    mat.blend_method = material["blend"]
+    mat.use_backface_culling = material["backfaceCulling"]
+    bsdf = mat.node_tree.nodes["Principled BSDF"]
+    bsdf.inputs["Specular"].default_value = 0
+    bsdf.inputs["Metallic"].default_value = 0
+    if "textures" not in arrays:
+        return mat
+    # materials using the same texture and palette share the image
+    key = (material["texture"], material["palette"])
+    if key not in images:
+        images[key] = buildImage(material["image"], arrays["textures"][material["texture"]], arrays["palettes"][material["palette"]])
+    texImage = mat.node_tree.nodes.new("ShaderNodeTexImage")
+    texImage.image = images[key]
+    texImage.interpolation = "Closest"  # texture filter
+    if material["vertexColors"] == True:
+        vc = mat.node_tree.nodes.new("ShaderNodeVertexColor")
+        mix = mat.node_tree.nodes.new("ShaderNodeMixRGB")
+        mix.blend_type = "MULTIPLY"
+        mix.inputs[0].default_value = 1
+        mat.node_tree.links.new(mix.inputs[1], vc.outputs["Color"])
+        mat.node_tree.links.new(mix.inputs[2], texImage.outputs["Color"])
+        mat.node_tree.links.new(bsdf.inputs["Base Color"], mix.outputs["Color"])
+    else:
+        mat.node_tree.links.new(bsdf.inputs["Base Color"], texImage.outputs["Color"])
+    # to handle alpha cutout
+    mat.node_tree.links.new(bsdf.inputs["Alpha"], texImage.outputs["Alpha"])
+    return mat
+
+def buildMesh(name, header, arrays):
+    blender_mesh = bpy.data.meshes.new(name=name)
+    sizes = arrays["faceSizes"].astype(np.int32)
+    blender_mesh.vertices.add(len(arrays["positions"]))
+    blender_mesh.vertices.foreach_set("co", np.ascontiguousarray(arrays["positions"], dtype=np.float32).ravel())
+    blender_mesh.loops.add(len(arrays["loops"]))
+    blender_mesh.loops.foreach_set("vertex_index", np.ascontiguousarray(arrays["loops"], dtype=np.int32))
+    blender_mesh.polygons.add(len(sizes))
+    blender_mesh.polygons.foreach_set("loop_start", np.cumsum(sizes, dtype=np.int32) - sizes)
+    if bpy.app.version < (3, 6, 0):
+        # read only since 3.6, computed from loop starts
+        blender_mesh.polygons.foreach_set("loop_total", sizes)
+    blender_mesh.polygons.foreach_set("material_index", arrays["materials"].astype(np.int32))
+    for key in arrays:
+        if key.startswith("layer_"):
+            layer = blender_mesh.polygon_layers_int.new(name=key[6:])
+            layer.data.foreach_set("value", np.ascontiguousarray(arrays[key], dtype=np.int32))
+
+    uvlayer = blender_mesh.uv_layers.new()
+    uvlayer.data.foreach_set("uv", np.ascontiguousarray(arrays["uvs"], dtype=np.float32).ravel())
+    if "colors" in arrays:
+        vcol_layer = blender_mesh.vertex_colors.new()
+        vcol_layer.data.foreach_set("color", (arrays["colors"].astype(np.float32) / 255).ravel())
+
+    images = {}
+    for material in header["materials"]:
+        blender_mesh.materials.append(buildMaterial(material, arrays, images))
+    blender_mesh.validate()
+    blender_mesh.update()
+    return blender_mesh
+
+def buildArmature(header, arrays, view_layer):
+    armature = bpy.data.armatures.new("Armature")
+    arm_obj = bpy.data.objects.new(header["name"], armature)
+    view_layer.active_layer_collection.collection.objects.link(arm_obj)
+    view_layer.objects.active = arm_obj
+    bpy.ops.object.mode_set(mode="EDIT", toggle=False)
+    edit_bones = armature.edit_bones
+    parents = arrays["boneParents"]
+    for i in range(0, len(header["bones"])):
+        bone = header["bones"][i]
+        blender_bone = edit_bones.new(bone["name"])
+        blender_bone.use_relative_parent = False
+        blender_bone.use_inherit_rotation = True
+        blender_bone.use_local_location = True
+        blender_bone.datas.mountId = bone["mountId"]
+        blender_bone.datas.bodyPartId = bone["bodyPartId"]
+        blender_bone.datas.mode = bone["mode"]
+        blender_bone.datas.unk = bone["unk"]
+        if parents[i] != -1:
+            blender_bone.parent = edit_bones[header["bones"][parents[i]]["name"]]
+        blender_bone.head = arrays["boneHeads"][i].tolist()
+        blender_bone.tail = arrays["boneTails"][i].tolist()
+    bpy.ops.object.mode_set(mode="OBJECT")
+    return arm_obj
+
+def buildAction(arm_obj, header, arrays, index):
+    # rotation keys become quaternion fcurves, like SEQ.Anim.build without decimation
+    action = bpy.data.actions.new(name=header["animations"][index]["name"])
+    keys = arrays["keys"]
+    for animation, bone, start, count in arrays["tracks"]:
+        name = "bone_"+repr(int(bone))
+        if animation != index or count == 0 or name not in arm_obj.pose.bones:
+            continue
+        boneKeys = np.asarray(keys[start:start + count], dtype=np.float64)
+        quaternions = Skinning.eulerToQuaternion(boneKeys[:, 1], boneKeys[:, 2], boneKeys[:, 3])
+        arm_obj.pose.bones[name].rotation_mode = "QUATERNION"
+        points = np.empty((count, 2), dtype=np.float32)
+        points[:, 0] = boneKeys[:, 0]
+        for c in range(0, 4):
+            fcurve = action.fcurves.new('pose.bones["'+name+'"].rotation_quaternion', index=c, action_group=name)
+            fcurve.keyframe_points.add(int(count))
+            points[:, 1] = quaternions[:, c]
+            fcurve.keyframe_points.foreach_set("co", points.ravel())
+            fcurve.update()
+    return action
+
+def buildWeaponPalettes(header, arrays, blender_mesh):
+    # like WEP.buildGeometry, palettes are kept for export, handle colors are the first third of every palette
+    if "palettes" not in arrays or len(arrays["palettes"]) == 0:
+        return
+    palettes = arrays["palettes"].astype(np.float32) / 255
+    handles = palettes.shape[1] // 3
+    common = bpy.data.palettes.new(name=header["name"]+".WEP_Common_Palette")
+    for col in palettes[0, 0:handles]:
+        common.colors.new().color = col[0:3]
+    for i in range(0, len(palettes)):
+        palette = bpy.data.palettes.new(name=header["name"]+".WEP_"+WEAPON_MATERIALS[i]+"_Palette")
+        for col in palettes[i, handles:]:
+            palette.colors.new().color = col[0:3]
+        blender_mesh.materials[i].palette.ref = palette.name
+
+def build(header, arrays, bool_all_anims = False):
+    view_layer = bpy.context.view_layer
+    collection = view_layer.active_layer_collection.collection
+    name = header["name"]
+
+    arm_obj = None
+    if len(header["bones"]) > 0:
+        arm_obj = buildArmature(header, arrays, view_layer)
+    blender_obj = None
+    if "positions" in arrays:
+        blender_mesh = buildMesh(name+"_MESH", header, arrays)
+        if header["kind"] == "WEP":
+            blender_mesh.datas.rots0, blender_mesh.datas.rots1, blender_mesh.datas.rots2 = header["rotations"]
+            buildWeaponPalettes(header, arrays, blender_mesh)
+        blender_obj = bpy.data.objects.new(name, object_data=blender_mesh)
+        collection.objects.link(blender_obj)
+        # vertex groups, one add call per group
+        groups = arrays.get("vertexGroups")
+        if groups is not None:
+            order = np.argsort(groups, kind="stable")
+            starts = np.searchsorted(groups[order], np.arange(0, len(header["vertexGroups"]) + 1))
+            for i in range(0, len(header["vertexGroups"])):
+                blender_group = blender_obj.vertex_groups.new(name=header["vertexGroups"][i])
+                blender_group.add(order[starts[i]:starts[i + 1]].tolist(), 1, "REPLACE")
+                blender_group.lock_weight = arm_obj is not None
+        if arm_obj is not None:
+            blender_obj.parent = arm_obj
+            modifier = blender_obj.modifiers.new(type="ARMATURE", name="Armature")
+            modifier.object = arm_obj
+        blender_obj.select_set(True)
+        view_layer.objects.active = blender_obj
+
+    if arm_obj is None and len(header["animations"]) > 0:
+        # a SEQ alone is applied on the active armature
+        active = view_layer.objects.active
+        if active is not None and active.type == "ARMATURE":
+            arm_obj = active
+        elif active is not None and active.parent is not None and active.parent.type == "ARMATURE":
+            arm_obj = active.parent
+    if arm_obj is not None and len(header["animations"]) > 0:
+        arm_obj.animation_data_create()
+        actions = []
+        for i in range(0, len(header["animations"]) if bool_all_anims == True else 1):
+            actions.append(buildAction(arm_obj, header, arrays, i))
+        arm_obj.animation_data.action = actions[0]
+    return blender_obj, arm_obj
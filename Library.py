@@ -0,0 +1,117 @@
+bl_info = {
+    "name": "Vagrant Story file formats Add-on",
+    "description": "Import-Export Vagrant Story file formats (WEP, SHP, SEQ, ZUD, MPD, ZND, P, FBT, FBC).",
+    "author": "Sigfrid Korobetski (LunaticChimera)",
+    "version": (2, 12),
+    "blender": (3, 2, 0),
+    "location": "File > Import-Export",
+    "category": "Import-Export",
+}
+
+# per zone .blend asset libraries, imported files become marked collection assets
+# rooms of a zone are grouped in ZONExxx.blend, enemies in ZUD.blend, weapons in WEP.blend...
+# artists link or append assets from the Asset Browser instead of importing game files again
+#
+# libraries are built by Farm workers :
+#   python -m vagrant_story.Farm VS/ library/ --mode library --blender /opt/blender/blender
+# then add the library/ directory in Preferences > File Paths > Asset Libraries
+# WEP, SHP, ZUD and MPD previews are rendered by Preview, before Blender starts or when the asset is imported, other assets (P, ARM) have none
+# asset_generate_preview isn't used, it renders later in a timer and background Blender saves the library before
+
+import os
+import uuid
+
+import numpy as np
+
+try:
+    import bpy
+except ImportError:
+    # catalogs can be written without Blender
+    bpy = None
+
+from . import VS, Preview
+
+
+CATALOGS_NAME = "blender_assets.cats.txt"
+# catalog path of each format
+CATALOGS = {
+    ".MPD": "Vagrant Story/Rooms",
+    ".ZUD": "Vagrant Story/Units",
+    ".SHP": "Vagrant Story/Characters",
+    ".WEP": "Vagrant Story/Weapons",
+    ".ARM": "Vagrant Story/Maps",
+    ".P": "Vagrant Story/Effects",
+}
+
+def catalogId(path):
+    # stable ids, libraries built by different workers or different runs share the same catalogs
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, "vagrant-story:"+path))
+
+def writeCatalogs(directory):
+    file = open(os.path.join(directory, CATALOGS_NAME), "w")
+    file.write("# Vagrant Story asset catalogs\nVERSION 1\n\n")
+    parents = set()
+    for path in sorted(CATALOGS.values()):
+        parent = path.split("/")[0]
+        if parent not in parents:
+            parents.add(parent)
+            file.write(catalogId(parent)+":"+parent+":"+parent+"\n")
+        file.write(catalogId(path)+":"+path+":"+path.replace("/", "-")+"\n")
+    file.close()
+
+
+def importAsset(filepath, importer, preview = None):
+    # importer is called with the file path, every object it creates is gathered in a new collection
+    # preview is an array already rendered by Preview, returns the collection, the importer result and if a preview was attached
+    name = VS.displayName(filepath)
+    ext = os.path.splitext(filepath)[1].upper()
+    view_layer = bpy.context.view_layer
+    collection = bpy.data.collections.new(name)
+    bpy.context.scene.collection.children.link(collection)
+    view_layer.active_layer_collection = view_layer.layer_collection.children[collection.name]
+
+    before = set(bpy.data.objects)
+    result = importer(filepath)
+    for obj in set(bpy.data.objects) - before:
+        # some importers link helper objects (collisions...) in the scene collection
+        if obj.name not in collection.objects:
+            collection.objects.link(obj)
+        for other in obj.users_collection:
+            if other != collection:
+                other.objects.unlink(obj)
+
+    collection.asset_mark()
+    collection.asset_data.description = os.path.basename(filepath)
+    collection.asset_data.author = "Squaresoft"
+    collection.asset_data.tags.new(ext[1:])
+    if ext in CATALOGS:
+        collection.asset_data.catalog_id = catalogId(CATALOGS[ext])
+    if preview is None and ext in Preview.EXTENSIONS:
+        try:
+            preview = Preview.renderFile(filepath)
+        except Exception:
+            # the asset is still usable, Farm reports it without preview
+            preview = None
+    return collection, result, generatePreview(collection, preview)
+
+def generatePreview(collection, preview = None):
+    # preview is a (height, width, 4) array from Preview, uint8 or float, returns False when there is none to attach
+    if preview is None:
+        return False
+    preview = np.asarray(preview)
+    if preview.dtype == np.uint8:
+        preview = preview.astype(np.float32) / 255
+    height, width = preview.shape[0], preview.shape[1]
+    image = collection.preview_ensure()
+    image.image_size = (width, height)
+    image.image_pixels_float.foreach_set(np.asarray(preview, dtype=np.float32).ravel())
+    return True
+
+def write(filepath, collections):
+    # generated images would be lost in the library, we pack them
+    for image in bpy.data.images:
+        if image.packed_file is None and image.source == "GENERATED":
+            image.pack()
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    # collections and everything they use (objects, meshes, armatures, actions, materials, images)
+    bpy.data.libraries.write(filepath, set(collections), fake_user=True, compress=True)
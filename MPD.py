@@ -10,42 +10,61 @@ bl_info = {
 
 #http://datacrystal.romhacking.net/wiki/Vagrant_Story:MPD_files
 
+import os
 import struct
 from enum import Enum
 
-import bpy
 import math
 
-import bmesh
-from bpy.props import BoolProperty, EnumProperty, FloatProperty, StringProperty
-from bpy_extras.io_utils import ExportHelper, ImportHelper
-
-from . import GroupSection, ZND, VS, ARM
-
-
-class Import(bpy.types.Operator, ImportHelper):
-    """Load a MPD file"""
-
-    bl_idname = "import_map_mesh.mpd"
-    bl_label = "Import MPD"
-    filename_ext = ".MPD"
-
-    filepath: bpy.props.StringProperty(default="", subtype="FILE_PATH")
-    filter_glob: bpy.props.StringProperty(default="*.MPD", options={"HIDDEN"})
-    bool_build_collision: bpy.props.BoolProperty(
-        name="Build Collision Mesh",
-        description="Also build the collision mesh ?",
-        default=False
-    )
-
-    def execute(self, context):
-        keywords = self.as_keywords(ignore=("axis_forward","axis_up","filter_glob",))
-        BlenderImport(self, context, **keywords)
-
-        return {"FINISHED"}
-
-
-def BlenderImport(operator, context, filepath, bool_build_collision = False):
+import numpy as np
+
+try:
+    import bpy
+    import bmesh
+    from bpy.props import BoolProperty, EnumProperty, FloatProperty, StringProperty
+    from bpy_extras.io_utils import ExportHelper, ImportHelper
+except ImportError:
+    # parsing doesn't need Blender
+    bpy = None
+
+from . import GroupSection, ZND, VS, ARM, Index, Cache, Textures, Shaders, Intermediate
+
+
+if bpy is not None:
+    class Import(bpy.types.Operator, ImportHelper):
+        """Load a MPD file"""
+
+        bl_idname = "import_map_mesh.mpd"
+        bl_label = "Import MPD"
+        filename_ext = ".MPD"
+
+        filepath: bpy.props.StringProperty(default="", subtype="FILE_PATH")
+        filter_glob: bpy.props.StringProperty(default="*.MPD", options={"HIDDEN"})
+        bool_build_collision: bpy.props.BoolProperty(
+            name="Build Collision Mesh",
+            description="Also build the collision mesh ?",
+            default=False
+        )
+        bool_palette_shader: bpy.props.BoolProperty(
+            name="Palette Shader",
+            description="Each ZND texture page once as an index texture with all CLUTs in one palette texture, faces pick their CLUT in the shader",
+            default=False
+        )
+
+        def execute(self, context):
+            keywords = self.as_keywords(ignore=("axis_forward","axis_up","filter_glob",))
+            BlenderImport(self, context, **keywords)
+
+            return {"FINISHED"}
+
+
+def BlenderImport(operator, context, filepath, bool_build_collision = False, bool_palette_shader = False):
+    if Cache.settings.enabled == True and bool_build_collision == False and bool_palette_shader == False:
+        # converted arrays from the disk cache, the room and its ZND are only parsed once
+        zndfilepath = findZND(filepath)
+        header, arrays = Intermediate.cached("MPD", [filepath, zndfilepath], lambda: Intermediate.fromMPD(load(filepath), ZND.load(zndfilepath)))
+        Intermediate.build(header, arrays)
+        return
     mpd = MPD()
     # we read datas from a file
     mpd.loadFromFile(filepath)
@@ -54,18 +73,62 @@ def BlenderImport(operator, context, filepath, bool_build_collision = False):
     #print("bpy.path.abspath : "+bpy.path.abspath(filepath))
     #print("bpy.path.basename : "+bpy.path.basename(filepath))
 
-    zndFileName = VS.MDPToZND(bpy.path.basename(filepath))
-    #print("Corresponding ZND : "+zndFileName)
-    zndfilepath = filepath.replace(bpy.path.basename(filepath), zndFileName)
-    #print("zndfilepath : "+zndfilepath)
-
     znd = ZND.ZND()
-    znd.loadFromFile(zndfilepath)
+    znd.loadFromFile(findZND(filepath))
 
     # Creating Geometry and Meshes for Blender
-    mpd.buildGeometry(znd, bool_build_collision)
+    mpd.buildGeometry(znd, bool_build_collision, bool_palette_shader)
 
 
+def load(filepath):
+    mpd = MPD()
+    mpd.loadFromFile(filepath)
+    return mpd
+
+def findZND(filepath):
+    zndFileName = VS.MDPToZND(os.path.basename(filepath))
+    #print("Corresponding ZND : "+zndFileName)
+    zndfilepath = os.path.join(os.path.dirname(filepath), zndFileName)
+    index = Index.forFile(filepath)
+    if index is not None and not Index.isfile(zndfilepath):
+        # the ZND isn't next to the MPD but the index knows where it is
+        found = index.find(zndFileName)
+        if len(found) > 0:
+            zndfilepath = found[0]
+    return zndfilepath
+
+def probe(filepath):
+    # header and room section lengths only, geometry is not decoded
+    infos = {"format": "MPD", "name": VS.displayName(filepath), "filesize": os.stat(filepath).st_size}
+    file = open(filepath, "rb")
+    header = MPDHeader()
+    header.feed(file)
+    infos["sections"] = {
+        "room": header.lenRoomSection,
+        "cleared": header.lenClearedSection,
+        "script": header.lenScriptSection,
+        "door": header.lenDoorSection,
+        "enemy": header.lenEnemySection,
+        "treasure": header.lenTreasureSection,
+    }
+    infos["offsets"] = {
+        "room": header.ptrRoomSection,
+        "cleared": header.ptrClearedSection,
+        "script": header.ptrScriptSection,
+        "door": header.ptrDoorSection,
+        "enemy": header.ptrEnemySection,
+        "treasure": header.ptrTreasureSection,
+    }
+    infos["numGroups"] = 0
+    if header.lenRoomSection > 96:
+        room = Room()
+        room.feedLengths(file)
+        infos["roomSections"] = dict((key[3:], value) for key, value in vars(room).items() if key.startswith("len"))
+        if room.lenGeometrySection > 4:
+            infos["numGroups"] = struct.unpack("I", file.read(4))[0]
+    file.close()
+    return infos
+
 class MPD:
     def __init__(self):
         self.name = "MPD"
@@ -73,10 +136,13 @@ class MPD:
         self.room = Room()
     def loadFromFile(self, filepath):
         # Open a MPD file and parse it
+        self.name = VS.displayName(filepath)
+        if Cache.restore(self, filepath):
+            return
         file = open(filepath, "rb")
-        self.name = bpy.path.display_name(filepath)
         self.parse(file)
         file.close()
+        Cache.store(self, filepath)
     def parse(self, file):
         self.header.feed(file)
 
@@ -93,7 +159,7 @@ class MPD:
         #print("Treasure Section         len("+repr(self.header.lenTreasureSection)+")           at : "+repr("{0:8X}".format(self.header.ptrTreasureSection)))
 
 
-    def buildGeometry(self, znd = None, bool_build_collision = False):
+    def buildGeometry(self, znd = None, bool_build_collision = False, bool_palette_shader = False):
         #print("MPD Building...")
         # Creating Geometry and Mesh for Blender
         self.room.blenderize()
@@ -102,8 +168,13 @@ class MPD:
         blender_mesh.from_pydata(self.room.blender.vertices, [], self.room.blender.faces)
         blender_obj = bpy.data.objects.new(self.name, object_data=blender_mesh)
 
+        # material index of each ref
+        refMaterials = list(range(0, len(self.room.materialRefs)))
+        if bool_palette_shader == True:
+            refMaterials = self.buildPaletteMaterials(blender_mesh, znd)
+
         # building all needed materials
-        for ref in self.room.materialRefs:
+        for ref in (self.room.materialRefs if bool_palette_shader == False else []):
             # building texture and material from ZND and texture ID + clut ID
             mat = bpy.data.materials.new(name=str(ref+"_MAT"))
             mat.use_nodes = True
@@ -127,8 +198,14 @@ class MPD:
             bsdf.inputs["Specular"].default_value = 0
             bsdf.inputs["Metallic"].default_value = 0
             texImage = mat.node_tree.nodes.new("ShaderNodeTexImage")
-            texImage.image = bpy.data.images.new(str(ref+"_TEX"), 256, 256)
-            texImage.image.pixels = znd.getPixels(ref, translucent)
+            if Textures.settings.enabled == True:
+                # the page and the CLUT as an indexed PNG, rooms of the zone share it
+                textureId, clutId = ref.split("@")
+                texImage.image = Textures.newImage(str(ref+"_TEX"), 256, 256, None,
+                    Textures.pageIndices(znd.getTIM(int(textureId))), Textures.clutColors(znd, int(clutId), translucent))
+            else:
+                texImage.image = bpy.data.images.new(str(ref+"_TEX"), 256, 256)
+                texImage.image.pixels = znd.getPixels(ref, translucent)
             texImage.interpolation = "Closest"  # texture filter
             vc = mat.node_tree.nodes.new("ShaderNodeVertexColor")
             # https://docs.blender.org/manual/fr/2.91/render/shader_nodes/color/mix.html
@@ -170,7 +247,7 @@ class MPD:
         colors = self.room.blender.colors
         face_uvs = self.room.blender.uvs
         for face in blender_mesh.polygons:
-            face.material_index = self.room.materialRefs.index(self.room.blender.matrefs[face.index])   # multi material support
+            face.material_index = refMaterials[self.room.materialRefs.index(self.room.blender.matrefs[face.index])]   # multi material support
             for vert_idx, loop_idx in zip(face.vertices, face.loop_indices):
                 # uvs needs to be scaled from texture W&H
                 uvlayer.data[loop_idx].uv = (
@@ -359,6 +436,75 @@ class MPD:
 
         return blender_obj
 
+    def buildPaletteMaterials(self, blender_mesh, znd):
+        # one material per texture page (and per sidedness), pages are 4 bits index images and every CLUT is a row of one palette image
+        # the CLUT row and the translucency are face attributes, returns the material index of each ref
+        refs = self.room.materialRefs
+        clutIds = sorted(set([int(ref.split("@")[1]) for ref in refs]))
+        palettes = np.stack([Textures.clutColors(znd, clutId) for clutId in clutIds]) if len(clutIds) > 0 else np.zeros((1, 16, 4), dtype=np.uint8)
+        paletteImage = Shaders.paletteImage(str(self.name + "_CLUT_TEX"), palettes)
+
+        materials = {}
+        pages = {}
+        refMaterials = []
+        rows = []
+        translucents = []
+        for ref in refs:
+            sided = False
+            translucent = False
+            # like the material of each ref, the last group using it decides
+            for group in self.room.groups:
+                if ref in group.materialRefs:
+                    sided = group.materialSided[group.materialRefs.index(ref)] == True
+                    translucent = group.materialTrans[group.materialRefs.index(ref)] == True
+            textureId, clutId = [int(id) for id in ref.split("@")]
+            rows.append(clutIds.index(clutId))
+            translucents.append(1 if translucent == True else 0)
+            if textureId not in pages:
+                # pages are named after their ZND, other rooms of the zone reuse them
+                name = str(znd.name + "_" + repr(textureId) + "_IDX_TEX")
+                pages[textureId] = bpy.data.images.get(name)
+                if pages[textureId] is None:
+                    pages[textureId] = Shaders.indexImage(name, Textures.pageIndices(znd.getTIM(textureId)))
+            key = (textureId, sided)
+            if key not in materials:
+                materials[key] = len(blender_mesh.materials)
+                mat = bpy.data.materials.new(name=str(repr(textureId) + ("_DS" if sided == True else "") + "_PAL_MAT"))
+                mat.use_nodes = True
+                mat.blend_method = "HASHED"
+                mat.use_backface_culling = sided == False
+                bsdf = mat.node_tree.nodes["Principled BSDF"]
+                bsdf.inputs["Specular"].default_value = 0
+                bsdf.inputs["Metallic"].default_value = 0
+                clutAttr = mat.node_tree.nodes.new("ShaderNodeAttribute")
+                clutAttr.attribute_name = "vs_clut"
+                transAttr = mat.node_tree.nodes.new("ShaderNodeAttribute")
+                transAttr.attribute_name = "vs_translucent"
+                paletteTex = Shaders.paletteNodes(mat, pages[textureId], paletteImage, palettes.shape[1], palettes.shape[0], clutAttr.outputs["Fac"])
+                # translucent faces take their alpha from the color grey scale
+                alpha = mat.node_tree.nodes.new("ShaderNodeGroup")
+                alpha.node_tree = Shaders.greyAlpha()
+                mat.node_tree.links.new(alpha.inputs["Color"], paletteTex.outputs["Color"])
+                mat.node_tree.links.new(alpha.inputs["Alpha"], paletteTex.outputs["Alpha"])
+                mat.node_tree.links.new(alpha.inputs["Translucent"], transAttr.outputs["Fac"])
+                vc = mat.node_tree.nodes.new("ShaderNodeVertexColor")
+                mix = mat.node_tree.nodes.new("ShaderNodeMixRGB")
+                mix.blend_type = "MULTIPLY"
+                mix.inputs[0].default_value = 1
+                mat.node_tree.links.new(mix.inputs[1], vc.outputs["Color"])
+                mat.node_tree.links.new(mix.inputs[2], paletteTex.outputs["Color"])
+                mat.node_tree.links.new(bsdf.inputs["Base Color"], mix.outputs["Color"])
+                mat.node_tree.links.new(bsdf.inputs["Alpha"], alpha.outputs["Alpha"])
+                blender_mesh.materials.append(mat)
+            refMaterials.append(materials[key])
+
+        refIndices = {refs[i]: i for i in range(0, len(refs))}
+        faceRefs = np.array([refIndices[ref] for ref in self.room.blender.matrefs], dtype=np.intp)
+        for name, values in [("vs_clut", rows), ("vs_translucent", translucents)]:
+            attribute = blender_mesh.attributes.new(name=name, type="FLOAT", domain="FACE")
+            attribute.data.foreach_set("value", np.array(values, dtype=np.float32)[faceRefs])
+        return refMaterials
+
 
 class MPDHeader:
     def __init__(self):
@@ -430,7 +576,7 @@ class Room:
         self.collisions = []
         self.tileModes = []
         self.arm = None
-    def feed(self, file):
+    def feedLengths(self, file):
         (
             self.lenGeometrySection,
             self.lenCollisionSection,
@@ -460,6 +606,9 @@ class Room:
             self.lenCameraAreaSection,
         ) = struct.unpack("12I", file.read(48))
 
+    def feed(self, file):
+        self.feedLengths(file)
+
         # Geometry Section
         #print("Geometry Section  len("+repr(self.lenGeometrySection)+") at : "+repr("{0:8X}".format(file.tell())))
         if self.lenGeometrySection > 4:
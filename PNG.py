@@ -0,0 +1,74 @@
+bl_info = {
+    "name": "Vagrant Story file formats Add-on",
+    "description": "Import-Export Vagrant Story file formats (WEP, SHP, SEQ, ZUD, MPD, ZND, P, FBT, FBC).",
+    "author": "Sigfrid Korobetski (LunaticChimera)",
+    "version": (2, 12),
+    "blender": (3, 2, 0),
+    "location": "File > Import-Export",
+    "category": "Import-Export",
+}
+
+# minimal PNG writer, zlib only, no Blender needed
+# pixels are (height, width, 4) uint8 arrays with rows from top to bottom like in PNG files
+# indexed PNG keep CLUTs : indices are (height, width) uint8 arrays, palettes (colors, 4) uint8 RGBA arrays
+
+import struct
+import zlib
+
+import numpy as np
+
+
+SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+def chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+def fromBlender(pixels, width, height):
+    # Blender pixels (flat floats, rows from bottom to top) to PNG rows
+    pixels = np.asarray(pixels, dtype=np.float32).reshape(height, width, 4)[::-1]
+    return np.clip(np.round(pixels * 255), 0, 255).astype(np.uint8)
+
+def encode(pixels, level = 6):
+    height, width = pixels.shape[0], pixels.shape[1]
+    # filter type 0 (None) on each row
+    rows = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    rows[:, 1:] = pixels.reshape(height, width * 4)
+    datas = SIGNATURE
+    datas += chunk(b"IHDR", struct.pack(">2I5B", width, height, 8, 6, 0, 0, 0))  # 8 bits RGBA
+    datas += chunk(b"IDAT", zlib.compress(rows.tobytes(), level))
+    datas += chunk(b"IEND", b"")
+    return datas
+
+def write(filepath, pixels, level = 6):
+    file = open(filepath, "wb")
+    file.write(encode(pixels, level))
+    file.close()
+
+def encodeIndexed(indices, palette, level = 6):
+    height, width = indices.shape
+    palette = np.asarray(palette, dtype=np.uint8).reshape(-1, 4)
+    # 16 colors CLUTs take 4 bits per pixel, the first pixel in the high nibble
+    depth = 4 if len(palette) <= 16 else 8
+    if depth == 4:
+        pairs = np.zeros((height, width + width % 2), dtype=np.uint8)
+        pairs[:, :width] = indices
+        packed = (pairs[:, 0::2] << 4) | pairs[:, 1::2]
+    else:
+        packed = indices
+    rows = np.zeros((height, packed.shape[1] + 1), dtype=np.uint8)
+    rows[:, 1:] = packed
+    datas = SIGNATURE
+    datas += chunk(b"IHDR", struct.pack(">2I5B", width, height, depth, 3, 0, 0, 0))  # palette colors
+    datas += chunk(b"PLTE", palette[:, :3].tobytes())
+    # alpha of each palette color, trailing opaque colors can be left out
+    translucent = np.nonzero(palette[:, 3] != 255)[0]
+    if len(translucent) > 0:
+        datas += chunk(b"tRNS", palette[:translucent[-1] + 1, 3].tobytes())
+    datas += chunk(b"IDAT", zlib.compress(rows.tobytes(), level))
+    datas += chunk(b"IEND", b"")
+    return datas
+
+def writeIndexed(filepath, indices, palette, level = 6):
+    file = open(filepath, "wb")
+    file.write(encodeIndexed(indices, palette, level))
+    file.close()
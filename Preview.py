@@ -0,0 +1,299 @@
+bl_info = {
+    "name": "Vagrant Story file formats Add-on",
+    "description": "Import-Export Vagrant Story file formats (WEP, SHP, SEQ, ZUD, MPD, ZND, P, FBT, FBC).",
+    "author": "Sigfrid Korobetski (LunaticChimera)",
+    "version": (2, 12),
+    "blender": (3, 2, 0),
+    "location": "File > Import-Export",
+    "category": "Import-Export",
+}
+
+# asset previews without Blender, a small NumPy software rasterizer
+# parsed geometry is drawn with an orthographic camera, flat shading, vertex colors and nearest texel sampling
+# previews are (size, size, 4) uint8 arrays, rows go from bottom to top like Blender image pixels
+#
+# usage, from the directory containing the add-on folder :
+#   python -m vagrant_story.Preview VS/ previews/ --size 128
+# or in a script :
+#   pixels = Preview.renderFile("OBJ/01.WEP")
+
+import os
+import sys
+import math
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import WEP, SHP, ZUD, MPD, ZND
+
+
+EXTENSIONS = [".WEP", ".SHP", ".ZUD", ".MPD"]
+SIZE = 128
+# fragments drawn at once, bounds the rasterizer memory
+FRAGMENTS = 1 << 16
+
+
+class Mesh:
+    # triangles with per corner UVs and colors, each triangle samples one of the textures
+    def __init__(self, positions, triangles, uvs, colors, textureIndices, textures, names = None, translucent = None):
+        self.positions = positions  # (V, 3) float
+        self.triangles = triangles  # (T, 3) int
+        self.uvs = uvs  # (T, 3, 2) float, 0 to 1
+        self.colors = colors  # (T, 3, 4) float
+        self.textureIndices = textureIndices  # (T,) int
+        self.textures = textures  # (M, H, W, 4) float, rows from bottom to top
+        # material name and translucency of each texture
+        self.names = names if names is not None else ["Mat"+repr(i) for i in range(0, len(textures))]
+        self.translucent = translucent if translucent is not None else [False] * len(textures)
+
+def triangulate(faces, loops):
+    # faces are lists of vertex indices, loops are per face corner datas in the same order
+    triangles = []
+    corners = []
+    faceIndices = []
+    k = 0
+    for i in range(0, len(faces)):
+        face = faces[i]
+        for j in range(1, len(face) - 1):
+            triangles.append((face[0], face[j], face[j + 1]))
+            corners.append((k, k + j, k + j + 1))
+            faceIndices.append(i)
+        k += len(face)
+    corners = np.array(corners, dtype=np.intp).reshape(-1, 3)
+    return np.array(triangles, dtype=np.intp).reshape(-1, 3), np.asarray(loops)[corners] if len(loops) > 0 else None, np.array(faceIndices, dtype=np.intp)
+
+def textureArray(pixels, width, height):
+    return np.array(pixels, dtype=np.float32).reshape(height, width, 4)
+
+def meshFromWEP(wep, material_index = 0):
+    width, height = wep.tim.textureWidth, wep.tim.textureHeigth
+    uvs = np.array(wep.getUVsForBlender(), dtype=np.float32).reshape(-1, 2) / [width - 1, height - 1]
+    triangles, cornerUVs, faces = triangulate(wep.getFacesForBlender(), uvs)
+    colors = np.ones((len(triangles), 3, 4), dtype=np.float32)
+    textures = textureArray(wep.tim.textures[material_index], width, height)[None]
+    return Mesh(np.array(wep.getVerticesForBlender(), dtype=np.float32).reshape(-1, 3), triangles, cornerUVs, colors, np.zeros(len(triangles), dtype=np.intp), textures)
+
+def meshFromSHP(shp):
+    width, height = shp.tim.textureWidth, shp.tim.textureHeigth
+    if shp.name == "50":
+        # same special case as SHP.buildGeometry
+        width = height = 256
+    uvs = np.array(shp.getUVsForBlender(), dtype=np.float32).reshape(-1, 2) / [width - 1, height - 1]
+    colors = np.array([col.toFloat() for col in shp.getVColForBlender()], dtype=np.float32).reshape(-1, 4)
+    triangles, cornerUVs, faces = triangulate(shp.getFacesForBlender(), uvs)
+    cornerColors = np.ones((len(triangles), 3, 4), dtype=np.float32)
+    if shp.hasColoredVertex == True:
+        cornerColors = triangulate(shp.getFacesForBlender(), colors)[1]
+    textures = textureArray(shp.tim.textures[0], shp.tim.textureWidth, shp.tim.textureHeigth)[None]
+    return Mesh(np.array(shp.getVerticesForBlender(), dtype=np.float32).reshape(-1, 3), triangles, cornerUVs, cornerColors, np.zeros(len(triangles), dtype=np.intp), textures)
+
+def meshFromMPD(mpd, znd):
+    room = mpd.room
+    room.blenderize()
+    uvs = np.array(room.blender.uvs, dtype=np.float32).reshape(-1, 2) / 256
+    colors = np.array([col.toFloat() for col in room.blender.colors], dtype=np.float32).reshape(-1, 4)
+    triangles, cornerUVs, faces = triangulate(room.blender.faces, uvs)
+    cornerColors = triangulate(room.blender.faces, colors)[1]
+    textures = np.empty((len(room.materialRefs), 256, 256, 4), dtype=np.float32)
+    translucents = []
+    for i in range(0, len(room.materialRefs)):
+        ref = room.materialRefs[i]
+        # like MPD.buildGeometry, the last group using the ref tells if it is translucent
+        translucent = False
+        for group in room.groups:
+            if ref in group.materialRefs:
+                translucent = group.materialTrans[group.materialRefs.index(ref)] == True
+        textures[i] = textureArray(znd.getPixels(ref, translucent), 256, 256)
+        translucents.append(translucent)
+    materials = np.array([room.materialRefs.index(ref) for ref in room.blender.matrefs], dtype=np.intp)
+    return Mesh(np.array(room.blender.vertices, dtype=np.float32).reshape(-1, 3), triangles, cornerUVs, cornerColors, materials[faces], textures,
+        [ref+"_MAT" for ref in room.materialRefs], translucents)
+
+def loadMesh(filepath):
+    ext = os.path.splitext(filepath)[1].upper()
+    if ext == ".WEP":
+        wep = WEP.WEP()
+        wep.loadFromFile(filepath)
+        return meshFromWEP(wep)
+    elif ext == ".SHP":
+        shp = SHP.SHP()
+        shp.loadFromFile(filepath)
+        return meshFromSHP(shp)
+    elif ext == ".ZUD":
+        # the unit body is enough for a preview
+        zud = ZUD.ZUD()
+        zud.loadFromFile(filepath)
+        return meshFromSHP(zud.shp)
+    elif ext == ".MPD":
+        mpd = MPD.MPD()
+        mpd.loadFromFile(filepath)
+        znd = ZND.ZND()
+        znd.loadFromFile(MPD.findZND(filepath))
+        return meshFromMPD(mpd, znd)
+    return None
+
+
+def camera(azimuth, elevation):
+    # orthographic camera basis, Z up like Blender, azimuth 0 looks at the front (-Y side)
+    a = math.radians(azimuth)
+    e = math.radians(elevation)
+    back = np.array([math.sin(a) * math.cos(e), -math.cos(a) * math.cos(e), math.sin(e)])
+    right = np.cross([0, 0, 1], back)
+    right /= np.linalg.norm(right)
+    up = np.cross(back, right)
+    return right, up, back
+
+def render(mesh, size = SIZE, azimuth = 35, elevation = 25, supersample = 2, margin = 0.05):
+    full = size * supersample
+    color = np.zeros((full, full, 4), dtype=np.float32)
+    if mesh is None or len(mesh.triangles) == 0:
+        return np.zeros((size, size, 4), dtype=np.uint8)
+    depth = np.full((full, full), -np.inf, dtype=np.float32)
+    right, up, back = camera(azimuth, elevation)
+
+    # screen space, the bounding box fills the picture
+    screen = np.stack([mesh.positions @ right, mesh.positions @ up, mesh.positions @ back], axis=-1)
+    low = screen[:, :2].min(axis=0)
+    high = screen[:, :2].max(axis=0)
+    scale = full * (1 - 2 * margin) / max((high - low).max(), 1e-6)
+    screen[:, :2] = (screen[:, :2] - (low + high) / 2) * scale + full / 2
+
+    # flat shading, faces may be wound both ways so we light both sides
+    corners = mesh.positions[mesh.triangles]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)
+    lengths[lengths == 0] = 1
+    light = back + up * 0.5 + right * 0.3
+    light /= np.linalg.norm(light)
+    shades = 0.35 + 0.65 * np.abs((normals / lengths[:, None]) @ light)
+
+    height, width = mesh.textures.shape[1], mesh.textures.shape[2]
+    x, y, z = np.moveaxis(screen[mesh.triangles], -1, 0)
+    areas = (x[:, 1] - x[:, 0]) * (y[:, 2] - y[:, 0]) - (x[:, 2] - x[:, 0]) * (y[:, 1] - y[:, 0])
+    xmin = np.maximum(np.floor(x.min(axis=1)), 0).astype(np.intp)
+    xmax = np.minimum(np.ceil(x.max(axis=1)), full - 1).astype(np.intp)
+    ymin = np.maximum(np.floor(y.min(axis=1)), 0).astype(np.intp)
+    ymax = np.minimum(np.ceil(y.max(axis=1)), full - 1).astype(np.intp)
+    ids = np.nonzero((np.abs(areas) >= 1e-9) & (xmin <= xmax) & (ymin <= ymax))[0]
+    widths = xmax - xmin + 1
+    counts = widths * (ymax - ymin + 1)
+    # barycentric coordinates are affine in screen space, w = dx * column + dy * row + w at the bounding box first pixel center
+    areas[areas == 0] = 1
+    x0, y0 = xmin + 0.5, ymin + 0.5
+    w0 = ((x[:, 1] - x0) * (y[:, 2] - y0) - (x[:, 2] - x0) * (y[:, 1] - y0)) / areas
+    w1 = ((x[:, 2] - x0) * (y[:, 0] - y0) - (x[:, 0] - x0) * (y[:, 2] - y0)) / areas
+    planes = np.stack([(y[:, 1] - y[:, 2]) / areas, (x[:, 2] - x[:, 1]) / areas, w0,
+        (y[:, 2] - y[:, 0]) / areas, (x[:, 0] - x[:, 2]) / areas, w1], axis=-1)
+
+    # every pixel of the triangle bounding boxes is a fragment, triangles are drawn in chunks of about FRAGMENTS fragments
+    ends = np.cumsum(counts[ids])
+    chunks = np.split(ids, np.nonzero(np.diff((ends - counts[ids]) // FRAGMENTS))[0] + 1)
+    colorFlat = color.reshape(-1, 4)
+    depthFlat = depth.reshape(-1)
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        n = counts[chunk]
+        local = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        rows, cols = np.divmod(local, np.repeat(widths[chunk], n))
+        fragments = np.repeat(planes[chunk], n, axis=0)
+        w0 = fragments[:, 0] * cols + fragments[:, 1] * rows + fragments[:, 2]
+        w1 = fragments[:, 3] * cols + fragments[:, 4] * rows + fragments[:, 5]
+        w2 = 1 - w0 - w1
+        inside = np.nonzero((w0 >= 0) & (w1 >= 0) & (w2 >= 0))[0]
+        t = np.repeat(chunk, n)[inside]
+        px = xmin[t] + cols[inside]
+        py = ymin[t] + rows[inside]
+        w = np.stack([w0[inside], w1[inside], w2[inside]], axis=-1)
+        uv = np.einsum("ni,nij->nj", w, mesh.uvs[t])
+        texels = mesh.textures[mesh.textureIndices[t],
+            np.clip((uv[:, 1] * height).astype(np.intp), 0, height - 1),
+            np.clip((uv[:, 0] * width).astype(np.intp), 0, width - 1)]
+        # alpha cutout, like the CLIP blend mode of imported materials, cut texels don't write depth either
+        opaque = texels[:, 3] >= 0.5
+        t, w, texels = t[opaque], w[opaque], texels[opaque]
+        if len(t) == 0:
+            continue
+        pixels = py[opaque] * full + px[opaque]
+        depths = (w[:, 0] * z[t, 0] + w[:, 1] * z[t, 1] + w[:, 2] * z[t, 2]).astype(np.float32)
+        # nearest fragment of each pixel, on equal depths the first triangle wins like a strict depth test
+        nearestDepth = np.full(len(depthFlat), -np.inf, dtype=np.float32)
+        np.maximum.at(nearestDepth, pixels, depths)
+        candidates = np.nonzero((depths == nearestDepth[pixels]) & (depths > depthFlat[pixels]))[0]
+        first = np.full(len(depthFlat), len(mesh.triangles))
+        np.minimum.at(first, pixels[candidates], t[candidates])
+        nearest = candidates[t[candidates] == first[pixels[candidates]]]
+        tn = t[nearest]
+        colorFlat[pixels[nearest], :3] = texels[nearest, :3] * np.einsum("ni,nij->nj", w[nearest], mesh.colors[tn])[:, :3] * shades[tn][:, None]
+        colorFlat[pixels[nearest], 3] = 1
+        depthFlat[pixels[nearest]] = depths[nearest]
+
+    # box filter, colors are premultiplied while averaging
+    color[:, :, :3] *= color[:, :, 3:]
+    color = color.reshape(size, supersample, size, supersample, 4).mean(axis=(1, 3))
+    alpha = np.maximum(color[:, :, 3:], 1e-6)
+    color[:, :, :3] /= alpha
+    return np.clip(np.round(color * 255), 0, 255).astype(np.uint8)
+
+def renderFile(filepath, size = SIZE):
+    ext = os.path.splitext(filepath)[1].upper()
+    # rooms are seen from higher
+    elevation = 50 if ext == ".MPD" else 25
+    return render(loadMesh(filepath), size, elevation=elevation)
+
+
+def renderTask(filepath, outpath, size):
+    # runs in a worker process
+    try:
+        pixels = renderFile(filepath, size)
+    except Exception as error:
+        return filepath, None, repr(error)
+    os.makedirs(os.path.dirname(outpath), exist_ok=True)
+    np.save(outpath, pixels)
+    return filepath, outpath, None
+
+def previewPath(root, filepath, outdir):
+    return os.path.join(outdir, os.path.relpath(filepath, root)+".npy")
+
+def renderFiles(root, filepaths, outdir, size = SIZE, jobs = None):
+    # {filepath: (preview path or None, error or None)}
+    results = {}
+    jobs = jobs or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn"))
+    futures = [executor.submit(renderTask, filepath, previewPath(root, filepath, outdir), size) for filepath in filepaths]
+    for future in futures:
+        filepath, outpath, error = future.result()
+        results[filepath] = (outpath, error)
+    executor.shutdown()
+    return results
+
+def renderDirectory(root, outdir, size = SIZE, jobs = None):
+    filepaths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].upper() in EXTENSIONS:
+                filepaths.append(os.path.join(dirpath, filename))
+    return renderFiles(root, filepaths, outdir, size, jobs)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Render previews of an extracted Vagrant Story directory without Blender")
+    parser.add_argument("source", help="extracted game directory")
+    parser.add_argument("output", help="previews directory, one .npy per file")
+    parser.add_argument("--size", type=int, default=SIZE, help="preview width and height")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes, all cores by default")
+    args = parser.parse_args(argv)
+
+    results = renderDirectory(args.source, args.output, args.size, args.jobs)
+    failures = [filepath for filepath in results if results[filepath][1] is not None]
+    for filepath in failures:
+        print("failed "+filepath+" : "+results[filepath][1])
+    print(repr(len(results) - len(failures))+" previews, "+repr(len(failures))+" failed")
+    return 1 if len(failures) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,50 +15,101 @@ bl_info = {
 import os
 import math
 import struct
-
-import bpy
-import mathutils
-from bpy.props import BoolProperty, EnumProperty, FloatProperty, StringProperty
-from bpy_extras.io_utils import ExportHelper, ImportHelper
-from . import VS, SHP
-
-
-# CALLED BY BLENDER
-class Import(bpy.types.Operator, ImportHelper):
-    """Load a SEQ file"""
-
-    bl_idname = "import_anim.seq"
-    bl_label = "Import SEQ"
-    filename_ext = ".SEQ"
-
-    filepath: bpy.props.StringProperty(default="", subtype="FILE_PATH")
-    filter_glob: bpy.props.StringProperty(default="*.SEQ", options={"HIDDEN"})
-    bool_anim_trans: bpy.props.BoolProperty(
-        name="Anims Translation",
-        description="Add translation when importing SEQ animations ?",
-        default=False
-    )
-
-    def execute(self, context):
-        keywords = self.as_keywords(ignore=("axis_forward","axis_up","filter_glob"))
-        BlenderImport(self, context, **keywords)
-
-        return {"FINISHED"}
-
-def BlenderImport(operator, context, filepath, bool_anim_trans = False):
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import bpy
+    import mathutils
+    from bpy.props import BoolProperty, EnumProperty, FloatProperty, StringProperty
+    from bpy_extras.io_utils import ExportHelper, ImportHelper
+except ImportError:
+    # parsing doesn't need Blender
+    bpy = None
+from . import VS, SHP, Cache
+
+
+if bpy is not None:
+    # CALLED BY BLENDER
+    class Import(bpy.types.Operator, ImportHelper):
+        """Load a SEQ file"""
+
+        bl_idname = "import_anim.seq"
+        bl_label = "Import SEQ"
+        filename_ext = ".SEQ"
+
+        filepath: bpy.props.StringProperty(default="", subtype="FILE_PATH")
+        filter_glob: bpy.props.StringProperty(default="*.SEQ", options={"HIDDEN"})
+        bool_anim_trans: bpy.props.BoolProperty(
+            name="Anims Translation",
+            description="Add translation when importing SEQ animations ?",
+            default=False
+        )
+        float_anim_tolerance: bpy.props.FloatProperty(
+            name="Keyframes Tolerance",
+            description="Remove rotation keyframes that can be interpolated with an error below this value (0 keeps every keyframe)",
+            default=0.0,
+            min=0.0,
+            max=0.1,
+            precision=4,
+            step=0.01
+        )
+        bool_all_anims: bpy.props.BoolProperty(
+            name="Build All Animations",
+            description="Build every animation into actions now, otherwise only the selected animation is built when needed",
+            default=False
+        )
+
+        def execute(self, context):
+            keywords = self.as_keywords(ignore=("axis_forward","axis_up","filter_glob"))
+            BlenderImport(self, context, **keywords)
+
+            return {"FINISHED"}
+
+    class BuildAnimations(bpy.types.Operator):
+        """Build every animation of the armature SEQs into actions"""
+
+        bl_idname = "anim.vs_build_animations"
+        bl_label = "Build All Animations"
+
+        @classmethod
+        def poll(cls, context):
+            return context.object is not None and len(context.object.animations.seqs) > 0
+
+        def execute(self, context):
+            buildAllAnimations(context.object)
+            return {"FINISHED"}
+
+    class AnimationsPanel(bpy.types.Panel):
+        bl_idname = "OBJECT_PT_vs_animations"
+        bl_label = "VS Animations"
+        bl_space_type = "PROPERTIES"
+        bl_region_type = "WINDOW"
+        bl_context = "object"
+
+        @classmethod
+        def poll(cls, context):
+            return context.object is not None and len(context.object.animations.seqs) > 0
+
+        def draw(self, context):
+            self.layout.prop(context.object.animations, "active")
+            self.layout.operator(BuildAnimations.bl_idname)
+
+def BlenderImport(operator, context, filepath, bool_anim_trans = False, float_anim_tolerance = 0.0, bool_all_anims = False):
     x = bpy.path.basename(filepath).split("_")
     shpfilepath = filepath.replace(bpy.path.basename(filepath), x[0]+".SHP")
-    shp = SHP.SHP()
-    # we read datas from a file
-    shp.loadFromFile(shpfilepath)
-    # we build geometry from datas
-    shpObj = shp.buildGeometry()
+    shpObj = SHP.buildFile(shpfilepath)
 
     seq = SEQ()
     # we read datas from a file
     seq.loadFromFile(filepath)
-    seq.buildAnimations(shpObj, bool_anim_trans)
-    shpObj.parent.animation_data.action = bpy.data.actions[seq.name + "_Animation_0"]
+    # actions are built when needed
+    attach(shpObj.parent, seq, filepath, 0, bool_anim_trans, float_anim_tolerance)
+    if bool_all_anims == True:
+        buildAllAnimations(shpObj.parent)
+    if len(seq.animations) > 0:
+        shpObj.parent.animations.active = seq.name + "_Animation_0"
 
     shpObj.parent.name = bpy.path.display_name(shpfilepath)
     #shpObj.parent.select_set(True)
@@ -66,9 +117,193 @@ def BlenderImport(operator, context, filepath, bool_anim_trans = False):
 
     return {"FINISHED"}
 
+def probe(filepath):
+    # header only, a few bytes are read, nothing is decoded
+    infos = {"format": "SEQ", "name": VS.displayName(filepath), "filesize": os.stat(filepath).st_size}
+    file = open(filepath, "rb")
+    header = SEQHeader()
+    header.feed(file)
+    file.close()
+    infos.update({
+        "numAnimations": header.numAnimations,
+        "numBones": header.numBones,
+        "numSlots": header.numSlots,
+        "size": header.size,
+    })
+    return infos
+
+# armatures only store a reference (see attach), parsed SEQ are kept in the bounded session cache
+# the last one is kept here, building every animation of a SEQ restores it once
+last = None
+
+def clearLoaded():
+    global last
+    last = None
+
+def attach(arm_obj, seq, filepath, offset = 0, bool_anim_trans = False, tolerance = 0.0):
+    global last
+    if not Cache.known(seq, filepath, offset):
+        Cache.store(seq, filepath, offset)
+    last = ((os.path.abspath(filepath), offset, seq.name), seq)
+    ref = arm_obj.animations.seqs.add()
+    ref.name = seq.name
+    ref.filepath = filepath
+    ref.offset = offset
+    ref.numAnimations = len(seq.animations)
+    arm_obj.animations.translation = bool_anim_trans
+    arm_obj.animations.tolerance = tolerance
+
+def getSEQ(ref):
+    # we parse again only when the SEQ isn't in memory anymore (reopened .blend, evicted from the session cache)
+    global last
+    filepath = bpy.path.abspath(ref.filepath)
+    key = (os.path.abspath(filepath), ref.offset, ref.name)
+    if last is not None and last[0] == key:
+        return last[1]
+    seq = SEQ()
+    seq.name = ref.name
+    if not Cache.restore(seq, filepath, ref.offset):
+        file = open(filepath, "rb")
+        file.seek(ref.offset)
+        seq.parse(file)
+        file.close()
+        seq.name = ref.name
+        Cache.store(seq, filepath, ref.offset)
+    last = (key, seq)
+    return seq
+
+def animationItems(self, context):
+    items = []
+    for ref in self.seqs:
+        for i in range(0, ref.numAnimations):
+            name = ref.name + "_Animation_" + repr(i)
+            items.append((name, name, "", len(items)))
+    # Blender needs us to keep a reference on dynamic enum items
+    animationItems.items = items
+    return items
+
+def animationUpdate(self, context):
+    buildAnimation(self.id_data, self.active)
+
+# action names by content hash, filled from actions "vs_hash" property
+actionsByHash = {}
+# (blend file, number of actions) when actionsByHash was filled, a miss against an up to date index is a real miss
+actionsIndexed = None
+
+def indexActions():
+    global actionsIndexed
+    actionsByHash.clear()
+    for a in bpy.data.actions:
+        if "vs_hash" in a:
+            actionsByHash[a["vs_hash"]] = a.name
+    actionsIndexed = (bpy.data.filepath, len(bpy.data.actions))
+
+def findAction(digest):
+    if digest in actionsByHash:
+        action = bpy.data.actions.get(actionsByHash[digest])
+        if action is not None and action.get("vs_hash") == digest:
+            return action
+    elif actionsIndexed == (bpy.data.filepath, len(bpy.data.actions)):
+        # no action came since we indexed them, a new digest has no action yet
+        return None
+    # reopened .blend, renamed, deleted or appended action, we index every action again
+    indexActions()
+    return bpy.data.actions.get(actionsByHash.get(digest, ""))
+
+def addAction(action, digest):
+    global actionsIndexed
+    action["vs_hash"] = digest
+    actionsByHash[digest] = action.name
+    # our own action keeps the index up to date
+    if actionsIndexed == (bpy.data.filepath, len(bpy.data.actions) - 1):
+        actionsIndexed = (bpy.data.filepath, len(bpy.data.actions))
+
+def buildAnimation(arm_obj, name):
+    action = None
+    seqName, index = name.rsplit("_Animation_", 1)
+    for ref in arm_obj.animations.seqs:
+        if ref.name == seqName:
+            anim = getSEQ(ref).animations[int(index)]
+            # many characters share the same animations, we build an action only once
+            digest = anim.digest(arm_obj.animations.translation, arm_obj.animations.tolerance)
+            action = findAction(digest)
+            if action is None:
+                action = anim.build(arm_obj, name, arm_obj.animations.translation, arm_obj.animations.tolerance)
+                addAction(action, digest)
+            break
+    if action is not None:
+        arm_obj.animation_data_create()
+        arm_obj.animation_data.action = action
+    return action
+
+def buildAllAnimations(arm_obj):
+    for ref in arm_obj.animations.seqs:
+        for i in range(0, ref.numAnimations):
+            buildAnimation(arm_obj, ref.name + "_Animation_" + repr(i))
+    # we go back to the selected animation
+    if arm_obj.animations.active != "":
+        buildAnimation(arm_obj, arm_obj.animations.active)
+
+def layoutNLA(arm_obj):
+    # every animation as a muted NLA strip, one track per SEQ, strips follow each other
+    arm_obj.animation_data_create()
+    for ref in arm_obj.animations.seqs:
+        track = arm_obj.animation_data.nla_tracks.new()
+        track.name = ref.name
+        track.mute = True
+        start = 0
+        for i in range(0, ref.numAnimations):
+            name = ref.name + "_Animation_" + repr(i)
+            action = buildAnimation(arm_obj, name)
+            strip = track.strips.new(name, start, action)
+            start = math.ceil(strip.frame_end) + 1
+    # we go back to the selected animation
+    if arm_obj.animations.active != "":
+        buildAnimation(arm_obj, arm_obj.animations.active)
+
+def decodeSEQ(filepath):
+    # runs in a worker process, it only needs the headless parser
+    seq = SEQ()
+    seq.loadFromFile(filepath)
+    return seq
+
+def decodeInBackground(filepaths):
+    # SEQ are decoded in worker processes while Blender builds something else, call result() on each future when needed
+    # spawn : we don't want to fork the whole Blender process
+    executor = ProcessPoolExecutor(max_workers=min(len(filepaths), os.cpu_count() or 1), mp_context=multiprocessing.get_context("spawn"))
+    futures = [executor.submit(decodeSEQ, filepath) for filepath in filepaths]
+    # pending futures are still processed, workers exit when they are done
+    executor.shutdown(wait=False)
+    return futures
+
 def rot13toRad(angle):
     return angle * (math.pi / 4096)
 
+def decimate(times, values, tolerance):
+    # error bounded keyframes reduction (Ramer-Douglas-Peucker) of one channel
+    # returns indexes of keys to keep, a removed key is never further than tolerance from the line between kept keys
+    n = len(values)
+    if tolerance <= 0 or n < 3:
+        return list(range(0, n))
+    keep = [False] * n
+    keep[0] = keep[n - 1] = True
+    segments = [(0, n - 1)]
+    while len(segments) > 0:
+        first, last = segments.pop()
+        slope = (values[last] - values[first]) / (times[last] - times[first])
+        maxError = 0
+        index = -1
+        for i in range(first + 1, last):
+            error = abs(values[first] + slope * (times[i] - times[first]) - values[i])
+            if error > maxError:
+                maxError = error
+                index = i
+        if maxError > tolerance:
+            keep[index] = True
+            segments.append((first, index))
+            segments.append((index, last))
+    return [i for i in range(0, n) if keep[i]]
+
 class SEQ:
     def __init__(self):
         self.name = "SEQ"
@@ -77,10 +312,13 @@ class SEQ:
         self.slots = []
     def loadFromFile(self, filepath):
         # Open a SEQ file and parse it
+        self.name = VS.displayName(filepath)
+        if Cache.restore(self, filepath):
+            return
         file = open(filepath, "rb")
-        self.name = bpy.path.display_name(filepath)
         self.parse(file)
         file.close()
+        Cache.store(self, filepath)
     def parse(self, file):
         self.header.feed(file)
 
@@ -96,9 +334,6 @@ class SEQ:
 
         for i in range(0, self.header.numAnimations):
             self.animations[i].getData(file, self)
-    def buildAnimations(self, shpObj, bool_anim_trans = False):
-        for anim in self.animations:
-            anim.build(shpObj, self.name + "_Animation_" + repr(anim.index), bool_anim_trans)
 
 class SEQHeader:
     def __init__(self):
@@ -176,6 +411,7 @@ class Anim:
         self.pose = []
         self.keyframes = []
         self.trans = []
+        self.translationKeys = []
         self.base = None
         self.localPtr = 0
         self.lastTime = 0
@@ -346,10 +582,33 @@ class Anim:
             if self.scaleFlags & 0x2:
                 self.scaleKeysPerBone[i] = self.readKeys(file)
 
-    def build(self, blender_obj, anim_name, bool_anim_trans = False):
-        arm_obj = blender_obj.parent
+    def rotationKeys(self, boneIndex):
+        # rotation keys are delta encoded, we expand them into absolute [frame, rx, ry, rz] keys (radians)
+        keys = []
+        pose = self.rotationPerBone[boneIndex]
+        rx = pose[0] * 2
+        ry = pose[1] * 2
+        rz = pose[2] * 2
+        t = 0
+        for keyframe in self.rotationKeysPerBone[boneIndex]:
+            f = keyframe[3]
+            t += f
+            rx = rx + (keyframe[0] * f)
+            ry = ry + (keyframe[1] * f)
+            rz = rz + (keyframe[2] * f)
+            keys.append([t, rot13toRad(rx), rot13toRad(ry), rot13toRad(rz)])
+        return keys
+
+    def digest(self, bool_anim_trans = False, tolerance = 0.0):
+        # content hash of decoded keys (and build options), identical animations from different SEQ give the same digest
+        datas = (self.numBones, self.length, self.trans, self.translationKeys, self.rotationPerBone, self.rotationKeysPerBone,
+            self.scalePerBone, self.scaleKeysPerBone, bool_anim_trans, round(tolerance, 6))
+        return hashlib.sha1(repr(datas).encode()).hexdigest()
+
+    def build(self, arm_obj, anim_name, bool_anim_trans = False, tolerance = 0.0):
+        action = bpy.data.actions.new(name=anim_name)
         arm_obj.animation_data_create()
-        arm_obj.animation_data.action = bpy.data.actions.new(name=anim_name)
+        arm_obj.animation_data.action = action
 
         if (bool_anim_trans == True):
             # we do translation first
@@ -382,43 +641,41 @@ class Anim:
         for i in range(0, self.numBones):
             bone = arm_obj.pose.bones["bone_" + repr(i)]
             if i < len(self.rotationKeysPerBone):
-                keyframes = self.rotationKeysPerBone[i]
-                pose = self.rotationPerBone[i]
-
-                rx = pose[0] * 2
-                ry = pose[1] * 2
-                rz = pose[2] * 2
-                t = 0
-                kfl = len(keyframes)
-
-                for j in range(0, kfl):
-                    keyframe = keyframes[j]
-                    f = keyframe[3]
-                    t += f
-                    if keyframe[0] == None:
-                        keyframe[0] = keyframes[j - 1][0]
-
-                    if keyframe[1] == None:
-                        keyframe[1] = keyframes[j - 1][1]
-
-                    if keyframe[2] == None:
-                        keyframe[2] = keyframes[j - 1][2]
-
-                    rx = rx + (keyframe[0] * f)
-                    ry = ry + (keyframe[1] * f)
-                    rz = rz + (keyframe[2] * f)
-                    bone_rotation = (rot13toRad(rx), rot13toRad(ry), rot13toRad(rz))
-
+                keys = self.rotationKeys(i)
+                times = [key[0] for key in keys]
+                quaternions = []
+                for t, rx, ry, rz in keys:
                     # euler rotations isn't good enough for animations interpolations so we build Quaternions
                     # bone.rotation_mode = 'XYZ'
-                    # bone.rotation_euler = bone_rotation
+                    # bone.rotation_euler = (rx, ry, rz)
                     # bone.keyframe_insert(data_path='rotation_euler', frame=t)
 
-                    qu = mathutils.Quaternion((1.0, 0.0, 0.0), bone_rotation[0])
-                    qv = mathutils.Quaternion((0.0, 1.0, 0.0), bone_rotation[1])
-                    qw = mathutils.Quaternion((0.0, 0.0, 1.0), bone_rotation[2])
-                    q = qw @ qv @ qu
-
-                    bone.rotation_mode = "QUATERNION"
-                    bone.rotation_quaternion = q
-                    bone.keyframe_insert(data_path="rotation_quaternion", frame=t)
+                    qu = mathutils.Quaternion((1.0, 0.0, 0.0), rx)
+                    qv = mathutils.Quaternion((0.0, 1.0, 0.0), ry)
+                    qw = mathutils.Quaternion((0.0, 0.0, 1.0), rz)
+                    quaternions.append(qw @ qv @ qu)
+
+                # each quaternion channel (W, X, Y, Z) is decimated on its own
+                kept = [set(decimate(times, [q[c] for q in quaternions], tolerance)) for c in range(0, 4)]
+
+                bone.rotation_mode = "QUATERNION"
+                for j in range(0, len(keys)):
+                    channels = [c for c in range(0, 4) if j in kept[c]]
+                    if len(channels) == 0:
+                        continue
+                    bone.rotation_quaternion = quaternions[j]
+                    if len(channels) == 4:
+                        bone.keyframe_insert(data_path="rotation_quaternion", frame=times[j])
+                    else:
+                        for c in channels:
+                            bone.keyframe_insert(data_path="rotation_quaternion", index=c, frame=times[j])
+
+        if tolerance > 0:
+            # decimate bounds the error against straight lines between kept keys,
+            # default Bezier handles could overshoot over long gaps, so decimated curves are linear
+            for fcurve in action.fcurves:
+                if fcurve.data_path.endswith("rotation_quaternion"):
+                    for point in fcurve.keyframe_points:
+                        point.interpolation = "LINEAR"
+
+        return action
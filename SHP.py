@@ -14,80 +14,137 @@ import os
 import math
 import struct
 
-import bpy
-from bpy.props import BoolProperty, EnumProperty, FloatProperty, StringProperty
-from bpy_extras.io_utils import ExportHelper, ImportHelper
-
-from . import TIM, VS, BoneSection, FaceSection, GroupSection, VertexSection, SEQ
-
-
-# CALLED BY BLENDER
-class Import(bpy.types.Operator, ImportHelper):
-    """Load a SHP file"""
-
-    bl_idname = "import_mesh.shp"
-    bl_label = "Import SHP"
-    filename_ext = ".SHP"
-
-    filepath: bpy.props.StringProperty(default="", subtype="FILE_PATH")
-    filter_glob: bpy.props.StringProperty(default="*.SHP", options={"HIDDEN"})
-    bool_anim_trans: bpy.props.BoolProperty(
-        name="Anims Translation",
-        description="Add translation when importing SEQ animations ?",
-        default=False
-    )
-
-
-    def execute(self, context):
-        keywords = self.as_keywords(ignore=("axis_forward","axis_up","filter_glob"))
-        BlenderImport(self, context, **keywords)
-
-        return {"FINISHED"}
-
-# CALLED BY BLENDER
-class Export(bpy.types.Operator, ExportHelper):
-    """Save a SHP file"""
-
-    bl_idname = "export_mesh.shp"
-    bl_label = "Export SHP"
-    check_extension = True
-    filename_ext = ".SHP"
-
-    filter_glob: bpy.props.StringProperty(default="*.SHP", options={"HIDDEN"})
-    def execute(self, context):
-        keywords = self.as_keywords(ignore=("filter_glob", "check_existing"))
-        check = False
-        #check = saveWEP(self, context, **keywords)
-        return check
-
-
-
-
-def BlenderImport(operator, context, filepath, bool_anim_trans = False):
-    #print("bool_anim_trans : "+repr(bool_anim_trans))
+try:
+    import bpy
+    from bpy.props import BoolProperty, EnumProperty, FloatProperty, StringProperty
+    from bpy_extras.io_utils import ExportHelper, ImportHelper
+except ImportError:
+    # parsing doesn't need Blender
+    bpy = None
+
+from . import TIM, VS, BoneSection, FaceSection, GroupSection, VertexSection, SEQ, Index, Cache, Textures, Intermediate
+
+
+if bpy is not None:
+    # CALLED BY BLENDER
+    class Import(bpy.types.Operator, ImportHelper):
+        """Load a SHP file"""
+
+        bl_idname = "import_mesh.shp"
+        bl_label = "Import SHP"
+        filename_ext = ".SHP"
+
+        filepath: bpy.props.StringProperty(default="", subtype="FILE_PATH")
+        filter_glob: bpy.props.StringProperty(default="*.SHP", options={"HIDDEN"})
+        bool_anim_trans: bpy.props.BoolProperty(
+            name="Anims Translation",
+            description="Add translation when importing SEQ animations ?",
+            default=False
+        )
+        float_anim_tolerance: bpy.props.FloatProperty(
+            name="Keyframes Tolerance",
+            description="Remove rotation keyframes that can be interpolated with an error below this value (0 keeps every keyframe)",
+            default=0.0,
+            min=0.0,
+            max=0.1,
+            precision=4,
+            step=0.01
+        )
+        bool_all_anims: bpy.props.BoolProperty(
+            name="Build All Animations",
+            description="Build every animation into actions now, otherwise only the selected animation is built when needed",
+            default=False
+        )
+        bool_all_seqs: bpy.props.BoolProperty(
+            name="Import All SEQ",
+            description="Import every corresponding SEQ (_COM, _BT1 to _BTA) as muted NLA tracks, otherwise only the first one found",
+            default=False
+        )
+
+
+        def execute(self, context):
+            keywords = self.as_keywords(ignore=("axis_forward","axis_up","filter_glob"))
+            BlenderImport(self, context, **keywords)
+
+            return {"FINISHED"}
+
+    # CALLED BY BLENDER
+    class Export(bpy.types.Operator, ExportHelper):
+        """Save a SHP file"""
+
+        bl_idname = "export_mesh.shp"
+        bl_label = "Export SHP"
+        check_extension = True
+        filename_ext = ".SHP"
+
+        filter_glob: bpy.props.StringProperty(default="*.SHP", options={"HIDDEN"})
+        def execute(self, context):
+            keywords = self.as_keywords(ignore=("filter_glob", "check_existing"))
+            check = False
+            #check = saveWEP(self, context, **keywords)
+            return check
+
+
+
+
+# SEQ files of a SHP are named after it, like 00_COM.SEQ and 00_BT1.SEQ for 00.SHP
+SEQ_SUFFIXES = ["_COM.SEQ","_BT1.SEQ","_BT2.SEQ","_BT3.SEQ","_BT4.SEQ","_BT5.SEQ","_BT6.SEQ","_BT7.SEQ","_BT8.SEQ","_BT9.SEQ","_BTA.SEQ"]
+
+def findSEQs(filepath):
+    # SEQ files of a SHP in SEQ_SUFFIXES order, the importer, glTF export and conversion find the same ones
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    seqfilepaths = []
+    for suffix in SEQ_SUFFIXES:
+        seqfilepath = os.path.join(os.path.dirname(filepath), name+suffix)
+        if Index.isfile(seqfilepath):
+            seqfilepaths.append(seqfilepath)
+    return seqfilepaths
+
+def load(filepath):
+    shp = SHP()
+    shp.loadFromFile(filepath)
+    return shp
+
+def buildFile(filepath):
+    # mesh object of a SHP, its parent is the armature
+    if Cache.settings.enabled == True:
+        # converted arrays from the disk cache, the file is only parsed once
+        header, arrays = Intermediate.cached("SHP", [filepath], lambda: Intermediate.fromSHP(load(filepath)))
+        return Intermediate.build(header, arrays)[0]
     shp = SHP()
     # we read datas from a file
     shp.loadFromFile(filepath)
     # we build geometry from datas
-    shpObj = shp.buildGeometry()
-
-    # we seek a corresponding SEQ to display the SHP in a better way
-    #print("filepath : "+filepath)
-    #print("bpy.path.basename : "+bpy.path.basename(filepath))
-    #print("bpy.path.display_name : "+bpy.path.display_name(filepath))
-    topa = ["_COM.SEQ","_BT1.SEQ","_BT2.SEQ","_BT3.SEQ","_BT4.SEQ","_BT5.SEQ","_BT6.SEQ","_BT7.SEQ","_BT8.SEQ","_BT9.SEQ","_BTA.SEQ"]
-    seq = None
-    for seqpath in topa:
-        seqfilepath = filepath.replace(bpy.path.basename(filepath), bpy.path.display_name(filepath)+seqpath)
-        if os.path.isfile(seqfilepath):
-            #print("Corresponding SEQ found at : "+repr(seqfilepath))
+    return shp.buildGeometry()
+
+def BlenderImport(operator, context, filepath, bool_anim_trans = False, float_anim_tolerance = 0.0, bool_all_anims = False, bool_all_seqs = False):
+    # we seek corresponding SEQ to display the SHP in a better way
+    seqfilepaths = findSEQs(filepath)
+    if bool_all_seqs == False:
+        seqfilepaths = seqfilepaths[0:1] # we don't need to load every corresponding SEQ
+
+    futures = None
+    if bool_all_seqs == True and len(seqfilepaths) > 1:
+        # SEQ are decoded in parallel while we build the armature and the mesh
+        futures = SEQ.decodeInBackground(seqfilepaths)
+
+    shpObj = buildFile(filepath)
 
+    for i in range(0, len(seqfilepaths)):
+        if futures is not None:
+            seq = futures[i].result()
+        else:
             seq = SEQ.SEQ()
-            seq.loadFromFile(seqfilepath)
-            # we attach SEQ animations to the builded 3D model
-            seq.buildAnimations(shpObj, bool_anim_trans)
-            shpObj.parent.animation_data.action = bpy.data.actions[seq.name + "_Animation_0"]
-            break # we don't need to load every corresponding SEQ
+            seq.loadFromFile(seqfilepaths[i])
+        # we attach SEQ animations to the builded 3D model, actions are built when needed
+        SEQ.attach(shpObj.parent, seq, seqfilepaths[i], 0, bool_anim_trans, float_anim_tolerance)
+        if i == 0 and len(seq.animations) > 0:
+            shpObj.parent.animations.active = seq.name + "_Animation_0"
+
+    if bool_all_seqs == True:
+        SEQ.layoutNLA(shpObj.parent)
+    elif bool_all_anims == True:
+        SEQ.buildAllAnimations(shpObj.parent)
 
     # selecting armature
     shpObj.parent.name = bpy.path.display_name(filepath)
@@ -96,6 +153,51 @@ def BlenderImport(operator, context, filepath, bool_anim_trans = False):
 
     return {"FINISHED"}
 
+def probe(filepath):
+    # header only, a few bytes are read, nothing is decoded
+    infos = {"format": "SHP", "name": VS.displayName(filepath), "filesize": os.stat(filepath).st_size}
+    file = open(filepath, "rb")
+    if file.read(4) == VS.SIG:
+        header = SHPHeader()
+        header.feed(file)
+        # the texture follows the magic section
+        file.seek(header.magicPtr)
+        num, magicNum = struct.unpack("2I", file.read(8))
+        file.seek(magicNum, 1)
+        texturePtr = file.tell()
+        texMapSize, unk, halfW, halfH, numColor = struct.unpack("I 4B", file.read(8))
+        infos.update({
+            "numBones": header.numBones,
+            "numGroups": header.numGroups,
+            "numFaces": header.numFaces,
+            "numTri": header.numTri,
+            "numQuad": header.numQuad,
+            "numPoly": header.numPoly,
+            "textureWidth": halfW * 2,
+            "textureHeight": halfH * 2,
+            "numColors": numColor,
+            "sections": {
+                "bones": header.groupPtr - header.bonePtr,
+                "groups": header.vertexPtr - header.groupPtr,
+                "vertices": header.polygonPtr - header.vertexPtr,
+                "faces": header.AKAOPtr - header.polygonPtr,
+                "AKAO": header.magicPtr - header.AKAOPtr,
+                "magic": magicNum + 8,
+                "texture": texMapSize,
+            },
+            "offsets": {
+                "bones": header.bonePtr,
+                "groups": header.groupPtr,
+                "vertices": header.vertexPtr,
+                "faces": header.polygonPtr,
+                "AKAO": header.AKAOPtr,
+                "magic": header.magicPtr,
+                "texture": texturePtr,
+            },
+        })
+    file.close()
+    return infos
+
 class SHP:
     def __init__(self):
         self.name = ".SHP"
@@ -110,10 +212,13 @@ class SHP:
         return("(--"+repr(self.name)+".SHP-- | "+repr(self.header)+")")
     def loadFromFile(self, filepath):
         # Open a SHP file and parse it
+        self.name = VS.displayName(filepath)
+        if Cache.restore(self, filepath):
+            return
         file = open(filepath, "rb")
-        self.name = bpy.path.display_name(filepath)
         self.parse(file)
         file.close()
+        Cache.store(self, filepath)
     def parse(self, file):
         signature = file.read(4)
         if signature != VS.SIG:
@@ -121,7 +226,6 @@ class SHP:
 
         # SHP HEADER
         self.header.feed(file)
-        #print(self)
 
         # SHP BONES SECTION
         self.bones = BoneSection.parse(file, self.header.numBones)
@@ -159,11 +263,8 @@ class SHP:
         self.tim = TIM.SHPTIM()
         self.tim.doubleClut = self.hasColoredVertex
         self.tim.feed(file)
-        #print(self.tim)
 
     def buildGeometry(self):
-        #print("SHP Building...")
-
         view_layer = bpy.context.view_layer
         # Creating Bones for Blender
         armature = bpy.data.armatures.new("Armature")
@@ -193,7 +294,6 @@ class SHP:
             else:
                 blender_bone.parent = edit_bones[vs_bone.parent.name]
                 # matrix[0][3] = blender_bone.parent.head[0] + vs_bone.parent.length / 100
-                # print("Bone "+repr(vs_bone)+" -> id : "+repr(blender_bone.matrix))
                 if vs_bone.parentIndex != 0:
                     # blender_bone.head = blender_bone.parent.tail
                     blender_bone.head = (blender_bone.parent.head[0] - vs_bone.parent.length / VS.VERTEX_RATIO, 0, 0)
@@ -215,6 +315,10 @@ class SHP:
         blender_mesh.from_pydata(self.getVerticesForBlender(), [], self.getFacesForBlender())
         blender_obj = bpy.data.objects.new(mesh_name, object_data=blender_mesh)
 
+        indices = None
+        if Textures.settings.enabled == True and len(self.tim.cluts) > 0:
+            indices = Textures.timIndices(self.tim)
+            palettes = Textures.palettes(self.tim.palletColors)
         for i in range(0, len(self.tim.textures)):
             mat = bpy.data.materials.new(name=str(self.name + "_Mat"+str(i)))
             mat.use_nodes = True
@@ -224,8 +328,8 @@ class SHP:
             bsdf.inputs["Specular"].default_value = 0
             bsdf.inputs["Metallic"].default_value = 0
             texImage = mat.node_tree.nodes.new("ShaderNodeTexImage")
-            texImage.image = bpy.data.images.new(str(self.name + "_Tex"+str(i)), self.tim.textureWidth, self.tim.textureHeigth)
-            texImage.image.pixels = self.tim.textures[i]
+            texImage.image = Textures.newImage(str(self.name + "_Tex"+str(i)), self.tim.textureWidth, self.tim.textureHeigth,
+                self.tim.textures[i], indices, palettes[i] if indices is not None else None)
             texImage.interpolation = "Closest"  # texture filter
             # we use the first texture for the material by default
             if self.hasColoredVertex == True:
@@ -276,7 +380,6 @@ class SHP:
 
         # special case
         if self.name == "50":
-            #print(self.name)
             self.tim.textureWidth = self.tim.textureHeigth = 256
 
         for face in blender_mesh.polygons:
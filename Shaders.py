@@ -0,0 +1,161 @@
+bl_info = {
+    "name": "Vagrant Story file formats Add-on",
+    "description": "Import-Export Vagrant Story file formats (WEP, SHP, SEQ, ZUD, MPD, ZND, P, FBT, FBC).",
+    "author": "Sigfrid Korobetski (LunaticChimera)",
+    "version": (2, 12),
+    "blender": (3, 2, 0),
+    "location": "File > Import-Export",
+    "category": "Import-Export",
+}
+
+# shader node groups shared by palette-indexed materials
+# an index image keeps CLUT indexes (index / 255 in a Non-Color image), a palette image keeps one CLUT per row,
+# materials sample the index, the lookup group gives the palette texel of this index in the chosen row
+# node groups are created once per .blend and reused by every material
+# rooms also use a grey alpha group, translucent faces take the average of their color as alpha like color.alphaFromGrey
+
+try:
+    import bpy
+except ImportError:
+    # nothing to build without Blender
+    bpy = None
+
+import numpy as np
+
+from . import Textures
+
+
+PALETTE_LOOKUP = "VS Palette Lookup"
+GREY_ALPHA = "VS Grey Alpha"
+
+
+def paletteLookup():
+    group = bpy.data.node_groups.get(PALETTE_LOOKUP)
+    if group is not None:
+        return group
+    group = bpy.data.node_groups.new(PALETTE_LOOKUP, "ShaderNodeTree")
+    group.inputs.new("NodeSocketColor", "Index")
+    group.inputs.new("NodeSocketFloat", "Row")
+    group.inputs.new("NodeSocketFloat", "Colors").default_value = 16
+    group.inputs.new("NodeSocketFloat", "Rows").default_value = 1
+    group.outputs.new("NodeSocketVector", "Vector")
+    nodes = group.nodes
+    links = group.links
+    inputs = nodes.new("NodeGroupInput")
+    outputs = nodes.new("NodeGroupOutput")
+
+    # index from the red channel, rounded because of 8 bits precision
+    channels = nodes.new("ShaderNodeSeparateXYZ")
+    links.new(channels.inputs["Vector"], inputs.outputs["Index"])
+    scale = nodes.new("ShaderNodeMath")
+    scale.operation = "MULTIPLY"
+    scale.inputs[1].default_value = 255
+    links.new(scale.inputs[0], channels.outputs["X"])
+    index = nodes.new("ShaderNodeMath")
+    index.operation = "ROUND"
+    links.new(index.inputs[0], scale.outputs["Value"])
+
+    # we sample texel centers : (index + 0.5) / colors, (row + 0.5) / rows
+    coords = []
+    for value, count in [(index.outputs["Value"], inputs.outputs["Colors"]), (inputs.outputs["Row"], inputs.outputs["Rows"])]:
+        rounded = nodes.new("ShaderNodeMath")
+        rounded.operation = "ROUND"
+        links.new(rounded.inputs[0], value)
+        center = nodes.new("ShaderNodeMath")
+        center.operation = "ADD"
+        center.inputs[1].default_value = 0.5
+        links.new(center.inputs[0], rounded.outputs["Value"])
+        coord = nodes.new("ShaderNodeMath")
+        coord.operation = "DIVIDE"
+        links.new(coord.inputs[0], center.outputs["Value"])
+        links.new(coord.inputs[1], count)
+        coords.append(coord)
+    vector = nodes.new("ShaderNodeCombineXYZ")
+    links.new(vector.inputs["X"], coords[0].outputs["Value"])
+    links.new(vector.inputs["Y"], coords[1].outputs["Value"])
+    links.new(outputs.inputs["Vector"], vector.outputs["Vector"])
+    return group
+
+
+def mathNode(group, operation, a, b = None):
+    # math node on sockets or constants, returns its output
+    node = group.nodes.new("ShaderNodeMath")
+    node.operation = operation
+    for i, value in enumerate([a, b]):
+        if value is None:
+            continue
+        if isinstance(value, (int, float)):
+            node.inputs[i].default_value = value
+        else:
+            group.links.new(node.inputs[i], value)
+    return node.outputs["Value"]
+
+def greyAlpha():
+    group = bpy.data.node_groups.get(GREY_ALPHA)
+    if group is not None:
+        return group
+    group = bpy.data.node_groups.new(GREY_ALPHA, "ShaderNodeTree")
+    group.inputs.new("NodeSocketColor", "Color")
+    group.inputs.new("NodeSocketFloat", "Alpha")
+    group.inputs.new("NodeSocketFloat", "Translucent")
+    group.outputs.new("NodeSocketFloat", "Alpha")
+    inputs = group.nodes.new("NodeGroupInput")
+    outputs = group.nodes.new("NodeGroupOutput")
+    channels = group.nodes.new("ShaderNodeSeparateXYZ")
+    group.links.new(channels.inputs["Vector"], inputs.outputs["Color"])
+
+    # sampled colors are linear, the game averages the 8 bits sRGB values so we encode them back
+    grey = None
+    for channel in ["X", "Y", "Z"]:
+        linear = mathNode(group, "MAXIMUM", channels.outputs[channel], 0.0)
+        low = mathNode(group, "MULTIPLY", linear, 12.92)
+        high = mathNode(group, "SUBTRACT", mathNode(group, "MULTIPLY", mathNode(group, "POWER", linear, 1 / 2.4), 1.055), 0.055)
+        isLow = mathNode(group, "LESS_THAN", linear, 0.0031308)
+        encoded = mathNode(group, "ADD", high, mathNode(group, "MULTIPLY", isLow, mathNode(group, "SUBTRACT", low, high)))
+        grey = encoded if grey is None else mathNode(group, "ADD", grey, encoded)
+    grey = mathNode(group, "DIVIDE", grey, 3.0)
+
+    # Alpha + Translucent * (grey - Alpha)
+    alpha = mathNode(group, "ADD", inputs.outputs["Alpha"], mathNode(group, "MULTIPLY", inputs.outputs["Translucent"], mathNode(group, "SUBTRACT", grey, inputs.outputs["Alpha"])))
+    group.links.new(outputs.inputs["Alpha"], alpha)
+    return group
+
+
+def indexImage(name, indices):
+    # (height, width) indexes, rows from bottom to top, as grey levels
+    height, width = indices.shape
+    pixels = np.ones((height, width, 4), dtype=np.float32)
+    pixels[:, :, 0:3] = (indices.astype(np.float32) / 255)[:, :, None]
+    # cached as an indexed PNG with a grey palette, 4 bits for ZND pages
+    levels = np.arange(0, 16 if indices.max(initial=0) < 16 else 256, dtype=np.uint8)
+    grey = np.stack([levels, levels, levels, np.full_like(levels, 255)], axis=-1)
+    image = Textures.newImage(name, width, height, pixels, indices, grey)
+    # indexes must be read as they are
+    image.colorspace_settings.name = "Non-Color"
+    return image
+
+def paletteImage(name, palettes):
+    # (rows, colors, 4) uint8, one palette per row
+    rows, colors = palettes.shape[0], palettes.shape[1]
+    return Textures.newImage(name, colors, rows, palettes.astype(np.float32) / 255)
+
+def paletteNodes(mat, indexImage, paletteImage, colors, rows, row):
+    # index texture -> lookup group -> palette texture, returns the palette texture node
+    # colors and rows are the palette image size (loaded images aren't read for it), row is a node output giving the palette row
+    nodes = mat.node_tree.nodes
+    links = mat.node_tree.links
+    indexTex = nodes.new("ShaderNodeTexImage")
+    indexTex.image = indexImage
+    indexTex.interpolation = "Closest"  # indexes can't be blended
+    lookup = nodes.new("ShaderNodeGroup")
+    lookup.node_tree = paletteLookup()
+    lookup.inputs["Colors"].default_value = colors
+    lookup.inputs["Rows"].default_value = rows
+    links.new(lookup.inputs["Index"], indexTex.outputs["Color"])
+    links.new(lookup.inputs["Row"], row)
+    paletteTex = nodes.new("ShaderNodeTexImage")
+    paletteTex.image = paletteImage
+    paletteTex.interpolation = "Closest"
+    paletteTex.extension = "EXTEND"
+    links.new(paletteTex.inputs["Vector"], lookup.outputs["Vector"])
+    return paletteTex
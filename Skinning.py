@@ -0,0 +1,193 @@
+bl_info = {
+    "name": "Vagrant Story file formats Add-on",
+    "description": "Import-Export Vagrant Story file formats (WEP, SHP, SEQ, ZUD, MPD, ZND, P, FBT, FBC).",
+    "author": "Sigfrid Korobetski (LunaticChimera)",
+    "version": (2, 12),
+    "blender": (3, 2, 0),
+    "location": "File > Import-Export",
+    "category": "Import-Export",
+}
+
+# CPU linear blend skinning of a SHP posed by a SEQ animation, no Blender needed
+# each SHP vertex is weighted to a single bone (see GroupSection), so a vertex is only transformed by one matrix
+# positions are given in the Blender armature space, the same result the Armature modifier gives after a SHP + SEQ import
+#
+# usage :
+#   shp = SHP.SHP()
+#   shp.loadFromFile("00.SHP")
+#   seq = SEQ.SEQ()
+#   seq.loadFromFile("00_COM.SEQ")
+#   skin = Skinning.Skin(shp)
+#   positions = skin.deform(seq.animations[0], 12)  # (numVertices, 3) array
+
+import math
+
+import numpy as np
+
+from . import VS
+
+
+class Skin:
+    def __init__(self, shp):
+        self.shp = shp
+        self.numBones = len(shp.bones)
+        # we gather the bone index of each vertex once
+        self.boneIndices = np.array([vertex.bone.index for vertex in shp.vertices], dtype=np.intp)
+        self.restPositions = np.ones((len(shp.vertices), 4))
+        if len(shp.vertices) > 0:
+            self.restPositions[:, :3] = shp.getVerticesForBlender()
+        self.parents = [-1 if bone.parent is None else bone.parent.index for bone in shp.bones]
+        self.restMatrices = restMatrices(shp.bones)
+        self.restInverses = np.linalg.inv(self.restMatrices)
+        # bone offsets relative to the parent bone, constant for every frame
+        self.offsets = np.empty_like(self.restMatrices)
+        for i in range(0, self.numBones):
+            if self.parents[i] == -1:
+                self.offsets[i] = self.restMatrices[i]
+            else:
+                self.offsets[i] = self.restInverses[self.parents[i]] @ self.restMatrices[i]
+        self.tracks = {}
+
+    def poseMatrices(self, anim, frame):
+        # bone matrices in armature space for the given frame
+        local = np.tile(np.identity(4), (self.numBones, 1, 1))
+        local[:, :3, :3] = quaternionToMatrix(self.sampleRotations(anim, frame))
+        poses = np.empty_like(local)
+        # parent bones are always defined before their children
+        for i in range(0, self.numBones):
+            if self.parents[i] == -1:
+                poses[i] = self.offsets[i] @ local[i]
+            else:
+                poses[i] = poses[self.parents[i]] @ self.offsets[i] @ local[i]
+        return poses
+
+    def skinMatrices(self, anim, frame):
+        return self.poseMatrices(anim, frame) @ self.restInverses
+
+    def deform(self, anim, frame):
+        # one batched matmul : every vertex is multiplied by the skin matrix of its bone
+        matrices = self.skinMatrices(anim, frame)[self.boneIndices]
+        return (matrices @ self.restPositions[:, :, None])[:, :3, 0]
+
+    def bounds(self, anim):
+        # per frame bounding boxes, (anim.length, 2, 3) array of [min, max]
+        boxes = np.zeros((anim.length, 2, 3))
+        for frame in range(0, anim.length):
+            positions = self.deform(anim, frame)
+            if len(positions) > 0:
+                boxes[frame, 0] = positions.min(axis=0)
+                boxes[frame, 1] = positions.max(axis=0)
+        return boxes
+
+    def sampleRotations(self, anim, frame):
+        # bone quaternions (w, x, y, z) at the given frame, keys are interpolated linearly
+        rotations = np.zeros((self.numBones, 4))
+        rotations[:, 0] = 1
+        for i, (times, quaternions) in enumerate(self.getTracks(anim)):
+            if i >= self.numBones or len(times) == 0:
+                continue
+            k = np.searchsorted(times, frame, side="right")
+            if k == 0:
+                q = quaternions[0]
+            elif k == len(times):
+                q = quaternions[-1]
+            else:
+                t = (frame - times[k - 1]) / (times[k] - times[k - 1])
+                q = quaternions[k - 1] * (1 - t) + quaternions[k] * t
+            rotations[i] = q / np.linalg.norm(q)
+        return rotations
+
+    def getTracks(self, anim):
+        # absolute rotation keys of each bone, expanded once per animation
+        if id(anim) not in self.tracks:
+            tracks = []
+            for i in range(0, len(anim.rotationKeysPerBone)):
+                keys = np.array(anim.rotationKeys(i), dtype=float).reshape(-1, 4)
+                tracks.append((keys[:, 0], eulerToQuaternion(keys[:, 1], keys[:, 2], keys[:, 3])))
+            self.tracks[id(anim)] = tracks
+        return self.tracks[id(anim)]
+
+
+def restMatrices(bones):
+    # we place bones exactly like SHP.buildGeometry does, so results fit the Blender armature
+    heads = []
+    matrices = np.tile(np.identity(4), (len(bones), 1, 1))
+    for bone in bones:
+        if bone.parent is None:
+            head = np.zeros(3)
+            tail = np.array([0, 0.0001, 0])
+        else:
+            head = np.zeros(3)
+            if bone.parentIndex != 0:
+                head[0] = heads[bone.parent.index][0] - bone.parent.length / VS.VERTEX_RATIO
+            tail = np.array([head[0], 0, bone.length / VS.VERTEX_RATIO / 10])
+        heads.append(head)
+        matrices[bone.index, :3, :3] = boneRotation(tail - head)
+        matrices[bone.index, :3, 3] = head
+    return matrices
+
+
+def boneRotation(vector):
+    # Blender vec_roll_to_mat3 with a roll of 0, the bone Y axis follows the head -> tail vector
+    length = np.linalg.norm(vector)
+    if length == 0:
+        return np.identity(3)
+    x, y, z = vector / length
+    theta = 1 + y
+    thetaAlt = x * x + z * z
+    if theta > 6.1e-3 or thetaAlt > 2.5e-4 * 2.5e-4:
+        if theta <= 6.1e-3:
+            theta = thetaAlt * 0.5 + thetaAlt * thetaAlt * 0.125
+        return np.array([
+            [1 - x * x / theta, x, -x * z / theta],
+            [-x, y, -z],
+            [-x * z / theta, z, 1 - z * z / theta],
+        ])
+    return np.diag([-1.0, -1.0, 1.0])
+
+
+def quaternionMultiply(a, b):
+    aw, ax, ay, az = np.moveaxis(a, -1, 0)
+    bw, bx, by, bz = np.moveaxis(b, -1, 0)
+    return np.stack([
+        aw * bw - ax * bx - ay * by - az * bz,
+        aw * bx + ax * bw + ay * bz - az * by,
+        aw * by - ax * bz + ay * bw + az * bx,
+        aw * bz + ax * by - ay * bx + az * bw,
+    ], axis=-1)
+
+
+def eulerToQuaternion(rx, ry, rz):
+    # same composition as Anim.build : qw @ qv @ qu
+    zeros = np.zeros_like(rx)
+    qu = np.stack([np.cos(rx / 2), np.sin(rx / 2), zeros, zeros], axis=-1)
+    qv = np.stack([np.cos(ry / 2), zeros, np.sin(ry / 2), zeros], axis=-1)
+    qw = np.stack([np.cos(rz / 2), zeros, zeros, np.sin(rz / 2)], axis=-1)
+    return quaternionMultiply(quaternionMultiply(qw, qv), qu)
+
+
+def quaternionToMatrix(q):
+    w, x, y, z = np.moveaxis(q, -1, 0)
+    return np.stack([
+        np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)], axis=-1),
+        np.stack([2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)], axis=-1),
+        np.stack([2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)], axis=-1),
+    ], axis=-2)
+
+
+def matrixToQuaternion(m):
+    # (w, x, y, z) of a 3x3 rotation matrix
+    trace = m[0, 0] + m[1, 1] + m[2, 2]
+    if trace > 0:
+        s = math.sqrt(trace + 1) * 2
+        q = np.array([s / 4, (m[2, 1] - m[1, 2]) / s, (m[0, 2] - m[2, 0]) / s, (m[1, 0] - m[0, 1]) / s])
+    elif m[0, 0] > m[1, 1] and m[0, 0] > m[2, 2]:
+        s = math.sqrt(1 + m[0, 0] - m[1, 1] - m[2, 2]) * 2
+        q = np.array([(m[2, 1] - m[1, 2]) / s, s / 4, (m[0, 1] + m[1, 0]) / s, (m[0, 2] + m[2, 0]) / s])
+    elif m[1, 1] > m[2, 2]:
+        s = math.sqrt(1 + m[1, 1] - m[0, 0] - m[2, 2]) * 2
+        q = np.array([(m[0, 2] - m[2, 0]) / s, (m[0, 1] + m[1, 0]) / s, s / 4, (m[1, 2] + m[2, 1]) / s])
+    else:
+        s = math.sqrt(1 + m[2, 2] - m[0, 0] - m[1, 1]) * 2
+        q = np.array([(m[1, 0] - m[0, 1]) / s, (m[0, 2] + m[2, 0]) / s, (m[1, 2] + m[2, 1]) / s, s / 4])
+    return q / np.linalg.norm(q)
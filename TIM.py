@@ -9,7 +9,11 @@ bl_info = {
 }
 
 import struct
-import bpy
+try:
+    import bpy
+except ImportError:
+    # only FrameBuffer.buildTexture needs Blender
+    bpy = None
 from . import color
 
 class WEPTIM:
@@ -53,6 +57,8 @@ class WEPTIM:
                 for y in range(0, self.textureHeigth):
                     clut = struct.unpack("B", file.read(1))[0]  # CLUT colour reference
                     cluts.append(clut)
+            # indexes are kept, palette-indexed exports don't need to match colors again (see Intermediate)
+            self.cluts = cluts
             for i in range(0, self.numPallets):
                 pixmap = []
                 for j in range(0, len(cluts)):
@@ -151,6 +157,7 @@ class SHPTIM:
                         id = struct.unpack("B", file.read(1))[0]
                         cluts.append(id % 16)
                         cluts.append(id // 16)
+            self.cluts = cluts
             for i in range(0, self.numPallets):
                 pixmap = []
                 for j in range(0, len(cluts)):
@@ -0,0 +1,131 @@
+bl_info = {
+    "name": "Vagrant Story file formats Add-on",
+    "description": "Import-Export Vagrant Story file formats (WEP, SHP, SEQ, ZUD, MPD, ZND, P, FBT, FBC).",
+    "author": "Sigfrid Korobetski (LunaticChimera)",
+    "version": (2, 12),
+    "blender": (3, 2, 0),
+    "location": "File > Import-Export",
+    "category": "Import-Export",
+}
+
+# decoded textures as palette indexes, and a texture cache of PNG files named after their content
+# with the cache, importers load PNG files with bpy.data.images.load instead of filling generated images,
+# the same texture imported twice is the same file, Blender shares it between materials and scenes and loads it when needed
+# CLUT textures (WEP, SHP, ZND) are indexed PNG, so palettes are kept, FBT sprite sheets are RGBA PNG
+# files are never removed, saved .blend files link to them
+#
+# the add-on preferences configure it, without Blender :
+#   Textures.settings.enabled = True
+#   Textures.settings.directory = "~/.cache/vagrant_story/textures"
+
+import os
+import hashlib
+
+try:
+    import bpy
+except ImportError:
+    # textures can be decoded and written without Blender
+    bpy = None
+
+import numpy as np
+
+from . import PNG, Cache
+
+
+class Settings:
+    def __init__(self):
+        self.enabled = False
+        # next to the parse cache, per user like it
+        self.directory = Cache.userDirectory("textures")
+
+settings = Settings()
+
+
+def timIndices(tim):
+    # CLUT index of each pixel of a WEP or SHP texture, the same pixel order as tim.textures (rows from bottom to top)
+    indices = np.array(tim.cluts, dtype=np.uint8)
+    # like TIM feed, out of palette indexes take the first color
+    indices[indices >= tim.numColor] = 0
+    return indices.reshape(tim.textureHeigth, tim.textureWidth)
+
+def weaponIndices(tim):
+    # like WEPTIM feed, palette colors are written in the first pixels
+    indices = timIndices(tim)
+    count = min(tim.numColor, indices.size)
+    indices.reshape(-1)[:count] = np.arange(0, count)
+    return indices
+
+def palettes(palletColors):
+    # (palettes, colors, 4) uint8 RGBA
+    return np.array([[col.toRGBA() for col in colors] for colors in palletColors], dtype=np.uint8).reshape(len(palletColors), -1, 4)
+
+def pageIndices(tim):
+    # 4 bits indexes of a ZND texture page, two pixels per byte, low nibble first like TIM16BPP.build
+    datas = np.frombuffer(bytes(tim.bytes), dtype=np.uint8, count=tim.width * tim.height * 2)
+    return np.stack([datas & 0x0F, datas >> 4], axis=-1).reshape(tim.height, tim.width * 4)
+
+def clutColors(znd, clutId, translucent = False):
+    # alpha from grey is computed here, ZND colors are left untouched
+    colors = np.array([col.toRGBA() for col in znd.getCLUT(clutId)], dtype=np.uint8)
+    if translucent == True:
+        colors[:, 3] = np.round(colors[:, :3].astype(np.float64).mean(axis=1))
+    return colors
+
+
+def toBytes(pixels, width, height):
+    # Blender float pixels (flat or (height, width, 4)) to uint8
+    pixels = np.asarray(pixels)
+    if pixels.dtype != np.uint8:
+        pixels = np.clip(np.round(pixels.astype(np.float32) * 255), 0, 255).astype(np.uint8)
+    return pixels.reshape(height, width, 4)
+
+def store(name, datas):
+    # content addressed, an existing file is the same texture
+    path = os.path.join(settings.directory, name[0:2], name+".png")
+    if not os.path.isfile(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written aside then renamed, an other Blender could write the same texture at the same time
+        temp = path+"."+repr(os.getpid())+".tmp"
+        file = open(temp, "wb")
+        file.write(datas)
+        file.close()
+        os.replace(temp, path)
+    return path
+
+def storeIndexed(indices, palette):
+    # indices rows go from bottom to top like Blender pixels
+    indices = np.ascontiguousarray(indices, dtype=np.uint8)
+    palette = np.ascontiguousarray(palette, dtype=np.uint8)
+    sha1 = hashlib.sha1()
+    sha1.update(repr(indices.shape).encode())
+    sha1.update(indices.tobytes())
+    sha1.update(palette.tobytes())
+    return store(sha1.hexdigest(), PNG.encodeIndexed(indices[::-1], palette))
+
+def storePixels(pixels, width, height):
+    pixels = np.ascontiguousarray(toBytes(pixels, width, height))
+    sha1 = hashlib.sha1()
+    sha1.update(repr(pixels.shape).encode())
+    sha1.update(pixels.tobytes())
+    return store(sha1.hexdigest(), PNG.encode(pixels[::-1]))
+
+
+def newImage(name, width, height, pixels, indices = None, palette = None):
+    # replaces bpy.data.images.new + pixels, indices and palette give an indexed PNG when the cache is enabled
+    if settings.enabled == False:
+        image = bpy.data.images.new(name, width, height)
+        if isinstance(pixels, np.ndarray):
+            # no copy for float32 pixels, sprite sheets and atlases stay a single float32 copy
+            image.pixels.foreach_set(np.asarray(pixels, dtype=np.float32).ravel())
+        else:
+            image.pixels = pixels
+        return image
+    if indices is not None and palette is not None:
+        path = storeIndexed(indices, palette)
+    else:
+        path = storePixels(pixels, width, height)
+    # the same file gives the same image
+    image = bpy.data.images.load(path, check_existing=True)
+    if image.users == 0:
+        image.name = name
+    return image
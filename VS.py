@@ -8,8 +8,19 @@ bl_info = {
     "category": "Import-Export",
 }
 
+import os
+
 SIG = b"H01\x00"
 VERTEX_RATIO = 128
+
+def displayName(filepath):
+    # same result as bpy.path.display_name, so parsed objects get the same names with or without Blender
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    name = name.replace("_colon_", ":").replace("_plus_", "+").replace("_", " ")
+    if name and name.islower():
+        name = name.lower().title()
+    return name
+
 def MDPToZND(mdpName):
     # http://datacrystal.romhacking.net/wiki/Vagrant_Story:rooms_list
     table = []
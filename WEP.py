@@ -16,56 +16,76 @@ import os
 import math
 import struct
 
-import bpy
-from bpy.props import BoolProperty, EnumProperty, FloatProperty, StringProperty, CollectionProperty
-from bpy_extras.io_utils import ExportHelper, ImportHelper
-
-from . import TIM, VS, BoneSection, FaceSection, GroupSection, VertexSection, color
-
-
-# CALLED BY BLENDER
-class Import(bpy.types.Operator, ImportHelper):
-    """Load a WEP file"""
-
-    bl_idname = "import_mesh.wep"
-    bl_label = "Import WEP"
-    filename_ext = ".WEP"
-
-    filepath: bpy.props.StringProperty(default="", subtype="FILE_PATH")
-    filter_glob: bpy.props.StringProperty(default="*.WEP", options={"HIDDEN"})
-
-    def execute(self, context):
-        keywords = self.as_keywords(ignore=("axis_forward", "axis_up", "filter_glob"))
-        BlenderImport(self, context, **keywords)
-
+try:
+    import bpy
+    from bpy.props import BoolProperty, EnumProperty, FloatProperty, StringProperty, CollectionProperty
+    from bpy_extras.io_utils import ExportHelper, ImportHelper
+except ImportError:
+    # parsing doesn't need Blender
+    bpy = None
+
+from . import TIM, VS, BoneSection, FaceSection, GroupSection, VertexSection, color, Cache, Textures, Shaders, Intermediate
+
+
+if bpy is not None:
+    # CALLED BY BLENDER
+    class Import(bpy.types.Operator, ImportHelper):
+        """Load a WEP file"""
+
+        bl_idname = "import_mesh.wep"
+        bl_label = "Import WEP"
+        filename_ext = ".WEP"
+
+        filepath: bpy.props.StringProperty(default="", subtype="FILE_PATH")
+        filter_glob: bpy.props.StringProperty(default="*.WEP", options={"HIDDEN"})
+        bool_palette_shader: bpy.props.BoolProperty(
+            name="Palette Shader",
+            description="One index texture and a palette strip instead of 7 textures, the \"variant\" object property picks the material (the weapon can't be exported then)",
+            default=False,
+        )
+
+        def execute(self, context):
+            keywords = self.as_keywords(ignore=("axis_forward", "axis_up", "filter_glob"))
+            BlenderImport(self, context, **keywords)
+
+            return {"FINISHED"}
+
+    # CALLED BY BLENDER
+    class Export(bpy.types.Operator, ExportHelper):
+        """Save a WEP file"""
+
+        bl_idname = "export_mesh.wep"
+        bl_label = "Export WEP"
+        check_extension = True
+        filename_ext = ".WEP"
+
+        filter_glob: bpy.props.StringProperty(default="*.WEP", options={"HIDDEN"})
+
+        def execute(self, context):
+            keywords = self.as_keywords(ignore=("axis_forward", "axis_up", "filter_glob", "check_existing"))
+            check = False
+            check = BlenderExport(self, context, **keywords)
+            return check
+
+
+def BlenderImport(operator, context, filepath, bool_palette_shader = False):
+    if Cache.settings.enabled == True and bool_palette_shader == False:
+        # converted arrays from the disk cache, the file is only parsed once
+        header, arrays = Intermediate.cached("WEP", [filepath], lambda: Intermediate.fromWEP(load(filepath)))
+        Intermediate.build(header, arrays)
         return {"FINISHED"}
-
-# CALLED BY BLENDER
-class Export(bpy.types.Operator, ExportHelper):
-    """Save a WEP file"""
-
-    bl_idname = "export_mesh.wep"
-    bl_label = "Export WEP"
-    check_extension = True
-    filename_ext = ".WEP"
-
-    filter_glob: bpy.props.StringProperty(default="*.WEP", options={"HIDDEN"})
-
-    def execute(self, context):
-        keywords = self.as_keywords(ignore=("axis_forward", "axis_up", "filter_glob", "check_existing"))
-        check = False
-        check = BlenderExport(self, context, **keywords)
-        return check
-
-
-def BlenderImport(operator, context, filepath):
     wep = WEP()
     # we read datas from a file
     wep.loadFromFile(filepath)
     # we build geometry from datas
-    wep.buildGeometry()
+    wep.buildGeometry(0, bool_palette_shader)
     return {"FINISHED"}
 
+def load(filepath):
+    wep = WEP()
+    wep.loadFromFile(filepath)
+    return wep
+
 def BlenderExport(operator, context, filepath):
     scene = context.scene
     obj = bpy.context.view_layer.objects.active
@@ -82,6 +102,43 @@ def BlenderExport(operator, context, filepath):
 
     return {"FINISHED"}
 
+def probe(filepath):
+    # header only, a few bytes are read, nothing is decoded
+    infos = {"format": "WEP", "name": VS.displayName(filepath), "filesize": os.stat(filepath).st_size}
+    file = open(filepath, "rb")
+    if file.read(4) == VS.SIG:
+        header = WEPHeader()
+        header.feed(file)
+        file.seek(header.texturePtr)
+        texMapSize, unk, halfW, halfH, numColor = struct.unpack("I 4B", file.read(8))
+        infos.update({
+            "numBones": header.numBones,
+            "numGroups": header.numGroups,
+            "numFaces": header.numFaces,
+            "numTri": header.numTri,
+            "numQuad": header.numQuad,
+            "numPoly": header.numPoly,
+            "textureWidth": halfW * 2,
+            "textureHeight": halfH * 2,
+            "numColors": numColor,
+            "sections": {
+                "bones": header.groupPtr - header.bonePtr,
+                "groups": header.vertexPtr - header.groupPtr,
+                "vertices": header.polygonPtr - header.vertexPtr,
+                "faces": header.texturePtr - header.polygonPtr,
+                "texture": texMapSize,
+            },
+            "offsets": {
+                "bones": header.bonePtr,
+                "groups": header.groupPtr,
+                "vertices": header.vertexPtr,
+                "faces": header.polygonPtr,
+                "texture": header.texturePtr,
+            },
+        })
+    file.close()
+    return infos
+
 class WEP:
     def __init__(self):
         self.name = ".WEP"
@@ -100,10 +157,13 @@ class WEP:
         return("(--"+repr(self.name)+".WEP-- | "+repr(self.header)+")")
     def loadFromFile(self, filepath):
         # Open a WEP file and parse it
+        self.name = VS.displayName(filepath)
+        if Cache.restore(self, filepath):
+            return
         file = open(filepath, "rb")
-        self.name = bpy.path.display_name(filepath)
         self.parse(file)
         file.close()
+        Cache.store(self, filepath)
     def parse(self, file):
         signature = file.read(4)
         if signature != VS.SIG:
@@ -167,7 +227,7 @@ class WEP:
             u1, u2, u3, u4 = struct.unpack("<4h", file.read(8))
             #print("rots : "+" u1 : "+repr(u1)+" - u2 : "+repr(u2)+" - u3 : "+repr(u3)+" - u4 : "+repr(u4))
             self.rotations.append([u1, u2, u3, u4])
-    def buildGeometry(self, material_index = 0):
+    def buildGeometry(self, material_index = 0, bool_palette_shader = False):
         #print("WEP Building...")
 
         # Creating Geometry and Mesh for Blender
@@ -193,13 +253,15 @@ class WEP:
             palcol.color = (col.R/255, col.G/255, col.B/255)
 
         vs_weapon_materials = ["Wood", "Leather", "Bronze", "Iron", "Hagane", "Silver", "Damascus"]
+        paletteMaterial = None
+        if bool_palette_shader == True and len(self.tim.cluts) > 0:
+            paletteMaterial = self.buildPaletteMaterial(blender_mesh)
+        indices = None
+        if paletteMaterial is None and Textures.settings.enabled == True and len(self.tim.cluts) > 0:
+            # the 7 materials share the same indexes with their own palette
+            indices = Textures.weaponIndices(self.tim)
+            palettes = Textures.palettes(self.tim.palletColors)
         for i in range(0, len(self.tim.textures)):
-            mat = bpy.data.materials.new(name=str(self.name + "_"+vs_weapon_materials[i]+"_Mat"))
-            # we add the palette reference in a custom property of the material
-            mat.palette.ref = str(self.name + ".WEP_"+vs_weapon_materials[i]+"_Palette")
-            mat.use_nodes = True
-            mat.blend_method = "CLIP"  # to handle alpha cutout
-
             # we save the palettes
             palette = bpy.data.palettes.new(name=str(self.name + ".WEP_"+vs_weapon_materials[i]+"_Palette"))
             # we skip handle colors thats why we start at 16
@@ -207,14 +269,23 @@ class WEP:
                 col = self.tim.palletColors[i][j]
                 palcol = palette.colors.new()
                 palcol.color = (col.R/255, col.G/255, col.B/255)
+            if paletteMaterial is not None:
+                # the palette material replaces the 7 materials
+                continue
+
+            mat = bpy.data.materials.new(name=str(self.name + "_"+vs_weapon_materials[i]+"_Mat"))
+            # we add the palette reference in a custom property of the material
+            mat.palette.ref = str(self.name + ".WEP_"+vs_weapon_materials[i]+"_Palette")
+            mat.use_nodes = True
+            mat.blend_method = "CLIP"  # to handle alpha cutout
 
             # maybe i should consider using a simpler material... VS doesn't need a PBR Material :D
             bsdf = mat.node_tree.nodes["Principled BSDF"]
             bsdf.inputs["Specular"].default_value = 0
             bsdf.inputs["Metallic"].default_value = 0
             texImage = mat.node_tree.nodes.new("ShaderNodeTexImage")
-            texImage.image = bpy.data.images.new(str(self.name + "_"+vs_weapon_materials[i]+"_Tex"), self.tim.textureWidth, self.tim.textureHeigth)
-            texImage.image.pixels = self.tim.textures[i]
+            texImage.image = Textures.newImage(str(self.name + "_"+vs_weapon_materials[i]+"_Tex"), self.tim.textureWidth, self.tim.textureHeigth,
+                self.tim.textures[i], indices, palettes[i] if indices is not None else None)
             texImage.interpolation = "Closest"  # texture filter
             # we use the first texture for the material by default
             mat.node_tree.links.new(bsdf.inputs["Base Color"], texImage.outputs["Color"])
@@ -226,7 +297,8 @@ class WEP:
         uvlayer = blender_mesh.uv_layers.new()
         face_uvs = self.getUVsForBlender()
         for face in blender_mesh.polygons:
-            face.material_index = material_index  # XD cherry on the cake
+            if paletteMaterial is None:
+                face.material_index = material_index  # XD cherry on the cake
             # loop_idx increment for each vertex of each face so if there is 9 triangle -> 9*3 = 27 loop_idx, even if some vertex are common between faces
             for vert_idx, loop_idx in zip(face.vertices, face.loop_indices):
                 # uvs needs to be scaled from texture W&H
@@ -237,6 +309,10 @@ class WEP:
 
         # Creating Blender object and link into the current collection
         blender_obj = bpy.data.objects.new(str(self.name), object_data=blender_mesh)
+        if paletteMaterial is not None:
+            # the palette row read by the material
+            blender_obj["variant"] = material_index
+            blender_obj.id_properties_ui("variant").update(min=0, max=len(self.tim.palletColors) - 1, description=", ".join(vs_weapon_materials))
         view_layer = bpy.context.view_layer
         view_layer.active_layer_collection.collection.objects.link(blender_obj)
         blender_obj.select_set(True)
@@ -255,6 +331,27 @@ class WEP:
 
         return blender_obj
 
+    def buildPaletteMaterial(self, blender_mesh):
+        # one material for the 7 palettes, the index image is uploaded once with a 48 x 7 palette strip
+        mat = bpy.data.materials.new(name=str(self.name + "_Palette_Mat"))
+        mat.use_nodes = True
+        mat.blend_method = "CLIP"  # to handle alpha cutout
+        bsdf = mat.node_tree.nodes["Principled BSDF"]
+        bsdf.inputs["Specular"].default_value = 0
+        bsdf.inputs["Metallic"].default_value = 0
+        variant = mat.node_tree.nodes.new("ShaderNodeAttribute")
+        variant.attribute_type = "OBJECT"
+        variant.attribute_name = '["variant"]'
+        palettes = Textures.palettes(self.tim.palletColors)
+        indexImage = Shaders.indexImage(str(self.name + "_Index_Tex"), Textures.weaponIndices(self.tim))
+        paletteImage = Shaders.paletteImage(str(self.name + "_Palette_Tex"), palettes)
+        paletteTex = Shaders.paletteNodes(mat, indexImage, paletteImage, palettes.shape[1], palettes.shape[0], variant.outputs["Fac"])
+        mat.node_tree.links.new(bsdf.inputs["Base Color"], paletteTex.outputs["Color"])
+        # to handle alpha cutout
+        mat.node_tree.links.new(bsdf.inputs["Alpha"], paletteTex.outputs["Alpha"])
+        blender_mesh.materials.append(mat)
+        return mat
+
     def fromBlenderMesh(self, blender_mesh):
         verts = blender_mesh.vertices[:]
         facets = [f for f in blender_mesh.polygons]
@@ -9,32 +9,39 @@ bl_info = {
 }
 
 
+import os
 import struct
 import math
 
-import bpy
-from bpy.props import BoolProperty, EnumProperty, FloatProperty, StringProperty
-from bpy_extras.io_utils import ExportHelper, ImportHelper
+try:
+    import bpy
+    from bpy.props import BoolProperty, EnumProperty, FloatProperty, StringProperty
+    from bpy_extras.io_utils import ExportHelper, ImportHelper
+except ImportError:
+    # parsing doesn't need Blender
+    bpy = None
 
 
-from . import TIM
+from . import TIM, VS, Cache
 
 
-class ImportZND(bpy.types.Operator, ImportHelper):
-    """Load a ZND file"""
+if bpy is not None:
+    class ImportZND(bpy.types.Operator, ImportHelper):
+        """Load a ZND file"""
 
-    bl_idname = "import_zone_datas.znd"
-    bl_label = "Import ZND"
-    filename_ext = ".ZND"
+        bl_idname = "import_zone_datas.znd"
+        bl_label = "Import ZND"
+        filename_ext = ".ZND"
 
-    filepath: bpy.props.StringProperty(default="", subtype="FILE_PATH")
-    filter_glob: bpy.props.StringProperty(default="*.ZND", options={"HIDDEN"})
+        filepath: bpy.props.StringProperty(default="", subtype="FILE_PATH")
+        filter_glob: bpy.props.StringProperty(default="*.ZND", options={"HIDDEN"})
 
-    def execute(self, context):
-        keywords = self.as_keywords(ignore=("axis_forward","axis_up","filter_glob",))
-        BlenderImport(self, context, **keywords)
+        def execute(self, context):
+            keywords = self.as_keywords(ignore=("axis_forward","axis_up","filter_glob",))
+            BlenderImport(self, context, **keywords)
+
+            return {"FINISHED"}
 
-        return {"FINISHED"}
 
 def BlenderImport(operator, context, filepath):
     znd = ZND()
@@ -43,6 +50,33 @@ def BlenderImport(operator, context, filepath):
 
 
 
+def load(filepath):
+    znd = ZND()
+    znd.loadFromFile(filepath)
+    return znd
+
+def probe(filepath):
+    # header and TIM headers only, textures are not decoded
+    infos = {"format": "ZND", "name": VS.displayName(filepath), "filesize": os.stat(filepath).st_size}
+    file = open(filepath, "rb")
+    header = ZNDHeader()
+    header.feed(file)
+    infos["sections"] = {"MPD": header.lenMPD, "enemies": header.lenEnemies, "TIM": header.lenTIM}
+    infos["offsets"] = {"MPD": header.ptrMPD, "enemies": header.ptrEnemies, "TIM": header.ptrTIM}
+    infos["numMPD"] = int(header.lenMPD / 8) # ptr and len of each MPD
+    infos["WAVEindex"] = header.WAVEindex
+    file.seek(header.ptrTIM)
+    timSectionLen, uk1, uk2, uk3, numTims = struct.unpack("5I", file.read(20))
+    infos["tims"] = []
+    for i in range(0, numTims):
+        tlen = struct.unpack("I", file.read(4))[0]
+        timptr = file.tell()
+        h, bpp, imgLen, fx, fy, width, height = struct.unpack("3I4H", file.read(20))
+        infos["tims"].append({"x": fx, "y": fy, "width": width, "height": height})
+        file.seek(timptr+tlen)
+    file.close()
+    return infos
+
 class ZND:
     def __init__(self):
         self.name = "ZND"
@@ -50,10 +84,13 @@ class ZND:
         self.tims = []
     def loadFromFile(self, filepath):
         # Open a ZND file and parse it
+        self.name = VS.displayName(filepath)
+        if Cache.restore(self, filepath):
+            return
         file = open(filepath, "rb")
-        self.name = bpy.path.display_name(filepath)
         self.parse(file)
         file.close()
+        Cache.store(self, filepath)
     def parse(self, file):
         #print("parsing ZND...")
 
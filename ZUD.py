@@ -8,44 +8,100 @@ bl_info = {
     "category": "Import-Export",
 }
 
+import io
+import os
 import struct
 import math
 
-import bpy
-from bpy.props import BoolProperty, EnumProperty, FloatProperty, StringProperty
-from bpy_extras.io_utils import ExportHelper, ImportHelper
+try:
+    import bpy
+    from bpy.props import BoolProperty, EnumProperty, FloatProperty, StringProperty
+    from bpy_extras.io_utils import ExportHelper, ImportHelper
+except ImportError:
+    # parsing doesn't need Blender
+    bpy = None
 
-from . import WEP, SHP, SEQ
+from . import VS, WEP, SHP, SEQ, Cache
 
 
-class Import(bpy.types.Operator, ImportHelper):
-    """Load a ZUD file"""
+if bpy is not None:
+    class Import(bpy.types.Operator, ImportHelper):
+        """Load a ZUD file"""
 
-    bl_idname = "import_mesh.zud"
-    bl_label = "Import ZUD"
-    filename_ext = ".ZUD"
+        bl_idname = "import_mesh.zud"
+        bl_label = "Import ZUD"
+        filename_ext = ".ZUD"
 
-    filepath: bpy.props.StringProperty(default="", subtype="FILE_PATH")
-    filter_glob: bpy.props.StringProperty(default="*.ZUD", options={"HIDDEN"})
+        filepath: bpy.props.StringProperty(default="", subtype="FILE_PATH")
+        filter_glob: bpy.props.StringProperty(default="*.ZUD", options={"HIDDEN"})
+        float_anim_tolerance: bpy.props.FloatProperty(
+            name="Keyframes Tolerance",
+            description="Remove rotation keyframes that can be interpolated with an error below this value (0 keeps every keyframe)",
+            default=0.0,
+            min=0.0,
+            max=0.1,
+            precision=4,
+            step=0.01
+        )
+        bool_all_anims: bpy.props.BoolProperty(
+            name="Build All Animations",
+            description="Build every animation into actions now, otherwise only the selected animation is built when needed",
+            default=False
+        )
 
-    def execute(self, context):
-        keywords = self.as_keywords(ignore=("axis_forward","axis_up","filter_glob",))
-        BlenderImport(self, context, **keywords)
+        def execute(self, context):
+            keywords = self.as_keywords(ignore=("axis_forward","axis_up","filter_glob",))
+            BlenderImport(self, context, **keywords)
 
-        return {"FINISHED"}
+            return {"FINISHED"}
 
 
-def BlenderImport(operator, context, filepath):
+def BlenderImport(operator, context, filepath, float_anim_tolerance = 0.0, bool_all_anims = False):
     zud = ZUD()
     # we read datas from a file
     zud.loadFromFile(filepath)
 
     # Creating Geometry and Meshes for Blender
-    zud.buildGeometry()
+    zud.buildGeometry(float_anim_tolerance, bool_all_anims)
+
+def load(filepath):
+    zud = ZUD()
+    zud.loadFromFile(filepath)
+    return zud
+
+def probe(filepath):
+    # header and SEQ headers only, embedded models are not decoded
+    infos = {"format": "ZUD", "name": VS.displayName(filepath), "filesize": os.stat(filepath).st_size}
+    file = open(filepath, "rb")
+    header = ZUDHeader()
+    header.feed(file)
+    infos.update({
+        "idSHP": header.idSHP,
+        "idWEP": header.idWEP,
+        "idWEPType": header.idWEPType,
+        "idWEPMat": header.idWEPMat,
+        "idWEP2": header.idWEP2,
+        "idWEP2Mat": header.idWEP2Mat,
+        "sections": {},
+        "offsets": {},
+    })
+    for name, ext in SECTIONS:
+        infos["sections"][name] = getattr(header, "len"+name)
+        infos["offsets"][name] = getattr(header, "ptr"+name)
+    for name, key in [("CSEQ", "numCommonAnimations"), ("BSEQ", "numBattleAnimations")]:
+        infos[key] = 0
+        if getattr(header, "len"+name) > 0:
+            file.seek(getattr(header, "ptr"+name))
+            seqHeader = SEQ.SEQHeader()
+            seqHeader.feed(file)
+            infos[key] = seqHeader.numAnimations
+    file.close()
+    return infos
 
 class ZUD:
     def __init__(self):
         self.name = "ZUD"
+        self.filepath = ""
         self.header = ZUDHeader()
         self.shp = None
         self.weapon = None
@@ -56,10 +112,15 @@ class ZUD:
         return("(--"+repr(self.name)+".ZUD-- | "+repr(self.header)+")")
     def loadFromFile(self, filepath):
         # Open a ZUD file and parse it
+        self.name = VS.displayName(filepath)
+        if Cache.restore(self, filepath):
+            self.filepath = filepath
+            return
         file = open(filepath, "rb")
-        self.name = bpy.path.display_name(filepath)
+        self.filepath = filepath
         self.parse(file)
         file.close()
+        Cache.store(self, filepath)
     def parse(self, file):
         self.header.feed(file)
         #print(self)
@@ -98,7 +159,7 @@ class ZUD:
             self.battleSeq.name = self.name+"_BAT"
             self.battleSeq.parse(file)
 
-    def buildGeometry(self):
+    def buildGeometry(self, tolerance = 0.0, bool_all_anims = False):
         #print("ZUD Building...")
 
         shpObj = self.shp.buildGeometry()
@@ -121,20 +182,108 @@ class ZUD:
             bpy.ops.constraint.childof_clear_inverse(constraint=chiof.name, owner="OBJECT")
             shieldObj.rotation_euler = (90, 0, 0)
 
+        # SEQ are only referenced, actions are built when needed
         if self.header.lenCSEQ > 0:
-            self.commonSeq.buildAnimations(shpObj)
+            SEQ.attach(shpObj.parent, self.commonSeq, self.filepath, self.header.ptrCSEQ, False, tolerance)
         if self.header.lenBSEQ > 0:
-            self.battleSeq.buildAnimations(shpObj)
+            SEQ.attach(shpObj.parent, self.battleSeq, self.filepath, self.header.ptrBSEQ, False, tolerance)
+        if bool_all_anims == True:
+            SEQ.buildAllAnimations(shpObj.parent)
 
         # selecting armature
         shpObj.parent.name = self.name
         shpObj.parent.select_set(True)
         bpy.context.view_layer.objects.active = shpObj.parent
 
-        if self.header.lenCSEQ > 0:
-            shpObj.parent.animation_data.action = bpy.data.actions[self.commonSeq.name + "_Animation_0"]
-        if self.header.lenBSEQ > 0:
-            shpObj.parent.animation_data.action = bpy.data.actions[self.battleSeq.name + "_Animation_0"]
+        if self.header.lenBSEQ > 0 and len(self.battleSeq.animations) > 0:
+            shpObj.parent.animations.active = self.battleSeq.name + "_Animation_0"
+        elif self.header.lenCSEQ > 0 and len(self.commonSeq.animations) > 0:
+            shpObj.parent.animations.active = self.commonSeq.name + "_Animation_0"
+
+# sections of a ZUD in the header table order, with the extension of the standalone file
+SECTIONS = [("SHP", ".SHP"), ("WEP", ".WEP"), ("WEP2", ".WEP"), ("CSEQ", ".SEQ"), ("BSEQ", ".SEQ")]
+
+class ZUDContainer:
+    # ZUD as raw sections, nothing is decoded, sections are memoryview slices of the file datas
+    # usage :
+    #   zud = ZUD.ZUDContainer()
+    #   zud.loadFromFile("Z001.ZUD")
+    #   zud.extractAll("out/")
+    #   zud.saveToFile("Z001_MOD.ZUD", {"WEP": open("0A.WEP", "rb").read()})
+    def __init__(self):
+        self.name = "ZUD"
+        self.header = ZUDHeader()
+        self.datas = None
+    def __repr__(self):
+        return("(--"+repr(self.name)+".ZUD container-- | "+repr(self.header)+")")
+    def loadFromFile(self, filepath):
+        file = open(filepath, "rb")
+        self.name = VS.displayName(filepath)
+        self.datas = file.read()
+        file.close()
+        self.header.feed(io.BytesIO(self.datas[0:48]))
+    def section(self, name):
+        ptr = getattr(self.header, "ptr"+name)
+        length = getattr(self.header, "len"+name)
+        return memoryview(self.datas)[ptr:ptr + length]
+    def extract(self, name, filepath):
+        file = open(filepath, "wb")
+        file.write(self.section(name))
+        file.close()
+    def extractAll(self, directory):
+        # standalone files are named like the game files, ids for models and the ZUD name for SEQ
+        filepaths = []
+        for name, ext in SECTIONS:
+            if getattr(self.header, "len"+name) == 0:
+                continue
+            if name == "SHP":
+                filename = "{:02X}".format(self.header.idSHP)+ext
+            elif name == "WEP":
+                filename = "{:02X}".format(self.header.idWEP)+ext
+            elif name == "WEP2":
+                filename = "{:02X}".format(self.header.idWEP2)+ext
+            elif name == "CSEQ":
+                filename = self.name+"_COM"+ext
+            else:
+                filename = self.name+"_BAT"+ext
+            filepath = os.path.join(directory, filename)
+            self.extract(name, filepath)
+            filepaths.append(filepath)
+        return filepaths
+    def tobin(self, replacements = {}):
+        # replacements : section blobs by name, sections keep their order in the file and pointers are computed again
+        header = ZUDHeader()
+        header.__dict__.update(self.header.__dict__)
+        order = sorted(SECTIONS, key=lambda section: getattr(self.header, "ptr"+section[0]))
+        end = max([getattr(self.header, "ptr"+name) + getattr(self.header, "len"+name) for name, ext in SECTIONS])
+        blobs = []
+        previousEnd = 48 # end of the previous section in the original file
+        ptr = 48
+        for name, ext in order:
+            if getattr(self.header, "len"+name) == 0 and name not in replacements:
+                continue # empty section, we keep its pointer as is
+            blob = replacements.get(name, self.section(name))
+            # we keep the padding between sections and their word alignment
+            original = getattr(self.header, "ptr"+name)
+            ptr += max(0, original - previousEnd)
+            if original % 4 == 0:
+                ptr += (4 - ptr % 4) % 4
+            previousEnd = original + getattr(self.header, "len"+name)
+            setattr(header, "ptr"+name, ptr)
+            setattr(header, "len"+name, len(blob))
+            blobs.append((ptr, blob))
+            ptr += len(blob)
+        bin = bytearray(ptr)
+        bin[0:48] = header.tobin()
+        for ptr, blob in blobs:
+            bin[ptr:ptr + len(blob)] = blob
+        # we keep what could follow the last section
+        bin += self.datas[end:]
+        return bin
+    def saveToFile(self, filepath, replacements = {}):
+        file = open(filepath, "wb")
+        file.write(self.tobin(replacements))
+        file.close()
 
 class ZUDHeader:
     def __init__(self):
@@ -165,3 +314,8 @@ class ZUDHeader:
     def feed(self, file):
         self.idSHP,self.idWEP,self.idWEPType,self.idWEPMat,self.idWEP2,self.idWEP2Mat,self.uk,self.pad = struct.unpack("8B", file.read(8))
         self.ptrSHP,self.lenSHP,self.ptrWEP,self.lenWEP,self.ptrWEP2,self.lenWEP2,self.ptrCSEQ,self.lenCSEQ,self.ptrBSEQ,self.lenBSEQ = struct.unpack("10I", file.read(40))
+    def tobin(self):
+        bin = bytes()
+        bin += struct.pack("8B", self.idSHP,self.idWEP,self.idWEPType,self.idWEPMat,self.idWEP2,self.idWEP2Mat,self.uk,self.pad)
+        bin += struct.pack("10I", self.ptrSHP,self.lenSHP,self.ptrWEP,self.lenWEP,self.ptrWEP2,self.lenWEP2,self.ptrCSEQ,self.lenCSEQ,self.ptrBSEQ,self.lenBSEQ)
+        return bin
@@ -8,79 +8,222 @@ bl_info = {
     "category": "Import-Export",
 }
 
-import bpy
-from . import WEP, SHP, SEQ, MPD, ZND, ZUD, TIM, ARM, EFFECT, color
-
-# https://docs.blender.org/api/current/bpy.props.html
-
-class MaterialPalette(bpy.types.PropertyGroup):
-    bl_idname = "material.palette"
-    bl_label = "Palette"
-    ref: bpy.props.StringProperty(name="palette")
-    #color: bpy.props.FloatVectorProperty(name="color")
-
-class BoneDatas(bpy.types.PropertyGroup):
-    # we store additionnal "unused" datas to rebuild imported formats
-    bl_idname = "bone.datas"
-    bl_label = "VS Datas"
-    mountId: bpy.props.IntProperty(name="groupId")
-    bodyPartId: bpy.props.IntProperty(name="bodyPartId")
-    mode: bpy.props.IntProperty(name="mode")
-    unk: bpy.props.IntVectorProperty(name="unk")
-
-class MeshDatas(bpy.types.PropertyGroup):
-    # we store additionnal "unused" datas to rebuild imported formats
-    bl_idname = "mesh.datas"
-    bl_label = "VS Datas"
-    # we use bpy.types.Mesh.polygon_layers_int instead of custom props
-    #faces_sides: bpy.props.IntVectorProperty(name="faces_sides")
-    #faces_flags: bpy.props.IntVectorProperty(name="faces_flags")
-    rots0: bpy.props.IntVectorProperty(name="rots0")
-    rots1: bpy.props.IntVectorProperty(name="rots1")
-    rots2: bpy.props.IntVectorProperty(name="rots2")
-
-
-classes = (
-    WEP.Import,
-    WEP.Export,
-    SHP.Import,
-    SEQ.Import,
-    ZUD.Import,
-    MPD.Import,
-    #ZND.Import,
-    EFFECT.Import,
-    ARM.Import,
-    MaterialPalette,
-    BoneDatas,
-    MeshDatas
-)
-
-def register():
-    for c in classes:
-        bpy.utils.register_class(c)
-    bpy.types.TOPBAR_MT_file_export.append(menu_func_export)
-    bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
-
-    bpy.types.Material.palette = bpy.props.PointerProperty(type=MaterialPalette)
-    bpy.types.EditBone.datas = bpy.props.PointerProperty(type=BoneDatas)
-    bpy.types.Mesh.datas = bpy.props.PointerProperty(type=MeshDatas)
-
-
-def unregister():
-    for c in reversed(classes):
-        bpy.utils.unregister_class(c)
-    bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
-    bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
-
-def menu_func_import(self, context):
-    self.layout.operator(WEP.Import.bl_idname, text="Vagrant Story Weapon (.WEP)")
-    self.layout.operator(SHP.Import.bl_idname, text="Vagrant Story Character Shape (.SHP)")
-    self.layout.operator(SEQ.Import.bl_idname, text="Vagrant Story Animations Sequence (.SEQ)")
-    self.layout.operator(ZUD.Import.bl_idname, text="Vagrant Story Zone Unit Datas (.ZUD)")
-    self.layout.operator(MPD.Import.bl_idname, text="Vagrant Story Map Datas (.MPD)")
-    #self.layout.operator(ZND.Import.bl_idname,text="Vagrant Story Zone Datas(.ZND)")
-    self.layout.operator(EFFECT.Import.bl_idname, text="Vagrant Story Effect (.P)")
-    self.layout.operator(ARM.Import.bl_idname, text="Vagrant Story Maps (.ARM)")
-
-def menu_func_export(self, context):
-    self.layout.operator(WEP.Export.bl_idname, text="Vagrant Story Weapon (.WEP)")
+try:
+    import bpy
+except ImportError:
+    # outside of Blender only the parsers can be used (headless tools like Skinning)
+    bpy = None
+
+if bpy is not None:
+    from . import WEP, SHP, SEQ, MPD, ZND, ZUD, TIM, ARM, EFFECT, Index, Cache, Intermediate, Textures, color
+
+    # https://docs.blender.org/api/current/bpy.props.html
+
+    class MaterialPalette(bpy.types.PropertyGroup):
+        bl_idname = "material.palette"
+        bl_label = "Palette"
+        ref: bpy.props.StringProperty(name="palette")
+        #color: bpy.props.FloatVectorProperty(name="color")
+
+    class BoneDatas(bpy.types.PropertyGroup):
+        # we store additionnal "unused" datas to rebuild imported formats
+        bl_idname = "bone.datas"
+        bl_label = "VS Datas"
+        mountId: bpy.props.IntProperty(name="groupId")
+        bodyPartId: bpy.props.IntProperty(name="bodyPartId")
+        mode: bpy.props.IntProperty(name="mode")
+        unk: bpy.props.IntVectorProperty(name="unk")
+
+    class MeshDatas(bpy.types.PropertyGroup):
+        # we store additionnal "unused" datas to rebuild imported formats
+        bl_idname = "mesh.datas"
+        bl_label = "VS Datas"
+        # we use bpy.types.Mesh.polygon_layers_int instead of custom props
+        #faces_sides: bpy.props.IntVectorProperty(name="faces_sides")
+        #faces_flags: bpy.props.IntVectorProperty(name="faces_flags")
+        rots0: bpy.props.IntVectorProperty(name="rots0")
+        rots1: bpy.props.IntVectorProperty(name="rots1")
+        rots2: bpy.props.IntVectorProperty(name="rots2")
+
+    class SEQReference(bpy.types.PropertyGroup):
+        # a SEQ file (or a SEQ embedded in a ZUD at offset) we can build actions from
+        bl_idname = "seq.reference"
+        bl_label = "SEQ Reference"
+        name: bpy.props.StringProperty(name="name")
+        filepath: bpy.props.StringProperty(name="filepath", subtype="FILE_PATH")
+        offset: bpy.props.IntProperty(name="offset")
+        numAnimations: bpy.props.IntProperty(name="numAnimations")
+
+    class AnimationDatas(bpy.types.PropertyGroup):
+        # armatures keep SEQ references, only the selected animation is built into an action
+        bl_idname = "object.animations"
+        bl_label = "VS Animations"
+        seqs: bpy.props.CollectionProperty(type=SEQReference)
+        translation: bpy.props.BoolProperty(name="translation")
+        tolerance: bpy.props.FloatProperty(name="tolerance")
+        active: bpy.props.EnumProperty(name="Animation", items=SEQ.animationItems, update=SEQ.animationUpdate)
+
+    def updateCache(self, context):
+        Cache.settings.enabled = self.bool_parse_cache
+        Cache.settings.directory = bpy.path.abspath(self.parse_cache_directory)
+        Cache.settings.maxSize = self.int_parse_cache_size * 1024 * 1024
+        Cache.settings.sessionSize = self.int_session_cache_size * 1024 * 1024
+        if Cache.settings.sessionSize <= 0:
+            Cache.clearSession()
+        Textures.settings.enabled = self.bool_texture_cache
+        Textures.settings.directory = bpy.path.abspath(self.texture_cache_directory)
+
+    class ClearParseCache(bpy.types.Operator):
+        """Remove every parsed file from the cache"""
+
+        bl_idname = "preferences.vs_clear_parse_cache"
+        bl_label = "Clear Parse Cache"
+
+        def execute(self, context):
+            Cache.clear()
+
+            return {"FINISHED"}
+
+    class ClearSessionCache(bpy.types.Operator):
+        """Forget every parsed file kept in memory"""
+
+        bl_idname = "preferences.vs_clear_session_cache"
+        bl_label = "Clear Session Cache"
+
+        def execute(self, context):
+            Cache.clearSession()
+            SEQ.clearLoaded()
+
+            return {"FINISHED"}
+
+    class Preferences(bpy.types.AddonPreferences):
+        bl_idname = __name__
+
+        bool_parse_cache: bpy.props.BoolProperty(
+            name="Parse Cache",
+            description="Keep WEP, SHP and MPD files converted to arrays on disk, importing the same file again doesn't parse it",
+            default=False,
+            update=updateCache
+        )
+        parse_cache_directory: bpy.props.StringProperty(
+            name="Cache Directory",
+            subtype="DIR_PATH",
+            default=Cache.settings.directory,
+            update=updateCache
+        )
+        int_parse_cache_size: bpy.props.IntProperty(
+            name="Cache Size (MB)",
+            description="Least recently used files are removed from the cache above this size",
+            default=512,
+            min=16,
+            update=updateCache
+        )
+
+        int_session_cache_size: bpy.props.IntProperty(
+            name="Session Cache Size (MB)",
+            description="Parsed files kept in memory for the next imports of this session, 0 disables it",
+            default=256,
+            min=0,
+            update=updateCache
+        )
+
+        bool_texture_cache: bpy.props.BoolProperty(
+            name="Texture Cache",
+            description="Save decoded textures as PNG files and load them, instead of generated images that must be packed in .blend files",
+            default=False,
+            update=updateCache
+        )
+        texture_cache_directory: bpy.props.StringProperty(
+            name="Texture Directory",
+            description="Saved .blend files link to these PNG files, keep it somewhere stable",
+            subtype="DIR_PATH",
+            default=Textures.settings.directory,
+            update=updateCache
+        )
+
+        def draw(self, context):
+            layout = self.layout
+            layout.prop(self, "int_session_cache_size")
+            row = layout.row()
+            row.label(text="Session : {:.1f} MB in {} files".format(Cache.sessionBytes / (1024 * 1024), len(Cache.session)))
+            row.operator(ClearSessionCache.bl_idname)
+            layout.prop(self, "bool_parse_cache")
+            col = layout.column()
+            col.enabled = self.bool_parse_cache
+            col.prop(self, "parse_cache_directory")
+            col.prop(self, "int_parse_cache_size")
+            row = col.row()
+            row.label(text="Used : {:.1f} MB".format(Cache.size() / (1024 * 1024)))
+            row.operator(ClearParseCache.bl_idname)
+            layout.prop(self, "bool_texture_cache")
+            col = layout.column()
+            col.enabled = self.bool_texture_cache
+            col.prop(self, "texture_cache_directory")
+
+
+    classes = (
+        WEP.Import,
+        WEP.Export,
+        SHP.Import,
+        SEQ.Import,
+        SEQ.BuildAnimations,
+        SEQ.AnimationsPanel,
+        ZUD.Import,
+        MPD.Import,
+        #ZND.Import,
+        EFFECT.Import,
+        EFFECT.ImportDirectory,
+        ARM.Import,
+        Intermediate.Import,
+        Index.BuildIndex,
+        MaterialPalette,
+        BoneDatas,
+        MeshDatas,
+        SEQReference,
+        AnimationDatas,
+        ClearParseCache,
+        ClearSessionCache,
+        Preferences
+    )
+
+    def register():
+        for c in classes:
+            bpy.utils.register_class(c)
+        bpy.types.TOPBAR_MT_file_export.append(menu_func_export)
+        bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
+
+        bpy.types.Material.palette = bpy.props.PointerProperty(type=MaterialPalette)
+        bpy.types.EditBone.datas = bpy.props.PointerProperty(type=BoneDatas)
+        bpy.types.Mesh.datas = bpy.props.PointerProperty(type=MeshDatas)
+        bpy.types.Object.animations = bpy.props.PointerProperty(type=AnimationDatas)
+
+        addon = bpy.context.preferences.addons.get(__name__)
+        if addon is not None and addon.preferences is not None:
+            updateCache(addon.preferences, bpy.context)
+        else:
+            # registered without a preferences entry (addon_utils.enable without default_set, reloads), we keep the defaults
+            Cache.settings = Cache.Settings()
+            Textures.settings = Textures.Settings()
+
+
+    def unregister():
+        for c in reversed(classes):
+            bpy.utils.unregister_class(c)
+        bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
+        bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
+
+    def menu_func_import(self, context):
+        self.layout.operator(WEP.Import.bl_idname, text="Vagrant Story Weapon (.WEP)")
+        self.layout.operator(SHP.Import.bl_idname, text="Vagrant Story Character Shape (.SHP)")
+        self.layout.operator(SEQ.Import.bl_idname, text="Vagrant Story Animations Sequence (.SEQ)")
+        self.layout.operator(ZUD.Import.bl_idname, text="Vagrant Story Zone Unit Datas (.ZUD)")
+        self.layout.operator(MPD.Import.bl_idname, text="Vagrant Story Map Datas (.MPD)")
+        #self.layout.operator(ZND.Import.bl_idname,text="Vagrant Story Zone Datas(.ZND)")
+        self.layout.operator(EFFECT.Import.bl_idname, text="Vagrant Story Effect (.P)")
+        self.layout.operator(EFFECT.ImportDirectory.bl_idname, text="Vagrant Story Effects Directory (.P)")
+        self.layout.operator(ARM.Import.bl_idname, text="Vagrant Story Maps (.ARM)")
+        self.layout.operator(Intermediate.Import.bl_idname, text="Vagrant Story Converted Asset (.npz)")
+        self.layout.operator(Index.BuildIndex.bl_idname, text="Vagrant Story Index Directory ("+Index.INDEX_NAME+")")
+
+    def menu_func_export(self, context):
+        self.layout.operator(WEP.Export.bl_idname, text="Vagrant Story Weapon (.WEP)")
@@ -8,9 +8,6 @@ bl_info = {
     "category": "Import-Export",
 }
 
-import bpy
-from bpy.props import FloatVectorProperty, FloatProperty
-
 def RGB(rgb):
     c = Color()
     c.setRGB(rgb)